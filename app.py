@@ -37,6 +37,10 @@ def start_channel(channel_name: str):
             threading.Thread(target=linkai_client.start, args=(channel,)).start()
         except Exception as e:
             pass
+
+    if conf().get("worker_processes", 1) > 1:
+        from channel.worker_pool import attach_worker_pool
+        attach_worker_pool(channel, channel_name)
     channel.startup()
 
 
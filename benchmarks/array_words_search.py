@@ -0,0 +1,59 @@
+"""
+与WordsSearch对比：不同词库大小和文本长度下的构建、加载和查找耗时，并校验结果一致
+运行: python -m benchmarks.array_words_search
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+# banwords插件目录不能作为包导入，直接从lib目录导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plugins", "banwords", "lib"))
+from ArrayWordsSearch import ArrayWordsSearch  # noqa: E402
+from WordsSearch import WordsSearch  # noqa: E402
+
+
+def main():
+    random.seed(0)
+    common_chars = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+
+    def random_text(length):
+        return "".join(random.choice(common_chars) for _ in range(length))
+
+    def timeit(fn, texts):
+        start = time.perf_counter()
+        result = [fn(text) for text in texts]
+        return result, (time.perf_counter() - start) / len(texts) * 1000
+
+    cache_path = os.path.join(tempfile.mkdtemp(), "banwords.cache")
+    for size in [1000, 10000, 50000]:
+        words = list({random_text(random.randint(2, 4)) for _ in range(size)})
+        start = time.perf_counter()
+        legacy = WordsSearch()
+        legacy.SetKeywords(words)
+        legacy_build = time.perf_counter() - start
+        start = time.perf_counter()
+        search = ArrayWordsSearch.from_keywords(words, cache_path)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        search = ArrayWordsSearch.from_keywords(words, cache_path)
+        load = time.perf_counter() - start
+        print("{} words: build legacy={:.2f}s array={:.2f}s, load from cache={:.2f}s".format(len(words), legacy_build, build, load))
+        for length in [100, 2000, 20000]:
+            texts = [random_text(length) for _ in range(max(5, 100000 // length))]
+            for method in ["ContainsAny", "Replace"]:
+                expected, legacy_cost = timeit(getattr(legacy, method), texts)
+                actual, cost = timeit(getattr(search, method), texts)
+                assert actual == expected
+                print("  text {:>5} chars {:<11}: legacy={:.3f}ms array={:.3f}ms".format(length, method, legacy_cost, cost))
+            expected, legacy_cost = timeit(legacy.FindAll, texts)
+            start = time.perf_counter()
+            actual = search.FindAllBatch(texts)
+            cost = (time.perf_counter() - start) / len(texts) * 1000
+            assert actual == expected
+            print("  text {:>5} chars {:<11}: legacy={:.3f}ms array={:.3f}ms".format(length, "FindAllBatch", legacy_cost, cost))
+
+
+if __name__ == "__main__":
+    main()
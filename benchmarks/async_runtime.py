@@ -0,0 +1,98 @@
+"""
+本地模拟edge-tts的websocket服务，对比每次asyncio.run()新建事件循环和提交到共享事件循环时每句语音合成的耗时
+运行: python -m benchmarks.async_runtime
+"""
+import asyncio
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import edge_tts
+import edge_tts.communicate
+from aiohttp import web
+
+from common.async_runtime import AsyncRuntime
+from common.metrics import LatencyStats
+
+AUDIO = os.urandom(24 * 1024)  # 约3秒的mp3
+
+
+async def handler(request):
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    async for msg in ws:
+        if "Path:ssml" not in msg.data:
+            continue
+        await ws.send_str("X-RequestId:1\r\nPath:turn.start\r\n\r\n{}")
+        header = b"X-RequestId:1\r\nContent-Type:audio/mpeg\r\nPath:audio"
+        for i in range(0, len(AUDIO), 4096):
+            await ws.send_bytes((len(header) + 2).to_bytes(2, "big") + header + b"\r\n" + AUDIO[i : i + 4096])
+        await ws.send_str("X-RequestId:1\r\nPath:turn.end\r\n\r\n{}")
+    return ws
+
+
+def serve(port):
+    app = web.Application()
+    app.router.add_get("/edge/v1", handler)
+    web.run_app(app, host="localhost", port=port, print=None)
+
+
+def main():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        port = sock.getsockname()[1]
+    server = multiprocessing.Process(target=serve, args=(port,), daemon=True)  # 模拟服务放在单独进程中，不与测试争抢GIL
+    server.start()
+    time.sleep(1)
+    edge_tts.communicate.WSS_URL = "ws://localhost:{}/edge/v1?TrustedClientToken=x".format(port)
+    tmp_dir = tempfile.mkdtemp()
+    runtime = AsyncRuntime()
+    utterances = 100
+
+    def legacy(i):
+        asyncio.run(edge_tts.Communicate("你好{}".format(i), "zh-CN-YunjianNeural").save(os.path.join(tmp_dir, "{}.mp3".format(i))))
+
+    def shared(i):
+        async def gen_voice():
+            communicate = edge_tts.Communicate("你好{}".format(i), "zh-CN-YunjianNeural", connector=runtime.connector())
+            await communicate.save(os.path.join(tmp_dir, "{}.mp3".format(i)))
+
+        runtime.run(gen_voice())
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        asyncio.run(asyncio.sleep(0))
+    print("asyncio.run() of an empty coroutine: {:.3f}ms".format(time.perf_counter() - start))
+    start = time.perf_counter()
+    for _ in range(1000):
+        runtime.run(asyncio.sleep(0))
+    print("AsyncRuntime.run() of an empty coroutine: {:.3f}ms".format(time.perf_counter() - start))
+
+    for name, fn in [("asyncio.run per utterance", legacy), ("shared event loop", shared)]:
+        for threads in [1, 8]:
+            latency = LatencyStats()
+
+            def timed(i):
+                start = time.perf_counter()
+                fn(i)
+                latency.record(time.perf_counter() - start)
+
+            fn(0)  # 预热
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads) as executor:
+                list(executor.map(timed, range(utterances)))
+            print(
+                "{}, {} threads: {} utterances in {:.2f}s, latency {}, threads alive {}".format(
+                    name, threads, utterances, time.perf_counter() - start, latency, threading.active_count()
+                )
+            )
+    runtime.close()
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
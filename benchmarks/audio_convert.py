@@ -0,0 +1,87 @@
+"""
+对比原来经过临时文件的转换和内存转码：gewechat语音回复(mp3/wav转silk)、收到的silk语音转mp3，
+每条语音的耗时和写入磁盘的字节数(/proc/self/io的write_bytes，包含已退出的ffmpeg子进程)
+运行: python -m benchmarks.audio_convert [语音秒数]
+"""
+import math
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pilk
+from pydub import AudioSegment
+
+from voice.audio_convert import any_to_mp3, encode_pcm, mp3_to_silk, transcode
+
+
+def main():
+    def legacy_mp3_to_silk(mp3_path, silk_path):
+        audio = AudioSegment.from_file(mp3_path)
+        audio = audio.set_channels(1)
+        audio = audio.set_frame_rate(24000)
+        pcm_path = os.path.splitext(mp3_path)[0] + ".pcm"
+        audio.export(pcm_path, format="s16le")
+        pilk.encode(pcm_path, silk_path, pcm_rate=24000, tencent=True)
+        os.remove(pcm_path)
+        return pilk.get_duration(silk_path)
+
+    def legacy_silk_to_mp3(silk_path, mp3_path):
+        pcm_path = silk_path + ".pcm"
+        pilk.decode(silk_path, pcm_path)
+        audio = AudioSegment.from_raw(pcm_path, format="raw", frame_rate=24000, channels=1, sample_width=2)
+        audio.export(mp3_path, format="mp3")
+        os.remove(pcm_path)
+
+    def disk_write_bytes():
+        with open("/proc/self/io") as f:
+            io_stats = dict(line.split(": ") for line in f.read().splitlines())
+        return int(io_stats["write_bytes"])
+
+    work_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(__file__)))  # 放在磁盘上，tmpfs的写入不计入write_bytes
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    messages = 16
+    rate = 44100
+    pcm = b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * 440 * i / rate))) for i in range(rate * seconds))
+    inputs = {}
+    for format in ["wav", "mp3"]:
+        inputs[format] = os.path.join(work_dir, "tts." + format)
+        with open(inputs[format], "wb") as f:
+            f.write(encode_pcm(pcm, rate, format))
+    silk_input = os.path.join(work_dir, "voice.silk")
+    with open(silk_input, "wb") as f:
+        f.write(transcode(inputs["wav"], "silk")[0])
+
+    cases = [
+        ("wav -> silk", inputs["wav"], ".silk", legacy_mp3_to_silk, mp3_to_silk),
+        ("mp3 -> silk", inputs["mp3"], ".silk", legacy_mp3_to_silk, mp3_to_silk),
+        ("silk -> mp3", silk_input, ".mp3", legacy_silk_to_mp3, any_to_mp3),
+    ]
+    for name, source, suffix, legacy, current in cases:
+        for label, fn in [("temp files", legacy), ("in memory", current)]:
+
+            def convert(i):
+                path = os.path.join(work_dir, "{}_{}".format(i, os.path.basename(source)))
+                shutil.copy2(source, path)
+                fn(path, path + suffix)
+
+            try:
+                os.sync()
+                written = disk_write_bytes()
+                start = time.perf_counter()
+                with ThreadPoolExecutor(8) as executor:
+                    list(executor.map(convert, range(messages)))
+                cost = (time.perf_counter() - start) / messages
+                os.sync()
+                written = (disk_write_bytes() - written) / messages - os.path.getsize(source)  # 减去复制输入文件的写入
+                print("{} {:<10}: {:.1f}ms, {:.0f}KB written per {}s voice".format(name, label, cost * 1000, written / 1024, seconds))
+            except Exception as e:
+                print("{} {:<10}: failed, {}".format(name, label, e))
+    shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
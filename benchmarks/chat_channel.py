@@ -0,0 +1,132 @@
+"""
+对比原来每0.2秒轮询所有session的consume和就绪队列调度：消息从入队到提交线程池的延迟(p50/p99)，
+以及大量session都有任务在处理时consume线程空转占用的CPU
+运行: python -m benchmarks.chat_channel
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import config as config_module
+from bridge.context import Context, ContextType
+from channel.chat_channel import ChatChannel
+from common.metrics import LatencyStats
+
+executor = ThreadPoolExecutor(256)
+
+
+class BenchChannel(ChatChannel):
+    # 会话状态是类属性，每种实现使用独立的一份，互不干扰
+    sessions = {}
+    futures = {}
+    lock = threading.Lock()
+    ready_cond = threading.Condition(lock)
+    ready_sessions = deque()
+    ready_set = set()
+    handle_seconds = 0.01
+
+    def __init__(self):
+        self.dispatch_latency = LatencyStats()
+        super().__init__()
+
+    def _submit_handle(self, context: Context) -> Future:
+        return executor.submit(time.sleep, context.get("handle_seconds", self.handle_seconds))
+
+    def _success_callback(self, session_id, **kwargs):
+        pass
+
+
+class NewChannel(BenchChannel):
+    sessions = {}
+    futures = {}
+    lock = threading.Lock()
+    ready_cond = threading.Condition(lock)
+    ready_sessions = deque()
+    ready_set = set()
+
+
+class LegacyChannel(BenchChannel):
+    sessions = {}
+    futures = {}
+    lock = threading.Lock()
+    ready_cond = threading.Condition(lock)
+    ready_sessions = deque()
+    ready_set = set()
+
+    def _mark_ready(self, session_id):
+        pass
+
+    def consume(self):
+        # 原来的实现：遍历所有session，逐个尝试获取信号量，然后休眠0.2秒
+        while True:
+            with self.lock:
+                session_ids = list(self.sessions.keys())
+            for session_id in session_ids:
+                with self.lock:
+                    context_queue, semaphore = self.sessions[session_id]
+                if semaphore.acquire(blocking=False):
+                    if not context_queue.empty():
+                        context = context_queue.get()
+                        self.dispatch_latency.record(time.monotonic() - context["produce_time"])
+                        future: Future = self._submit_handle(context)
+                        future.add_done_callback(self._thread_pool_callback(session_id, context=context))
+                        with self.lock:
+                            if session_id not in self.futures:
+                                self.futures[session_id] = []
+                            self.futures[session_id].append(future)
+                    elif semaphore._initial_value == semaphore._value + 1:
+                        with self.lock:
+                            self.futures[session_id] = [t for t in self.futures[session_id] if not t.done()]
+                            assert len(self.futures[session_id]) == 0, "thread pool error"
+                            del self.sessions[session_id]
+                    else:
+                        semaphore.release()
+            time.sleep(0.2)
+
+
+def wait_idle(channel):
+    while channel.sessions:
+        time.sleep(0.05)
+
+
+def main():
+    config_module.config = config_module.Config({"concurrency_in_session": 1, "max_inflight_messages": 0, "session_queue_max_size": 0})
+    users = 200
+    messages_per_user = 10
+    for name, cls in [("polling every 0.2s", LegacyChannel), ("ready queue", NewChannel)]:
+        channel = cls()
+        random.seed(0)
+
+        def user(i):
+            for j in range(messages_per_user):
+                time.sleep(random.uniform(0, 0.05))
+                channel.produce(Context(ContextType.TEXT, "msg {}".format(j), session_id="user_{}".format(i)))
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wait_idle(channel)
+        print(
+            "{}: {} messages in {:.2f}s, dispatch latency {}".format(
+                name, users * messages_per_user, time.perf_counter() - start, channel.dispatch_latency
+            )
+        )
+
+        # 5000个session各有一条消息在处理(如等待模型回复)，统计期间consume线程的CPU占用
+        for i in range(5000):
+            channel.produce(Context(ContextType.TEXT, "slow", session_id="slow_{}".format(i), handle_seconds=3))
+        time.sleep(0.5)
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        time.sleep(2)
+        cpu = (time.process_time() - cpu_start) / (time.perf_counter() - wall_start)
+        print("{}: 5000 busy sessions, process cpu {:.1%} while waiting".format(name, cpu))
+        wait_idle(channel)
+
+
+if __name__ == "__main__":
+    main()
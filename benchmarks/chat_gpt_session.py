@@ -0,0 +1,36 @@
+"""
+ChatGPTSession在1000轮对话中按上限裁剪消息的耗时，对比旧的逐条移除后全量重算
+运行: python -m benchmarks.chat_gpt_session [model]
+"""
+from bot.chatgpt.chat_gpt_session import ChatGPTSession, num_tokens_from_messages
+
+
+def main():
+    # 对比1000轮对话时，旧的逐条移除后全量重算与按消息缓存增量扣减的耗时
+    import sys
+    import time
+
+    model = sys.argv[1] if len(sys.argv) > 1 else "gpt-3.5-turbo"
+
+    def legacy_discard_exceeding(session, max_tokens):
+        cur_tokens = num_tokens_from_messages(session.messages, session.model)
+        while cur_tokens > max_tokens and len(session.messages) > 2:
+            session.messages.pop(1)
+            cur_tokens = num_tokens_from_messages(session.messages, session.model)
+        return cur_tokens
+
+    for name, discard in [("legacy", legacy_discard_exceeding), ("incremental", ChatGPTSession.discard_exceeding)]:
+        session = ChatGPTSession("bench", system_prompt="You are a helpful assistant.", model=model)
+        start = time.perf_counter()
+        for i in range(1000):
+            session.add_query("question {} ".format(i) * 20)
+            discard(session, 100000)
+            session.add_reply("answer {} ".format(i) * 40)
+            discard(session, 100000)
+        # 最后一次收紧上限，触发大量消息移除
+        discard(session, 1000)
+        print("{}: {:.1f}ms".format(name, (time.perf_counter() - start) * 1000))
+
+
+if __name__ == "__main__":
+    main()
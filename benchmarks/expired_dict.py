@@ -0,0 +1,57 @@
+"""
+ExpiredDict与旧实现(datetime + 每次读取重写)的读写耗时对比
+运行: python -m benchmarks.expired_dict
+"""
+import time
+
+from common.expired_dict import ExpiredDict
+
+
+def main():
+    # 与旧实现(datetime + 每次读取重写)对比，100k个key的读写耗时
+    from datetime import datetime, timedelta
+
+    class LegacyExpiredDict(dict):
+        def __init__(self, expires_in_seconds):
+            super().__init__()
+            self.expires_in_seconds = expires_in_seconds
+
+        def __getitem__(self, key):
+            value, expiry_time = super().__getitem__(key)
+            if datetime.now() > expiry_time:
+                del self[key]
+                raise KeyError("expired {}".format(key))
+            self.__setitem__(key, value)
+            return value
+
+        def __setitem__(self, key, value):
+            super().__setitem__(key, (value, datetime.now() + timedelta(seconds=self.expires_in_seconds)))
+
+        def __contains__(self, key):
+            try:
+                self[key]
+                return True
+            except KeyError:
+                return False
+
+        def keys(self):
+            return [key for key in list(super().keys()) if key in self]
+
+    n = 100000
+    for cls in [LegacyExpiredDict, ExpiredDict]:
+        d = cls(3600)
+        result = []
+        for name, op in [
+            ("set", lambda: [d.__setitem__(i, i) for i in range(n)]),
+            ("get", lambda: [d[i] for i in range(n)]),
+            ("contains", lambda: [i in d for i in range(n)]),
+            ("keys", lambda: d.keys()),
+        ]:
+            start = time.perf_counter()
+            op()
+            result.append("{}={:.1f}ms".format(name, (time.perf_counter() - start) * 1000))
+        print("{}: {}".format(cls.__name__, ", ".join(result)))
+
+
+if __name__ == "__main__":
+    main()
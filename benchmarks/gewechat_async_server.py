@@ -0,0 +1,115 @@
+"""
+模拟gewechat高频推送回调，同时有客户端下载大文件，对比web.py和aiohttp回调服务器的应答耗时
+运行: python -m benchmarks.gewechat_async_server
+"""
+import json
+import os
+import threading
+import time
+
+from aiohttp import web
+
+from channel.gewechat.gewechat_async_server import CallbackServer
+from common.metrics import LatencyStats
+
+
+def main():
+    # 压测：模拟gewechat高频推送回调，同时有客户端下载大文件，对比web.py和aiohttp回调服务器的应答耗时
+    import asyncio
+    import socket
+    from concurrent.futures import ThreadPoolExecutor
+
+    import requests
+
+    from common.tmp_dir import TmpDir
+
+    callbacks = 2000
+    senders = 16
+    handle_cost = 0.002  # 模拟解析消息、组装上下文的耗时
+    big_file = TmpDir().path() + "callback_bench.bin"
+    with open(big_file, "wb") as f:
+        f.write(os.urandom(32 * 1024 * 1024))
+
+    def free_port():
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            return s.getsockname()[1]
+
+    def stub_handler(data):
+        time.sleep(handle_cost)
+
+    def start_aiohttp(port):
+        server = CallbackServer(stub_handler, "/callback", workers=2)
+
+        def run():
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            web.run_app(server.build_app(), host="127.0.0.1", port=port, print=None, handle_signals=False, access_log=None)
+
+        threading.Thread(target=run, daemon=True).start()
+        return server
+
+    def start_webpy(port):
+        import web as webpy
+
+        class Callback:
+            def GET(self):
+                file_path = webpy.input(file="").file
+                if not file_path:
+                    return "running"
+                with open(file_path, "rb") as f:
+                    return f.read()
+
+            def POST(self):
+                stub_handler(json.loads(webpy.data()))
+                return "success"
+
+        app = webpy.application(("/callback", "Callback"), {"Callback": Callback}, autoreload=False)
+        threading.Thread(target=webpy.httpserver.runsimple, args=(app.wsgifunc(), ("127.0.0.1", port)), daemon=True).start()
+
+    def load_test(name, port):
+        url = f"http://127.0.0.1:{port}/callback"
+        for _ in range(50):
+            try:
+                requests.get(url, timeout=1)
+                break
+            except requests.exceptions.ConnectionError:
+                time.sleep(0.1)
+        latency = LatencyStats()
+        stop = threading.Event()
+
+        def download():
+            with requests.Session() as s:
+                while not stop.is_set():
+                    s.get(url, params={"file": big_file}, timeout=60).content
+
+        downloaders = [threading.Thread(target=download, daemon=True) for _ in range(4)]
+        for t in downloaders:
+            t.start()
+        body = json.dumps({"TypeName": "AddMsg", "Data": {"Content": {"string": "x" * 200}}})
+        local = threading.local()
+
+        def post(i):
+            s = getattr(local, "session", None) or requests.Session()
+            local.session = s
+            start = time.monotonic()
+            s.post(url, data=body, timeout=30)
+            latency.record(time.monotonic() - start)
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(senders) as executor:
+            list(executor.map(post, range(callbacks)))
+        cost = time.monotonic() - start
+        stop.set()
+        print("{}: {} callbacks in {:.2f}s ({:.0f}/s), ack {}".format(name, callbacks, cost, callbacks / cost, latency))
+
+    start_webpy(free_port_webpy := free_port())
+    load_test("web.py", free_port_webpy)
+    server = start_aiohttp(free_port_aiohttp := free_port())
+    load_test("aiohttp", free_port_aiohttp)
+    time.sleep(callbacks * handle_cost / 2 + 1)
+    print("aiohttp server stats: {}".format(server.stats()))
+    os.remove(big_file)
+
+
+if __name__ == "__main__":
+    main()
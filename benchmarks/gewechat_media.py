@@ -0,0 +1,85 @@
+"""
+模拟回调线程收到图片消息：对比在回调线程中同步下载和提交到下载线程池时回调的耗时，
+以及回调和prepare()各下载一次与按msg_id去重后实际下载的次数
+运行: python -m benchmarks.gewechat_media
+"""
+import http.server
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from channel.gewechat.gewechat_media import MediaDownloader
+from common.metrics import LatencyStats
+
+
+def main():
+    file_size = 2 * 1024 * 1024
+    api_delay = 0.05  # 模拟获取下载地址的接口耗时
+    requests_served = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            requests_served.append(self.path)
+            time.sleep(0.02)
+            self.send_response(200)
+            self.send_header("Content-Length", str(file_size))
+            self.end_headers()
+            self.wfile.write(b"x" * file_size)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = "http://127.0.0.1:{}".format(server.server_address[1])
+    tmp_dir = tempfile.mkdtemp()
+    messages = 40
+
+    def legacy_download(msg_id):
+        time.sleep(api_delay)
+        data = requests.get("{}/{}.png".format(base_url, msg_id)).content
+        with open(os.path.join(tmp_dir, "{}.png".format(msg_id)), "wb") as f:
+            f.write(data)
+
+    def fetch(downloader, msg_id):
+        time.sleep(api_delay)
+        downloader.download_to_file("{}/{}.png".format(base_url, msg_id), os.path.join(tmp_dir, "{}.png".format(msg_id)))
+
+    def run(name, on_callback, on_prepare):
+        requests_served.clear()
+        callback_latency = LatencyStats()
+
+        def callback(msg_id):
+            start = time.monotonic()
+            on_callback(msg_id)
+            callback_latency.record(time.monotonic() - start)
+            time.sleep(0.01)  # 组装上下文、排队后由处理线程调用prepare()
+            on_prepare(msg_id)
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(callback, range(messages)))
+        print(
+            "{}: {} image messages in {:.2f}s, callback {}, files fetched {}".format(
+                name, messages, time.monotonic() - start, callback_latency, len(requests_served)
+            )
+        )
+
+    run("sync download in callback + prepare", legacy_download, legacy_download)
+    downloader = MediaDownloader(max_workers=4)
+    run(
+        "download pool with dedup",
+        lambda msg_id: downloader.submit(msg_id, fetch, downloader, msg_id),
+        lambda msg_id: downloader.submit(msg_id, fetch, downloader, msg_id).result(),
+    )
+    print("stats: {}".format(downloader.stats()))
+
+
+if __name__ == "__main__":
+    main()
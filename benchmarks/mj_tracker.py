@@ -0,0 +1,109 @@
+"""
+本地模拟LinkAI任务接口，任务在提交后30~120秒内随机完成，时间按scale缩放
+对比每个任务一个线程每10秒查询一次和共用调度器时，出图后通知的延迟、查询次数和线程数
+运行: python -m benchmarks.mj_tracker [任务数]
+"""
+import http.server
+import importlib.util
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+
+from common.metrics import LatencyStats
+
+# linkai插件目录不能作为包导入，按文件路径加载
+_spec = importlib.util.spec_from_file_location(
+    "mj_tracker", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plugins", "linkai", "mj_tracker.py")
+)
+mj_tracker = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(mj_tracker)
+
+
+def main():
+    scale = 0.1
+    task_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    random.seed(0)
+    finish_at = {}
+    served = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        wbufsize = 64 * 1024  # 响应头和响应体一起发送，避免长连接上的Nagle延迟
+
+        def do_GET(self):
+            served.append(self.path)
+            task_id = self.path.rsplit("/", 1)[-1]
+            status = "FINISHED" if time.monotonic() >= finish_at[task_id] else "PENDING"
+            body = json.dumps({"code": 200, "data": {"status": status, "img_id": task_id}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(http.server.ThreadingHTTPServer):
+        request_queue_size = 1024
+        daemon_threads = True
+
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = "http://127.0.0.1:{}/tasks/".format(server.server_address[1])
+
+    def legacy_track(task_id, on_finished):
+        def check_task_sync():
+            max_retry_times = 90
+            while max_retry_times > 0:
+                time.sleep(10 * scale)
+                try:
+                    res = requests.get(base_url + task_id, timeout=8)
+                    if res.json()["data"]["status"] == "FINISHED":
+                        on_finished(res.json()["data"])
+                        return
+                    max_retry_times -= 1
+                except Exception:
+                    max_retry_times -= 20
+
+        threading.Thread(target=check_task_sync).start()
+
+    tracker = mj_tracker.MJTaskTracker(
+        schedule=tuple((limit * scale if limit else None, interval * scale) for limit, interval in mj_tracker.POLL_SCHEDULE)
+    )
+
+    for name, track in [
+        ("thread per task, 10s sleep", legacy_track),
+        ("shared tracker", lambda task_id, on_finished: tracker.track(task_id, base_url + task_id, {}, on_finished)),
+    ]:
+        served.clear()
+        lateness = LatencyStats()
+        done = threading.Semaphore(0)
+        peak_threads = threading.active_count()
+
+        def on_finished(data):
+            lateness.record((time.monotonic() - finish_at[data["img_id"]]) / scale)
+            done.release()
+
+        for i in range(task_count):
+            task_id = "{}_{}".format(name[0], i)
+            finish_at[task_id] = time.monotonic() + random.uniform(30, 120) * scale
+            track(task_id, on_finished)
+        for _ in range(task_count):
+            while not done.acquire(timeout=0.1):
+                peak_threads = max(peak_threads, threading.active_count())
+            peak_threads = max(peak_threads, threading.active_count())
+        print(
+            "{}: {} tasks, notify delay after finish {} (simulated), {} polls, peak threads {}".format(
+                name, task_count, lateness, len(served), peak_threads
+            )
+        )
+    print("stats: {}".format(tracker.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+模拟微信服务器的重试规则(每次请求等待5秒，同一消息最多请求3次)，大量用户同时发消息，stub bot在随机1~12秒后回复，
+对比web.py和aiohttp被动回复服务器在第几次请求拿到回复
+运行: python -m benchmarks.passive_reply_async [aiohttp|webpy] [用户数]
+"""
+import asyncio
+import hashlib
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import web as webpy
+
+from bridge.reply import Reply, ReplyType
+from channel.wechatmp.passive_reply_async import run_passive_reply_server
+from channel.wechatmp.wechatmp_channel import WechatMPChannel
+
+
+def main():
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    server = sys.argv[1] if len(sys.argv) > 1 else "aiohttp"
+    port = 18080
+    channel = WechatMPChannel()
+
+    def stub_produce(context):
+        from_user = context["receiver"]
+
+        def reply():
+            channel.send(Reply(ReplyType.TEXT, "reply to " + context.content), context)
+            channel._success_callback(from_user, context=context)
+
+        threading.Timer(random.uniform(1, 12), reply).start()
+
+    channel.produce = stub_produce
+    if server == "aiohttp":
+
+        def run():
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            run_passive_reply_server(port, "127.0.0.1")
+
+        threading.Thread(target=run, daemon=True).start()
+    else:
+        from channel.wechatmp.passive_reply import Query
+
+        app = webpy.application(("/wx", "Query"), {"Query": Query}, autoreload=False)
+        threading.Thread(target=webpy.httpserver.runsimple, args=(app.wsgifunc(), ("127.0.0.1", port)), daemon=True).start()
+    time.sleep(1)
+
+    def signed_params():
+        timestamp, nonce = str(int(time.time())), str(random.randint(0, 1 << 30))
+        signature = hashlib.sha1("".join(sorted(["", timestamp, nonce])).encode()).hexdigest()
+        return {"signature": signature, "timestamp": timestamp, "nonce": nonce}
+
+    def wechat_server(i):
+        """模拟微信服务器推送一条消息，返回拿到回复时是第几次请求，未拿到回复返回0"""
+        xml = (
+            "<xml><ToUserName>gh_bot</ToUserName><FromUserName>user_{0}</FromUserName><CreateTime>{1}</CreateTime>"
+            "<MsgType>text</MsgType><Content>hello {0}</Content><MsgId>{2}</MsgId></xml>"
+        ).format(i, int(time.time()), 10000 + i)
+        for attempt in range(1, 4):
+            try:
+                resp = requests.post(f"http://127.0.0.1:{port}/wx", params=signed_params(), data=xml.encode(), timeout=5)
+                if "reply to" in resp.text:
+                    return attempt
+                if "正在思考中" in resp.text:
+                    return 0
+            except requests.exceptions.RequestException:  # 超时或连接被拒绝，微信服务器会重试
+                pass
+        return 0
+
+    start = time.time()
+    with ThreadPoolExecutor(users) as executor:
+        results = list(executor.map(wechat_server, range(users)))
+    counter = Counter(results)
+    print(
+        "{}: {} users in {:.1f}s, replied at 1st/2nd/3rd request: {}/{}/{}, no reply: {}".format(
+            server, users, time.time() - start, counter[1], counter[2], counter[3], counter[0]
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+每轮对话的会话读写开销：20000个用户，80%的对话来自其中1000个活跃用户，内存中最多保留2000个会话
+运行: python -m benchmarks.session_store
+"""
+import os
+import pickle
+import random
+import shutil
+import tempfile
+import time
+
+from common.session_store import PersistentSessionDict, SQLiteSessionStore
+
+
+class DemoSession:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.messages = [{"role": "system", "content": "你是一个乐于助人的助手"}]
+
+    def add(self, role, content):
+        self.messages.append({"role": role, "content": content})
+        self.messages[1:] = self.messages[-20:]
+
+
+def main():
+    users = 20000
+    turns = 50000
+    random.seed(0)
+    session_ids = [
+        "user_{}".format(random.randrange(1000) if random.random() < 0.8 else random.randrange(users)) for _ in range(turns)
+    ]
+
+    def run(sessions, after_turn=None):
+        start = time.perf_counter()
+        for i, session_id in enumerate(session_ids):
+            if session_id not in sessions:
+                sessions[session_id] = DemoSession(session_id)
+            sessions[session_id].add("user", "问题{}".format(i) * 10)
+            sessions[session_id].add("assistant", "回答{}".format(i) * 40)
+            if after_turn:
+                after_turn(i, session_id, sessions)
+        return (time.perf_counter() - start) / turns * 1000
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        print("memory dict: {:.3f}ms/turn".format(run({})))
+
+        def commit(i, session_id, sessions):
+            store.write("demo", [(session_id, pickle.dumps(sessions[session_id]))])
+
+        store = SQLiteSessionStore(os.path.join(tmp_dir, "sync.db"))
+        print("commit every turn: {:.3f}ms/turn".format(run({}, commit)))
+
+        flush_cost = [0]
+
+        def flush(i, session_id, sessions):
+            if i % 500 == 499:  # 后台线程每5秒写入一次，这里按每500轮写入一次模拟，单独统计写入耗时
+                start = time.perf_counter()
+                sessions.flush(force=True)
+                flush_cost[0] += time.perf_counter() - start
+
+        store = SQLiteSessionStore(os.path.join(tmp_dir, "sessions.db"))
+        sessions = PersistentSessionDict(store, "demo", max_resident=2000)
+        cost = run(sessions, flush) - flush_cost[0] / turns * 1000
+        sessions.flush(force=True)
+        print(
+            "write-behind: handler thread {:.3f}ms/turn, background flush {:.3f}ms/turn, resident={}, on disk={}, {}".format(
+                cost, flush_cost[0] / turns * 1000, len(sessions), store.count("demo"), sessions.stats()
+            )
+        )
+
+        # 模拟重启：新实例懒加载，首次访问会话时从磁盘读取
+        sessions = PersistentSessionDict(SQLiteSessionStore(os.path.join(tmp_dir, "sessions.db")), "demo", max_resident=2000)
+        start = time.perf_counter()
+        for i in range(1000):
+            sessions["user_{}".format(i)]
+        cost = (time.perf_counter() - start) / 1000 * 1000
+        print("after restart: lazy load {:.3f}ms/session, user_0 has {} messages".format(cost, len(sessions["user_0"].messages)))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+模拟5篇文章各被分享到50个群，分享链接带不同的统计参数，每次总结(抓取+调用模型)耗时0.5秒，16个处理线程
+对比不缓存和使用缓存时实际总结的次数、总耗时和每次分享的回复延迟
+运行: python -m benchmarks.summary_cache
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.metrics import LatencyStats
+from common.summary_cache import SummaryCache, normalize_url
+
+
+def main():
+    random.seed(0)
+    articles = ["https://mp.weixin.qq.com/s?__biz=MzA{}&mid=2650{}&idx=1&sn=abc{}".format(i, i, i) for i in range(5)]
+    shares = [
+        "{}&amp;chksm={}&amp;scene={}#rd".format(random.choice(articles), random.randint(0, 10**8), random.choice([1, 21, 126]))
+        for _ in range(250)
+    ]
+    computed = []
+
+    def summarize(url):
+        computed.append(url)
+        time.sleep(0.5)
+        return "summary of {}".format(normalize_url(url))
+
+    for name, cache in [("no cache", None), ("summary cache", SummaryCache(max_concurrency=4))]:
+        computed.clear()
+        latency = LatencyStats()
+
+        def handle(url):
+            start = time.perf_counter()
+            if cache:
+                result = cache.get_or_compute("bench", url, lambda: summarize(url))
+            else:
+                result = summarize(url)
+            assert result == "summary of {}".format(normalize_url(url))
+            latency.record(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(16) as executor:
+            list(executor.map(handle, shares))
+        print(
+            "{}: {} shares in {:.2f}s, summarized {} times, reply latency {}".format(
+                name, len(shares), time.perf_counter() - start, len(computed), latency
+            )
+        )
+        if cache:
+            print("stats: {}".format(cache.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+_compose_context在不同白名单、关键词列表长度下的吞吐，群名不在白名单中、消息不含关键词是最慢的情况
+运行: python -m benchmarks.trigger_matcher
+"""
+import random
+import time
+
+import config as config_module
+from bridge.context import ContextType
+from channel.chat_channel import ChatChannel, check_contain, check_prefix
+from channel.chat_message import ChatMessage
+
+
+def main():
+    random.seed(0)
+
+    def random_name(length=8):
+        return "".join(chr(random.randint(0x4E00, 0x9FA5)) for _ in range(length))
+
+    def make_msg(i, group, at):
+        msg = ChatMessage(None)
+        msg.from_user_id = msg.actual_user_id = "user_{}".format(i % 100)
+        msg.actual_user_nickname = "nick_{}".format(i % 100)
+        msg.to_user_id = "bot"
+        msg.other_user_id = "group_{}".format(i % 50) if group else msg.from_user_id
+        msg.other_user_nickname = group
+        msg.is_at = at
+        msg.at_list = ["bot", "nick_{}".format(i % 7)] if at else []
+        return msg
+
+    channel = ChatChannel.__new__(ChatChannel)  # 不启动consume线程
+    channel.name = "bot"
+    channel.user_id = "bot"
+    for size in [10, 1000, 10000, 50000]:
+        group_names = [random_name() for _ in range(size)]
+        config_module.config = config_module.Config(
+            {
+                "group_name_white_list": group_names,
+                "group_name_keyword_white_list": [random_name(4) for _ in range(size)],
+                "group_chat_in_one_session": group_names[: size // 2],
+                "group_chat_prefix": ["@bot"] + [random_name(3) for _ in range(size)],
+                "group_chat_keyword": [random_name(4) for _ in range(size)],
+                "single_chat_prefix": ["bot"] + [random_name(3) for _ in range(size)],
+                "image_create_prefix": ["画", "看", "找"],
+                "nick_name_black_list": [random_name() for _ in range(size)],
+            }
+        )
+        # 一半群消息@机器人，群名一半在白名单中，另一半既不在白名单中也不含关键词；私聊消息不匹配前缀
+        messages = []
+        for i in range(2000):
+            group = random.choice(group_names) if i % 4 == 0 else (random_name() if i % 4 == 1 else None)
+            content = "@bot @nick_{} 你好，帮我{}".format(i % 7, random_name(30)) if group else random_name(30)
+            messages.append((group, content, make_msg(i, group, bool(group) and i % 2 == 0)))
+
+        def compose_all():
+            for group, content, msg in messages:
+                channel._compose_context(ContextType.TEXT, content, isgroup=bool(group), msg=msg)
+
+        compose_all()  # 首次调用编译索引
+        start = time.perf_counter()
+        compose_all()
+        cost = (time.perf_counter() - start) / len(messages)
+        config = config_module.conf()
+        start = time.perf_counter()
+        for group, content, _ in messages[:200]:
+            if group:
+                check_contain(group, config["group_name_keyword_white_list"])
+                check_prefix(content, config["group_chat_prefix"])
+                check_contain(content, config["group_chat_keyword"])
+            else:
+                check_prefix(content, config["single_chat_prefix"])
+        linear = (time.perf_counter() - start) / 200
+        print(
+            "list size {:>5}: _compose_context {:.1f}us/msg ({:.0f} msg/s), linear check_prefix/check_contain alone {:.1f}us/msg".format(
+                size, cost * 1e6, 1 / cost, linear * 1e6
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
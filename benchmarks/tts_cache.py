@@ -0,0 +1,87 @@
+"""
+模拟gewechat语音回复：合成接口耗时api_delay秒，回复中一部分是重复文本(关注回复、错误提示、关键词回复)，
+对比不缓存和缓存时每条回复合成+转silk的耗时
+运行: python -m benchmarks.tts_cache
+"""
+import math
+import os
+import random
+import shutil
+import struct
+import tempfile
+import time
+import uuid
+
+from bridge.reply import Reply, ReplyType
+from common.metrics import LatencyStats
+from common.tmp_dir import TmpDir
+from voice.audio_convert import encode_pcm, mp3_to_silk
+from voice.tts_cache import TtsCache
+from voice.voice import Voice
+
+
+def main():
+    api_delay = 0.3
+    rate = 24000
+    random.seed(0)
+
+    class FakeVoice(Voice):
+        calls = 0
+
+        def tts_cache_voice(self):
+            return "fake"
+
+        def textToVoice(self, text):
+            FakeVoice.calls += 1
+            time.sleep(api_delay)
+            seconds = 2 + len(text) % 5
+            pcm = b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * (200 + len(text)) * i / rate))) for i in range(rate * seconds))
+            path = TmpDir().path() + "reply-{}.mp3".format(uuid.uuid4().hex)
+            with open(path, "wb") as f:
+                f.write(encode_pcm(pcm, rate, "mp3"))
+            return Reply(ReplyType.VOICE, path)
+
+    canned = ["感谢您的关注！", "遇到了一点小问题，请稍后再问我吧", "我暂时还无法听清您的语音，请稍后再试吧~", "今天天气不错"]
+    texts = [random.choice(canned) if random.random() < 0.4 else "回答{}".format(i) for i in range(60)]
+    bot = FakeVoice()
+
+    def reply(text, cache):
+        voice = cache.text_to_voice("fake", bot, text) if cache else bot.textToVoice(text)
+        if cache:
+            paths, meta = cache.artifact(voice.content, "silk", lambda: ([voice.content + ".silk"], {"duration": mp3_to_silk(voice.content, voice.content + ".silk")}))
+            silk_path = paths[0]
+        else:
+            silk_path, duration = voice.content + ".silk", mp3_to_silk(voice.content, voice.content + ".silk")
+        os.remove(voice.content)
+        os.remove(silk_path)
+
+    cache_dir = tempfile.mkdtemp()
+    for name, cache in [("no cache", None), ("tts cache", TtsCache(cache_dir, 200 * 1024 * 1024))]:
+        FakeVoice.calls = 0
+        latency, repeated_latency = LatencyStats(), LatencyStats()
+        seen = set()
+        start = time.perf_counter()
+        for text in texts:
+            begin = time.perf_counter()
+            reply(text, cache)
+            (repeated_latency if text in seen else latency).record(time.perf_counter() - begin)
+            seen.add(text)
+        print(
+            "{}: {} replies in {:.1f}s, {} synthesize calls, new text {}, repeated text {}".format(
+                name, len(texts), time.perf_counter() - start, FakeVoice.calls, latency, repeated_latency
+            )
+        )
+        if cache:
+            print("stats: {}".format(cache.stats()))
+    # 大小上限很小时按LRU淘汰，重启后从磁盘恢复
+    small = TtsCache(tempfile.mkdtemp(), 64 * 1024)
+    for text in texts[:10]:
+        os.remove(small.text_to_voice("fake", bot, text).content)
+    reloaded = TtsCache(small.cache_dir, 64 * 1024)
+    print("small cache: {} entries, {} bytes, evictions {}, reloaded {} entries".format(len(small.entries), small.total_bytes, small.evictions, len(reloaded.entries)))
+    shutil.rmtree(cache_dir)
+    shutil.rmtree(small.cache_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+10万用户下，旧的pickle整体存储与sqlite按key存储的启动加载、修改持久化、读取耗时对比
+运行: python -m benchmarks.user_data_store
+"""
+import os
+import pickle
+import threading
+
+from common.user_data_store import PickleUserDataStore, UserData, create_user_data_store
+
+
+def main():
+    # 10万用户下，启动加载、单个用户修改后持久化、读取的耗时对比
+    import shutil
+    import tempfile
+    import time
+
+    n = 100000
+    updates = 200
+    user_datas = {"user_{}".format(i): {"gpt_model": "gpt-4o", "openai_api_key": "sk-{:040d}".format(i)} for i in range(n)}
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(tmp_dir, "user_datas.pkl"), "wb") as f:
+            pickle.dump(user_datas, f)
+
+        start = time.perf_counter()
+        store = PickleUserDataStore(os.path.join(tmp_dir, "user_datas.pkl"))
+        load_cost = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(updates):
+            UserData(store, "user_{}".format(i), store.load("user_{}".format(i)))["gpt_model"] = "gpt-4o-mini"
+            store.save()  # 旧实现每次修改都需整体重写
+        update_cost = time.perf_counter() - start
+        print("pickle: load={:.1f}ms, update+save={:.2f}ms/op".format(load_cost * 1000, update_cost / updates * 1000))
+
+        start = time.perf_counter()
+        store = create_user_data_store("sqlite", tmp_dir)
+        print("sqlite: migrate={:.1f}ms, users={}".format((time.perf_counter() - start) * 1000, store.count_users()))
+        store.close()
+
+        start = time.perf_counter()
+        store = create_user_data_store("sqlite", tmp_dir)
+        load_cost = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(updates):
+            UserData(store, "user_{}".format(i), store.load("user_{}".format(i)))["gpt_model"] = "gpt-4o-mini"
+        update_cost = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(updates):
+            store.load("user_{}".format(n - i - 1))
+        read_cost = time.perf_counter() - start
+        print("sqlite: load={:.1f}ms, update={:.3f}ms/op, read={:.3f}ms/op".format(
+            load_cost * 1000, update_cost / updates * 1000, read_cost / updates * 1000))
+
+        # 多线程并发写入
+        def worker(t):
+            for i in range(500):
+                UserData(store, "user_{}".format(t * 500 + i), {})["gpt_model"] = "t{}".format(t)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        print("sqlite: 8 threads x 500 writes={:.1f}ms, user_7 model={}".format(
+            (time.perf_counter() - start) * 1000, store.load("user_7")["gpt_model"]))
+        store.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+1000个SSE客户端同时在线，stub bot收到消息后立即回复，统计从发送消息到客户端收到回复的耗时
+运行: python -m benchmarks.web_async_server
+"""
+import asyncio
+
+from channel.web.web_async_server import run_web_server
+
+
+def main():
+    # 压测：1000个SSE客户端同时在线，stub bot收到消息后立即回复，统计从发送消息到客户端收到回复的耗时
+    import json
+    import threading
+    import time
+
+    import aiohttp
+
+    from bridge.reply import Reply, ReplyType
+    from channel.web.web_channel import WebChannel
+    from common.metrics import LatencyStats
+
+    clients = 1000
+    burst = 20  # 部分用户积压多条消息，检查是否一次推送完
+    port = 19899
+    channel = WebChannel()
+
+    def stub_produce(context):  # 代替bot，直接回复收到的内容
+        channel.send(Reply(ReplyType.TEXT, context.content), context)
+
+    channel.produce = stub_produce
+    def run():
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        run_web_server(channel, port, "127.0.0.1")
+
+    threading.Thread(target=run, daemon=True).start()
+    time.sleep(1)
+
+    async def main():
+        latency = LatencyStats()
+        received = {}
+        connected = asyncio.Semaphore(0)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as session:
+
+            async def client(user_id, expect):
+                async with session.get(f"http://127.0.0.1:{port}/sse/{user_id}") as resp:
+                    connected.release()
+                    got = 0
+                    async for line in resp.content:
+                        if line.startswith(b"data: "):
+                            message = json.loads(line[6:])
+                            latency.record(time.time() - float(message["content"]))
+                            got += 1
+                            if got >= expect:
+                                break
+                    received[user_id] = got
+
+            tasks = [asyncio.create_task(client(f"user_{i}", burst if i < 10 else 1)) for i in range(clients)]
+            for _ in range(clients):
+                await connected.acquire()
+            print("{} sse clients connected".format(clients))
+
+            start = time.monotonic()
+            for i in range(clients):
+                for _ in range(burst if i < 10 else 1):
+                    payload = json.dumps({"user_id": f"user_{i}", "message": repr(time.time())})
+                    async with session.post(f"http://127.0.0.1:{port}/message", data=payload) as resp:
+                        await resp.read()
+            await asyncio.wait_for(asyncio.gather(*tasks), 60)
+            cost = time.monotonic() - start
+        print("delivered {} messages to {} clients in {:.2f}s, latency {}".format(sum(received.values()), len(received), cost, latency))
+
+    asyncio.run(main())
+
+
+if __name__ == "__main__":
+    main()
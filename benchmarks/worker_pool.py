@@ -0,0 +1,30 @@
+"""
+一致性哈希的分布和扩容时的迁移比例：理想情况下各worker均分，增加一个worker只迁移约1/(N+1)的session
+运行: python -m benchmarks.worker_pool
+"""
+import time
+
+from channel.worker_pool import HashRing
+
+
+def main():
+    sessions = ["session_{}".format(i) for i in range(100000)]
+    for n in [2, 4, 8]:
+        ring = HashRing(range(n))
+        before = [ring.get_node(s) for s in sessions]
+        counts = [before.count(i) for i in range(n)]
+        ring.add_node(n)
+        moved = sum(1 for s, node in zip(sessions, before) if ring.get_node(s) != node)
+        print(
+            "workers={}: sessions per worker min/max={}/{}, add one worker moves {:.1%} (ideal {:.1%})".format(
+                n, min(counts), max(counts), moved / len(sessions), 1 / (n + 1)
+            )
+        )
+    start = time.perf_counter()
+    for s in sessions:
+        ring.get_node(s)
+    print("route cost: {:.2f}us per message".format((time.perf_counter() - start) / len(sessions) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
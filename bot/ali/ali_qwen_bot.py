@@ -24,7 +24,7 @@ class AliQwenBot(Bot, OpenAIImage, OpenAIVision):
     def __init__(self):
         super().__init__()
         self.api_key_expired_time = self.set_api_key()
-        self.sessions = SessionManager(AliQwenSession, model=conf().get("model", const.QWEN))
+        self.sessions = SessionManager(AliQwenSession, owner=self, model=conf().get("model", const.QWEN))
 
     def api_key_client(self):
         return broadscope_bailian.AccessTokenClient(access_key_id=self.access_key_id(), access_key_secret=self.access_key_secret())
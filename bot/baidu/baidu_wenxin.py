@@ -32,7 +32,7 @@ class BaiduWenxinBot(Bot):
             elif conf().get("model") and conf().get("model") == const.WEN_XIN_4:
                 wenxin_model = "completions_pro"
 
-        self.sessions = SessionManager(BaiduWenxinSession, model=wenxin_model)
+        self.sessions = SessionManager(BaiduWenxinSession, owner=self, model=wenxin_model)
 
     def reply(self, query, context=None):
         # acquire reply content
@@ -19,7 +19,7 @@ from cozepy import MessageType,Message
 class ByteDanceCozeBot(Bot):
     def __init__(self):
         super().__init__()
-        self.sessions = CozeSessionManager(CozeSession)
+        self.sessions = CozeSessionManager(CozeSession, owner=self)
         self.coze_api_base = conf().get("coze_api_base", "https://api.coze.cn/")
         self.coze_api_key = conf().get('coze_api_key', '')
         if conf().get('coze_return_show_img', False):
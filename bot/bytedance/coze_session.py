@@ -1,4 +1,4 @@
-from common.expired_dict import ExpiredDict
+from common.session_store import create_session_dict, session_namespace
 from config import conf
 from common.log import logger
 
@@ -64,12 +64,8 @@ class CozeSession(object):
 
 
 class CozeSessionManager(object):
-    def __init__(self, sessioncls, **session_args):
-        if conf().get("expires_in_seconds"):
-            sessions = ExpiredDict(conf().get("expires_in_seconds"))
-        else:
-            sessions = dict()
-        self.sessions = sessions
+    def __init__(self, sessioncls, owner=None, **session_args):
+        self.sessions = create_session_dict(session_namespace(owner, sessioncls, session_args.get("model")))
         self.sessioncls = sessioncls
         self.session_args = session_args
 
@@ -41,7 +41,7 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
         if conf().get("rate_limit_chatgpt"):
             self.tb4chatgpt = TokenBucket(conf().get("rate_limit_chatgpt", 20))
         conf_model = conf().get("model") or "gpt-3.5-turbo"
-        self.sessions = SessionManager(ChatGPTSession, model=conf().get("model") or "gpt-3.5-turbo")
+        self.sessions = SessionManager(ChatGPTSession, owner=self, model=conf().get("model") or "gpt-3.5-turbo")
         # o1相关模型不支持system prompt，暂时用文心模型的session
 
         self.args = {
@@ -56,7 +56,7 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
         }
         # o1相关模型固定了部分参数，暂时去掉
         if conf_model in [const.O1, const.O1_MINI]:
-            self.sessions = SessionManager(BaiduWenxinSession, model=conf().get("model") or const.O1_MINI)
+            self.sessions = SessionManager(BaiduWenxinSession, owner=self, model=conf().get("model") or const.O1_MINI)
             remove_keys = ["temperature", "top_p", "frequency_penalty", "presence_penalty"]
             for key in remove_keys:
                 self.args.pop(key, None)  # 如果键不存在，使用 None 来避免抛出错误
@@ -226,7 +226,7 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
                     # 不是触发词，直接处理普通对话
                     logger.info("[CHATGPT] 进入普通对话流程")
                     session = self.sessions.session_query(query, context.get("session_id"))
-                    return self.reply_text(context.get("session_id"), session, None, self.args)
+                    return self.reply_text(context.get("session_id"), session, None, self.args, context=context)
             
             # 处理文本消息
             session_id = context["session_id"]
@@ -236,7 +236,7 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
             reply = None
             if reply is None:
                 session = self.sessions.session_query(query, context.get("session_id"))
-                reply = self.reply_text(context.get("session_id"), session, None, self.args)
+                reply = self.reply_text(context.get("session_id"), session, None, self.args, context=context)
             
             return reply
                     
@@ -245,12 +245,13 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
                 logger.exception(f"[CHATGPT] 处理请求异常：{e}")
                 return Reply(ReplyType.ERROR, f"处理请求失败：{str(e)}")
 
-    def reply_text(self, session_id: str, session: ChatGPTSession, api_key=None, args=None, retry_count=0) -> dict:
+    def reply_text(self, session_id: str, session: ChatGPTSession, api_key=None, args=None, retry_count=0, context=None) -> dict:
         """
         call openai's ChatCompletion to get the answer
         :param session: a conversation session
         :param session_id: session id
         :param retry_count: retry count
+        :param context: context, used to send stream reply through its channel
         :return: {}
         """
         try:
@@ -286,6 +287,21 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
                 
                 # 调用 FastGPT API
                 client = FastGPTClient()
+                channel = context.get("channel") if context else None
+                if conf().get("stream_reply") and hasattr(channel, "send_stream_reply"):
+                    try:
+                        text_stream = client.chat_completion_stream(
+                            messages=session.messages,
+                            chat_id=chat_id,
+                            response_chat_item_id=response_chat_item_id,
+                            variables=variables
+                        )
+                        content = channel.send_stream_reply(context, text_stream)
+                        logger.info(f"[CHATGPT] FastGPT 流式回复完成，长度：{len(content)}")
+                        return {"completion_tokens": 0, "content": ""}  # 已分段发送，不再重复回复
+                    except Exception as e:
+                        logger.warning(f"[CHATGPT] FastGPT 流式请求失败，改用普通请求：{e}")
+
                 response = client.chat_completion(
                     messages=session.messages,
                     chat_id=chat_id,
@@ -359,7 +375,7 @@ class ChatGPTBot(Bot, OpenAIImage, OpenAIVision):
             if retry_count < 2:
                 logger.warn(f"[CHATGPT] 第{retry_count+1}次重试")
                 time.sleep(3)
-                return self.reply_text(session_id, session, api_key, args, retry_count + 1)
+                return self.reply_text(session_id, session, api_key, args, retry_count + 1, context)
             return {"completion_tokens": 0, "content": f"处理请求失败：{str(e)}"}
 
     def _upload_to_oss(self, data, filename, content_type):
@@ -16,7 +16,7 @@ from config import conf
 class ClaudeAIBot(Bot, OpenAIImage):
     def __init__(self):
         super().__init__()
-        self.sessions = SessionManager(ClaudeAiSession, model=conf().get("model") or "gpt-3.5-turbo")
+        self.sessions = SessionManager(ClaudeAiSession, owner=self, model=conf().get("model") or "gpt-3.5-turbo")
         self.claude_api_cookie = conf().get("claude_api_cookie")
         self.proxy = conf().get("proxy")
         self.con_uuid_dic = {}
@@ -30,7 +30,7 @@ class ClaudeAPIBot(Bot, OpenAIImage):
             proxies=proxy if proxy else None,
             base_url=base_url if base_url else None
         )
-        self.sessions = SessionManager(BaiduWenxinSession, model=conf().get("model") or "text-davinci-003")
+        self.sessions = SessionManager(BaiduWenxinSession, owner=self, model=conf().get("model") or "text-davinci-003")
 
     def reply(self, query, context=None):
         # acquire reply content
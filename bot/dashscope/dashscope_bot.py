@@ -23,7 +23,7 @@ dashscope_models = {
 class DashscopeBot(Bot):
     def __init__(self):
         super().__init__()
-        self.sessions = SessionManager(DashscopeSession, model=conf().get("model") or "qwen-plus")
+        self.sessions = SessionManager(DashscopeSession, owner=self, model=conf().get("model") or "qwen-plus")
         self.model_name = conf().get("model") or "qwen-plus"
         self.api_key = conf().get("dashscope_api_key")
         os.environ["DASHSCOPE_API_KEY"] = self.api_key
@@ -15,6 +15,7 @@ from bot.dify.dify_session import DifySession, DifySessionManager
 from bridge.context import ContextType, Context
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.sse import iter_sse_events
 from common import const, memory
 from common.utils import parse_markdown_text, print_red
 from common.tmp_dir import TmpDir
@@ -25,7 +26,7 @@ UNKNOWN_ERROR_MSG = "我暂时遇到了一些问题，请您稍后重试~"
 class DifyBot(Bot):
     def __init__(self):
         super().__init__()
-        self.sessions = DifySessionManager(DifySession, model=conf().get("model", const.DIFY))
+        self.sessions = DifySessionManager(DifySession, owner=self, model=conf().get("model", const.DIFY))
 
     def reply(self, query, context: Context=None):
         # acquire reply content
@@ -99,7 +100,14 @@ class DifyBot(Bot):
             session.count_user_message() # 限制一个conversation中消息数，防止conversation过长
             dify_app_type = self._get_dify_conf(context, "dify_app_type", 'chatbot')
             if dify_app_type == 'chatbot' or dify_app_type == 'chatflow':
-                return self._handle_chatbot(query, session, context)
+                # 上传图片会清理图片缓存，只上传一次，流式请求失败回退为非流式时复用
+                files = self._get_upload_files(session, context)
+                if conf().get("stream_reply") and hasattr(context.get("channel"), "send_stream_reply"):
+                    try:
+                        return self._handle_chatbot_stream(query, session, context, files)
+                    except Exception as e:
+                        logger.warning("[DIFY] stream reply failed, fallback to blocking: {}".format(e))
+                return self._handle_chatbot(query, session, context, files)
             elif dify_app_type == 'agent':
                 return self._handle_agent(query, session, context)
             elif dify_app_type == 'workflow':
@@ -113,13 +121,12 @@ class DifyBot(Bot):
             logger.exception(error_info)
             return None, UNKNOWN_ERROR_MSG
 
-    def _handle_chatbot(self, query: str, session: DifySession, context: Context):
+    def _handle_chatbot(self, query: str, session: DifySession, context: Context, files=None):
         api_key = self._get_dify_conf(context, "dify_api_key", '')
         api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
         chat_client = ChatClient(api_key, api_base)
         response_mode = 'blocking'
         payload = self._get_payload(query, session, response_mode)
-        files = self._get_upload_files(session, context)
         response = chat_client.create_chat_message(
             inputs=payload['inputs'],
             query=payload['query'],
@@ -162,24 +169,7 @@ class DifyBot(Bot):
         if is_group:
             at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
         for item in parsed_content[:-1]:
-            reply = None
-            if item['type'] == 'text':
-                content = at_prefix + item['content']
-                reply = Reply(ReplyType.TEXT, content)
-            elif item['type'] == 'image':
-                image_url = self._fill_file_base_url(item['content'])
-                image = self._download_image(image_url)
-                if image:
-                    reply = Reply(ReplyType.IMAGE, image)
-                else:
-                    reply = Reply(ReplyType.TEXT, f"图片链接：{image_url}")
-            elif item['type'] == 'file':
-                file_url = self._fill_file_base_url(item['content'])
-                file_path = self._download_file(file_url)
-                if file_path:
-                    reply = Reply(ReplyType.FILE, file_path)
-                else:
-                    reply = Reply(ReplyType.TEXT, f"文件链接：{file_url}")
+            reply = self._build_item_reply(item, at_prefix)
             logger.debug(f"[DIFY] reply={reply}")
             if reply and channel:
                 channel.send(reply, context)
@@ -187,27 +177,8 @@ class DifyBot(Bot):
         if not parsed_content:
             return None, None
         final_item = parsed_content[-1]
-        final_reply = None
-        if final_item['type'] == 'text':
-            content = final_item['content']
-            if is_group:
-                at_prefix = "@" + context["msg"].actual_user_nickname + "\n"
-                content = at_prefix + content
-            final_reply = Reply(ReplyType.TEXT, final_item['content'])
-        elif final_item['type'] == 'image':
-            image_url = self._fill_file_base_url(final_item['content'])
-            image = self._download_image(image_url)
-            if image:
-                final_reply = Reply(ReplyType.IMAGE, image)
-            else:
-                final_reply = Reply(ReplyType.TEXT, f"图片链接：{image_url}")
-        elif final_item['type'] == 'file':
-            file_url = self._fill_file_base_url(final_item['content'])
-            file_path = self._download_file(file_url)
-            if file_path:
-                final_reply = Reply(ReplyType.FILE, file_path)
-            else:
-                final_reply = Reply(ReplyType.TEXT, f"文件链接：{file_url}")
+        # 最后一条回复会经过channel的装饰步骤，由装饰步骤添加群聊@
+        final_reply = self._build_item_reply(final_item)
 
         # 设置dify conversation_id, 依靠dify管理上下文
         if session.get_conversation_id() == '':
@@ -215,6 +186,78 @@ class DifyBot(Bot):
 
         return final_reply, None
 
+    def _handle_chatbot_stream(self, query: str, session: DifySession, context: Context, files=None):
+        api_key = self._get_dify_conf(context, "dify_api_key", '')
+        api_base = self._get_dify_conf(context, "dify_api_base", "https://api.dify.ai/v1")
+        chat_client = ChatClient(api_key, api_base)
+        payload = self._get_payload(query, session, 'streaming')
+        response = chat_client.create_chat_message(
+            inputs=payload['inputs'],
+            query=payload['query'],
+            user=payload['user'],
+            response_mode=payload['response_mode'],
+            conversation_id=payload['conversation_id'],
+            files=files
+        )
+
+        if response.status_code != 200:
+            error_info = f"[DIFY] payload={payload} response text={response.text} status_code={response.status_code}"
+            logger.warning(error_info)
+            friendly_error_msg = self._handle_error_response(response.text, response.status_code)
+            return None, friendly_error_msg
+
+        conversation_id = None
+
+        def answer_stream():
+            nonlocal conversation_id
+            with response:
+                for _, data in iter_sse_events(response):
+                    event = self._parse_sse_event("data: " + data)
+                    if not event:
+                        continue
+                    event_name = event.get('event')
+                    if event_name == 'message' or event_name == 'agent_message':
+                        conversation_id = conversation_id or event.get('conversation_id')
+                        yield event.get('answer', '')
+                    elif event_name == 'error':
+                        raise Exception(event)
+                    elif event_name == 'message_end':
+                        logger.debug("[DIFY] message_end usage: {}".format(event.get('metadata', {}).get('usage')))
+                        break
+
+        def render(text):
+            replies = [self._build_item_reply(item) for item in parse_markdown_text(text)]
+            return [reply for reply in replies if reply]
+
+        context.get("channel").send_stream_reply(context, answer_stream(), render)
+
+        # 设置dify conversation_id, 依靠dify管理上下文
+        if session.get_conversation_id() == '' and conversation_id:
+            session.set_conversation_id(conversation_id)
+        # 已分段发送，不再返回回复
+        return None, None
+
+    def _build_item_reply(self, item, at_prefix=""):
+        """将 parse_markdown_text 解析出的文本、图片、文件转换为回复"""
+        reply = None
+        if item['type'] == 'text':
+            reply = Reply(ReplyType.TEXT, at_prefix + item['content'])
+        elif item['type'] == 'image':
+            image_url = self._fill_file_base_url(item['content'])
+            image = self._download_image(image_url)
+            if image:
+                reply = Reply(ReplyType.IMAGE, image)
+            else:
+                reply = Reply(ReplyType.TEXT, f"图片链接：{image_url}")
+        elif item['type'] == 'file':
+            file_url = self._fill_file_base_url(item['content'])
+            file_path = self._download_file(file_url)
+            if file_path:
+                reply = Reply(ReplyType.FILE, file_path)
+            else:
+                reply = Reply(ReplyType.TEXT, f"文件链接：{file_url}")
+        return reply
+
     def _download_file(self, url):
         try:
             response = requests.get(url)
@@ -1,4 +1,4 @@
-from common.expired_dict import ExpiredDict
+from common.session_store import create_session_dict, session_namespace
 from config import conf
 
 
@@ -59,12 +59,8 @@ class DifySession(object):
         self._user_message_counter += 1
 
 class DifySessionManager(object):
-    def __init__(self, sessioncls, **session_kwargs):
-        if conf().get("expires_in_seconds"):
-            sessions = ExpiredDict(conf().get("expires_in_seconds"))
-        else:
-            sessions = dict()
-        self.sessions = sessions
+    def __init__(self, sessioncls, owner=None, **session_kwargs):
+        self.sessions = create_session_dict(session_namespace(owner, sessioncls, session_kwargs.get("model")))
         self.sessioncls = sessioncls
         self.session_kwargs = session_kwargs
 
@@ -25,7 +25,7 @@ class GoogleGeminiBot(Bot):
         super().__init__()
         self.api_key = conf().get("gemini_api_key")
         # 复用chatGPT的token计算方式
-        self.sessions = SessionManager(ChatGPTSession, model=conf().get("model") or "gpt-3.5-turbo")
+        self.sessions = SessionManager(ChatGPTSession, owner=self, model=conf().get("model") or "gpt-3.5-turbo")
         self.model = conf().get("model") or "gemini-pro"
         if self.model == "gemini":
             self.model = "gemini-pro"
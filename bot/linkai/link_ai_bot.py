@@ -24,7 +24,7 @@ class LinkAIBot(Bot):
 
     def __init__(self):
         super().__init__()
-        self.sessions = LinkAISessionManager(LinkAISession, model=conf().get("model") or "gpt-3.5-turbo")
+        self.sessions = LinkAISessionManager(LinkAISession, owner=self, model=conf().get("model") or "gpt-3.5-turbo")
         self.args = {}
 
     def reply(self, query, context: Context = None) -> Reply:
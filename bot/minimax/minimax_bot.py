@@ -41,7 +41,7 @@ class MinimaxBot(Bot):
                 }
             ],
         }
-        self.sessions = SessionManager(MinimaxSession, model=const.MiniMax)
+        self.sessions = SessionManager(MinimaxSession, owner=self, model=const.MiniMax)
 
     def reply(self, query, context: Context = None) -> Reply:
         # acquire reply content
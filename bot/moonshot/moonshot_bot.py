@@ -18,7 +18,7 @@ import requests
 class MoonshotBot(Bot):
     def __init__(self):
         super().__init__()
-        self.sessions = SessionManager(MoonshotSession, model=conf().get("model") or "moonshot-v1-128k")
+        self.sessions = SessionManager(MoonshotSession, owner=self, model=conf().get("model") or "moonshot-v1-128k")
         model = conf().get("model") or "moonshot-v1-128k"
         if model == "moonshot":
             model = "moonshot-v1-32k"
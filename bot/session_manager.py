@@ -1,4 +1,4 @@
-from common.expired_dict import ExpiredDict
+from common.session_store import create_session_dict, session_namespace
 from common.log import logger
 from config import conf
 
@@ -7,11 +7,28 @@ class Session(object):
     def __init__(self, session_id, system_prompt=None):
         self.session_id = session_id
         self.messages = []
+        self.token_cache = {}  # id(message) -> (message, content, tokens)，每条消息只计算一次token
+        self.custom_system_prompt = system_prompt is not None  # 为False时使用配置的character_desc
         if system_prompt is None:
             self.system_prompt = conf().get("character_desc", "")
         else:
             self.system_prompt = system_prompt
 
+    def __getstate__(self):
+        # 持久化会话时不保存token缓存，缓存以消息对象的id为key，反序列化后失效
+        # model等由SessionManager传入的参数和默认的system_prompt也不保存，加载后使用当前配置
+        state = self.__dict__.copy()
+        state["token_cache"] = {}
+        state.pop("model", None)
+        if not state.get("custom_system_prompt", True):
+            state.pop("system_prompt", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "system_prompt" not in state:
+            self.system_prompt = conf().get("character_desc", "")
+
     # 重置会话
     def reset(self):
         system_item = {"role": "system", "content": self.system_prompt}
@@ -19,6 +36,7 @@ class Session(object):
 
     def set_system_prompt(self, system_prompt):
         self.system_prompt = system_prompt
+        self.custom_system_prompt = True
         self.reset()
 
     def add_query(self, query):
@@ -35,14 +53,31 @@ class Session(object):
     def calc_tokens(self):
         raise NotImplementedError
 
+    def calc_message_tokens(self, message) -> int:
+        raise NotImplementedError
+
+    def get_message_tokens(self, message) -> int:
+        """
+        获取单条消息的token数，按消息对象缓存，消息内容被修改时重新计算
+        """
+        cached = self.token_cache.get(id(message))
+        if cached is not None and cached[0] is message and cached[1] == message.get("content"):
+            return cached[2]
+        tokens = self.calc_message_tokens(message)
+        if len(self.token_cache) > 2 * len(self.messages) + 16:  # 清理已被移除消息的缓存
+            alive = {id(m) for m in self.messages}
+            self.token_cache = {k: v for k, v in self.token_cache.items() if k in alive}
+        self.token_cache[id(message)] = (message, message.get("content"), tokens)
+        return tokens
+
 
 class SessionManager(object):
-    def __init__(self, sessioncls, **session_args):
-        if conf().get("expires_in_seconds"):
-            sessions = ExpiredDict(conf().get("expires_in_seconds"))
-        else:
-            sessions = dict()
-        self.sessions = sessions
+    def __init__(self, sessioncls, owner=None, **session_args):
+        """
+        :param owner: 使用会话的bot，会话按bot类型和模型隔离
+        :param session_args: 创建会话时传入的参数，如model，不随会话持久化，每次取出会话时重新设置
+        """
+        self.sessions = create_session_dict(session_namespace(owner, sessioncls, session_args.get("model")))
         self.sessioncls = sessioncls
         self.session_args = session_args
 
@@ -59,6 +94,8 @@ class SessionManager(object):
         elif system_prompt is not None:  # 如果有新的system_prompt，更新并重置session
             self.sessions[session_id].set_system_prompt(system_prompt)
         session = self.sessions[session_id]
+        for key, value in self.session_args.items():
+            setattr(session, key, value)
         return session
 
     def session_query(self, query, session_id):
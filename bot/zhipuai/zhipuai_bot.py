@@ -19,7 +19,7 @@ from zhipuai import ZhipuAI
 class ZHIPUAIBot(Bot, ZhipuAIImage):
     def __init__(self):
         super().__init__()
-        self.sessions = SessionManager(ZhipuAISession, model=conf().get("model") or "ZHIPU_AI")
+        self.sessions = SessionManager(ZhipuAISession, owner=self, model=conf().get("model") or "ZHIPU_AI")
         self.args = {
             "model": conf().get("model") or "glm-4",  # 对话模型的名称
             "temperature": conf().get("temperature", 0.9),  # 值在(0,1)之间(智谱AI 的温度不能取 0 或者 1)
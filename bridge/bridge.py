@@ -7,6 +7,7 @@ from common.singleton import singleton
 from config import conf
 from translate.factory import create_translator
 from voice.factory import create_voice
+from voice.tts_cache import get_tts_cache
 
 
 @singleton
@@ -91,7 +92,10 @@ class Bridge(object):
         return self.get_bot("voice_to_text").voiceToText(voiceFile)
 
     def fetch_text_to_voice(self, text) -> Reply:
-        return self.get_bot("text_to_voice").textToVoice(text)
+        cache = get_tts_cache()
+        if cache is None:
+            return self.get_bot("text_to_voice").textToVoice(text)
+        return cache.text_to_voice(self.btype["text_to_voice"], self.get_bot("text_to_voice"), text)
 
     def fetch_translate(self, text, from_lang="", to_lang="en") -> Reply:
         return self.get_bot("translate").translate(text, from_lang, to_lang)
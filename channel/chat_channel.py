@@ -1,15 +1,20 @@
 import os
-import re
+import queue
 import threading
 import time
 from asyncio import CancelledError
-from concurrent.futures import Future, ThreadPoolExecutor
+from collections import Counter, deque
+from concurrent.futures import Future
 
 from bridge.context import *
 from bridge.reply import *
 from channel.channel import Channel
 from common.dequeue import Dequeue
 from common import memory
+from common.handler_pool import HandlerPool
+from common.metrics import LatencyStats, collect_stats
+from common.sse import SentenceChunker
+from common.trigger_matcher import get_trigger_index
 from plugins import *
 
 try:
@@ -17,7 +22,21 @@ try:
 except Exception as e:
     pass
 
-handler_pool = ThreadPoolExecutor(max_workers=8)  # 处理消息的线程池
+# 处理消息的线程池，按任务类型隔离，避免语音、画图等慢任务占满处理文字消息的线程
+handler_pools = {
+    "chat": HandlerPool("chat", conf().get("handler_pool_size", 8)),
+    "voice": HandlerPool("voice", conf().get("voice_handler_pool_size", 4)),
+    "image": HandlerPool("image", conf().get("image_handler_pool_size", 4)),
+}
+handler_pool = handler_pools["chat"]
+
+
+def get_handler_pool(context: Context) -> HandlerPool:
+    if context.type == ContextType.VOICE:
+        return handler_pools["voice"]
+    if context.type in [ContextType.IMAGE, ContextType.IMAGE_CREATE]:
+        return handler_pools["image"]
+    return handler_pool
 
 
 # 抽象类, 它包含了与消息通道无关的通用处理逻辑
@@ -27,6 +46,14 @@ class ChatChannel(Channel):
     futures = {}  # 记录每个session_id提交到线程池的future对象, 用于重置会话时把没执行的future取消掉，正在执行的不会被取消
     sessions = {}  # 用于控制并发，每个session_id同时只能有一个context在处理
     lock = threading.Lock()  # 用于控制对sessions的访问
+    ready_cond = threading.Condition(lock)  # 有session可调度时唤醒consume线程
+    ready_sessions = deque()  # 待调度的session_id队列
+    ready_set = set()  # ready_sessions中已有的session_id，避免重复入队
+    dispatch_latency = LatencyStats()  # 消息从入队到提交线程池的延迟
+    stream_first_reply_latency = LatencyStats()  # 流式回复从发起请求到发出第一段的延迟
+    inflight = 0  # 全局排队中和处理中的消息数
+    overflow_counter = Counter()  # 队列溢出时各策略的触发次数
+    reply_in_ingress = False  # 多进程模式下回复是否需要交回接收消息的主进程发送，如公众号被动回复、SSE推送
 
     def __init__(self):
         _thread = threading.Thread(target=self.consume)
@@ -52,9 +79,10 @@ class ChatChannel(Channel):
             context["origin_ctype"] = ctype
         # context首次传入时，receiver是None，根据类型设置receiver
         first_in = "receiver" not in context
+        # 前缀、关键词、白名单等触发条件已按配置预编译，配置修改后自动重建
+        index = get_trigger_index()
         # 群名匹配过程，设置session_id和receiver
         if first_in:  # context首次传入时，receiver是None，根据类型设置receiver
-            config = conf()
             cmsg = context["msg"]
             context["from_user_id"] = cmsg.from_user_id  # 添加这一行，满足fastgpt回传
             user_data = conf().get_user_data(cmsg.from_user_id)
@@ -65,24 +93,11 @@ class ChatChannel(Channel):
                 group_id = cmsg.other_user_id
                 context["group_name"] = group_name
 
-                group_name_white_list = config.get("group_name_white_list", [])
-                group_name_keyword_white_list = config.get("group_name_keyword_white_list", [])
-                if any(
-                        [
-                            group_name in group_name_white_list,
-                            "ALL_GROUP" in group_name_white_list,
-                            check_contain(group_name, group_name_keyword_white_list),
-                        ]
-                ):
-                    group_chat_in_one_session = conf().get("group_chat_in_one_session", [])
+                in_white_list, shared_session = index.group_decision(group_name)
+                if in_white_list:
                     session_id = f"{cmsg.actual_user_id}@@{group_id}" # 当群聊未共享session时，session_id为user_id与group_id的组合，用于区分不同群聊以及单聊
                     context["is_shared_session_group"] = False  # 默认为非共享会话群
-                    if any(
-                            [
-                                group_name in group_chat_in_one_session,
-                                "ALL_GROUP" in group_chat_in_one_session,
-                            ]
-                    ):
+                    if shared_session:
                         session_id = group_id
                         context["is_shared_session_group"] = True  # 如果是共享会话群，设置为True
                 else:
@@ -97,17 +112,17 @@ class ChatChannel(Channel):
             context = e_context["context"]
             if e_context.is_pass() or context is None:
                 return context
-            if cmsg.from_user_id == self.user_id and not config.get("trigger_by_self", True):
+            if cmsg.from_user_id == self.user_id and not index.trigger_by_self:
                 logger.debug("[chat_channel]self message skipped")
                 return None
 
         # 消息内容匹配过程，并处理content
         if ctype == ContextType.TEXT:
-            nick_name_black_list = conf().get("nick_name_black_list", [])
+            nick_name_black_list = index.nick_name_black_list
             if context.get("isgroup", False):  # 群聊
                 # 校验关键字
-                match_prefix = check_prefix(content, conf().get("group_chat_prefix"))
-                match_contain = check_contain(content, conf().get("group_chat_keyword"))
+                match_prefix = index.group_chat_prefix.match(content)
+                match_contain = index.group_chat_keyword.match(content)
                 flag = False
                 if context["msg"].to_user_id != context["msg"].actual_user_id:
                     if match_prefix is not None or match_contain is not None:
@@ -122,19 +137,17 @@ class ChatChannel(Channel):
                             return None
 
                         logger.info("[chat_channel]receive group at")
-                        if not conf().get("group_at_off", False):
+                        if not index.group_at_off:
                             flag = True
                         self.name = self.name if self.name is not None else ""  # 部分渠道self.name可能没有赋值
-                        pattern = f"@{re.escape(self.name)}(\u2005|\u0020)"
-                        subtract_res = re.sub(pattern, r"", content)
+                        names = [self.name]
                         if isinstance(context["msg"].at_list, list):
-                            for at in context["msg"].at_list:
-                                pattern = f"@{re.escape(at)}(\u2005|\u0020)"
-                                subtract_res = re.sub(pattern, r"", subtract_res)
+                            names.extend(context["msg"].at_list)
+                        # 一次替换去除@自己和@列表中的所有人
+                        subtract_res = index.at_pattern(names).sub("", content)
                         if subtract_res == content and context["msg"].self_display_name:
                             # 前缀移除后没有变化，使用群昵称再次移除
-                            pattern = f"@{re.escape(context['msg'].self_display_name)}(\u2005|\u0020)"
-                            subtract_res = re.sub(pattern, r"", content)
+                            subtract_res = index.at_pattern([context["msg"].self_display_name]).sub("", content)
                         content = subtract_res
                 if not flag:
                     if context["origin_ctype"] == ContextType.VOICE:
@@ -147,7 +160,7 @@ class ChatChannel(Channel):
                     logger.warning(f"[chat_channel] Nickname '{nick_name}' in In BlackList, ignore")
                     return None
 
-                match_prefix = check_prefix(content, conf().get("single_chat_prefix", [""]))
+                match_prefix = index.single_chat_prefix.match(content)
                 if match_prefix is not None:  # 判断如果匹配到自定义前缀，则返回过滤掉前缀+空格后的内容
                     content = content.replace(match_prefix, "", 1).strip()
                 elif context["origin_ctype"] == ContextType.VOICE:  # 如果源消息是私聊的语音消息，允许不匹配前缀，放宽条件
@@ -155,19 +168,17 @@ class ChatChannel(Channel):
                 else:
                     return None
             content = content.strip()
-            img_match_prefix = check_prefix(content, conf().get("image_create_prefix",[""]))
+            img_match_prefix = index.image_create_prefix.match(content)
             if img_match_prefix:
                 content = content.replace(img_match_prefix, "", 1)
                 context.type = ContextType.IMAGE_CREATE
             else:
                 context.type = ContextType.TEXT
             context.content = content.strip()
-            if "desire_rtype" not in context and conf().get(
-                    "always_reply_voice") and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
+            if "desire_rtype" not in context and index.always_reply_voice and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
                 context["desire_rtype"] = ReplyType.VOICE
         elif context.type == ContextType.VOICE:
-            if "desire_rtype" not in context and conf().get(
-                    "voice_reply_voice") and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
+            if "desire_rtype" not in context and index.voice_reply_voice and ReplyType.VOICE not in self.NOT_SUPPORT_REPLYTYPE:
                 context["desire_rtype"] = ReplyType.VOICE
         return context
 
@@ -211,6 +222,13 @@ class ChatChannel(Channel):
                 context["channel"] = e_context["channel"]
                 reply = super().build_reply_content(context.content, context)
             elif context.type == ContextType.IMAGE:  # 图片消息
+                cmsg = context.get("msg")
+                if cmsg is not None and cmsg.deferred_download:
+                    try:
+                        cmsg.prepare()  # 等待后台下载完成，之前下载失败时重新下载，bot保存的图片路径才可用
+                    except Exception as e:
+                        logger.warning("[chat_channel] prepare image failed: {}".format(e))
+                        return Reply(ReplyType.ERROR, "图片下载失败，请重新发送")
                 context["channel"] = e_context["channel"]
                 reply = super().build_reply_content("read_image", context)
             elif context.type == ContextType.IMAGE_CREATE:  # 创建图片
@@ -314,6 +332,69 @@ class ChatChannel(Channel):
                 logger.debug("[chat_channel] ready to send reply: {}, context: {}".format(reply, context))
                 self._send(reply, context)
 
+    def send_stream_reply(self, context: Context, text_stream, render=None) -> str:
+        """
+        消费bot流式返回的文本片段，按整句或段落分段发送
+        :param text_stream: 逐段返回文本的迭代器
+        :param render: 可选，将一段文本转换为Reply列表，默认发送文本消息
+        :return: 完整的回复文本；未发出任何内容就出错时抛出异常，由bot回退为非流式请求
+        """
+        chunker = SentenceChunker(conf().get("stream_min_chunk_size", 50), conf().get("stream_flush_interval", 3))
+        start = time.monotonic()
+        full_text = ""
+        sent_count = 0
+
+        def send_chunk(chunk):
+            nonlocal sent_count
+            replies = render(chunk) if render else [Reply(ReplyType.TEXT, chunk)]
+            for reply in replies:
+                reply = self._decorate_reply(context, reply)
+                self._send_reply(context, reply)
+            if sent_count == 0:
+                self.stream_first_reply_latency.record(time.monotonic() - start)
+            sent_count += 1
+
+        # 在单独线程中读取流，流暂时没有新内容时也能按stream_flush_interval发送已完整的句子
+        pieces = queue.Queue()
+
+        def read_stream():
+            try:
+                for text in text_stream:
+                    pieces.put(text)
+                pieces.put(None)
+            except Exception as e:
+                pieces.put(e)
+
+        threading.Thread(target=read_stream, daemon=True).start()
+        polled = False  # 上次等待超时后已检查过，没有新内容前无需再次定时检查
+        try:
+            while True:
+                timeout = None if polled else max(chunker.last_flush_time + chunker.flush_interval - time.monotonic(), 0)
+                try:
+                    text = pieces.get(timeout=timeout)
+                except queue.Empty:
+                    for chunk in chunker.poll():
+                        send_chunk(chunk)
+                    polled = True
+                    continue
+                if text is None:
+                    break
+                if isinstance(text, Exception):
+                    raise text
+                polled = False
+                full_text += text
+                for chunk in chunker.feed(text):
+                    send_chunk(chunk)
+        except Exception as e:
+            if sent_count == 0:
+                raise
+            logger.warning("[chat_channel] stream reply interrupted after {} chunks: {}".format(sent_count, e))
+        rest = chunker.flush()
+        if rest:
+            send_chunk(rest)
+        logger.debug("[chat_channel] stream reply finished, chunks={}, cost={:.2f}s".format(sent_count, time.monotonic() - start))
+        return full_text
+
     def _send(self, reply: Reply, context: Context, retry_cnt=0):
         try:
             self.send(reply, context)
@@ -357,72 +438,204 @@ class ChatChannel(Channel):
             except Exception as e:
                 logger.exception("Worker raise exception: {}".format(e))
             with self.lock:
+                self._add_inflight(-1)
                 self.sessions[session_id][1].release()
+                self._mark_ready(session_id)  # 释放了并发名额，唤醒consume继续处理该session
 
         return func
 
+    # 标记session可调度，调用方需持有self.lock
+    def _mark_ready(self, session_id):
+        if session_id not in self.ready_set:
+            self.ready_set.add(session_id)
+            self.ready_sessions.append(session_id)
+            self.ready_cond.notify()
+
     def produce(self, context: Context):
         session_id = context.get("session_id", 0)
+        context["produce_time"] = time.monotonic()
+        need_busy_reply = False
         with self.lock:
             if session_id not in self.sessions:
                 self.sessions[session_id] = [
                     Dequeue(),
                     threading.BoundedSemaphore(conf().get("concurrency_in_session", 4)),
                 ]
-            if context.type == ContextType.TEXT and context.content.startswith("#"):
-                self.sessions[session_id][0].putleft(context)  # 优先处理管理命令
+            context_queue = self.sessions[session_id][0]
+            if _is_admin_command(context):
+                context_queue.putleft(context)  # 优先处理管理命令，不受队列上限限制
+                self._add_inflight(1)
+            elif self._is_overflow(context_queue):
+                need_busy_reply = self._handle_overflow(session_id, context_queue, context)
             else:
-                self.sessions[session_id][0].put(context)
+                context_queue.put(context)
+                self._add_inflight(1)
+            self._mark_ready(session_id)
+        if need_busy_reply:
+            self._send(Reply(ReplyType.TEXT, conf().get("busy_reply", "当前消息较多，请稍后再试")), context)
+
+    # inflight与sessions一样在所有实例间共享，调用方需持有self.lock
+    def _add_inflight(self, n):
+        ChatChannel.inflight += n
+
+    # 判断是否超出全局在途消息上限或会话队列上限，调用方需持有self.lock
+    def _is_overflow(self, context_queue: Dequeue) -> bool:
+        max_inflight = conf().get("max_inflight_messages", 0)
+        if max_inflight > 0 and self.inflight >= max_inflight:
+            return True
+        max_queue_size = conf().get("session_queue_max_size", 0)
+        return max_queue_size > 0 and context_queue.qsize() >= max_queue_size
+
+    # 按配置的策略处理溢出的消息，返回是否需要回复繁忙提示，调用方需持有self.lock
+    def _handle_overflow(self, session_id, context_queue: Dequeue, context: Context) -> bool:
+        policy = conf().get("session_queue_overflow_policy", "drop_oldest")
+        dropped = self._remove_oldest(context_queue) if policy == "drop_oldest" else None
+        if dropped is not None:
+            context_queue.put(context)
+            logger.warning("[chat_channel] queue overflow, drop oldest message, session_id={}, content={}".format(session_id, dropped.content))
+        elif policy == "merge" and self._merge_into_last(context_queue, context):
+            logger.info("[chat_channel] queue overflow, merge message into last one, session_id={}".format(session_id))
+        elif policy == "busy":
+            logger.warning("[chat_channel] queue overflow, reply busy, session_id={}".format(session_id))
+        elif context_queue.empty():  # 会话没有排队消息，只能是全局上限已满
+            policy = "global_limit"
+            logger.warning("[chat_channel] inflight limit reached, drop message, session_id={}, content={}".format(session_id, context.content))
+        else:
+            policy = "drop_newest"
+            logger.warning("[chat_channel] queue overflow, drop newest message, session_id={}, content={}".format(session_id, context.content))
+        self.overflow_counter[policy] += 1
+        return policy == "busy"
+
+    # 移除队列中最早的普通消息并返回，插到队首的管理命令不会被丢弃，没有可丢弃的消息时返回None
+    def _remove_oldest(self, context_queue: Dequeue):
+        with context_queue.mutex:
+            for i, queued in enumerate(context_queue.queue):
+                if not _is_admin_command(queued):
+                    del context_queue.queue[i]
+                    return queued
+        return None
 
-    # 消费者函数，单独线程，用于从消息队列中取出消息并处理
+    # 将同一用户的连续文字消息合并为一条，合并成功返回True
+    def _merge_into_last(self, context_queue: Dequeue, context: Context) -> bool:
+        if context.type != ContextType.TEXT:
+            return False
+        with context_queue.mutex:
+            if not context_queue.queue:
+                return False
+            last = context_queue.queue[-1]
+            if last.type != ContextType.TEXT or _is_admin_command(last) or _sender_id(last) != _sender_id(context):
+                return False
+            last.content = last.content + "\n" + context.content
+        return True
+
+    # 提交上下文给处理线程池，返回Future；多进程模式下替换为分发给worker进程
+    def _submit_handle(self, context: Context) -> Future:
+        return get_handler_pool(context).submit(self._handle, context)
+
+    # 消费者函数，单独线程，等待有session就绪时再取出消息处理，不再轮询所有session
     def consume(self):
+        while True:
+            with self.ready_cond:
+                while not self.ready_sessions:
+                    self.ready_cond.wait()
+                session_id = self.ready_sessions.popleft()
+                self.ready_set.discard(session_id)
+            try:
+                self._dispatch(session_id)
+            except Exception as e:
+                logger.exception("[chat_channel] dispatch error, session_id = {}, {}".format(session_id, e))
+
+    # 在并发限制内尽量多地提交该session排队的消息，session空闲且无消息时将其删除
+    def _dispatch(self, session_id):
         while True:
             with self.lock:
-                session_ids = list(self.sessions.keys())
-            for session_id in session_ids:
+                if session_id not in self.sessions:
+                    return
+                context_queue, semaphore = self.sessions[session_id]
+            if not semaphore.acquire(blocking=False):  # 并发已满，等任务结束的回调再次调度
+                return
+            if not context_queue.empty():
+                context = context_queue.get()
+                produce_time = context.get("produce_time")
+                if produce_time:
+                    self.dispatch_latency.record(time.monotonic() - produce_time)
+                logger.debug("[chat_channel] consume context: {}".format(context))
+                future: Future = self._submit_handle(context)
+                future.add_done_callback(self._thread_pool_callback(session_id, context=context))
                 with self.lock:
-                    context_queue, semaphore = self.sessions[session_id]
-                if semaphore.acquire(blocking=False):  # 等线程处理完毕才能删除
-                    if not context_queue.empty():
-                        context = context_queue.get()
-                        logger.debug("[chat_channel] consume context: {}".format(context))
-                        future: Future = handler_pool.submit(self._handle, context)
-                        future.add_done_callback(self._thread_pool_callback(session_id, context=context))
-                        with self.lock:
-                            if session_id not in self.futures:
-                                self.futures[session_id] = []
-                            self.futures[session_id].append(future)
-                    elif semaphore._initial_value == semaphore._value + 1:  # 除了当前，没有任务再申请到信号量，说明所有任务都处理完毕
-                        with self.lock:
-                            self.futures[session_id] = [t for t in self.futures[session_id] if not t.done()]
-                            assert len(self.futures[session_id]) == 0, "thread pool error"
-                            del self.sessions[session_id]
-                    else:
-                        semaphore.release()
-            time.sleep(0.2)
+                    if session_id not in self.futures:
+                        self.futures[session_id] = []
+                    self.futures[session_id].append(future)
+                continue
+            with self.lock:
+                # 除了当前，没有任务再申请到信号量，说明所有任务都处理完毕；在锁内确认队列为空，避免与produce竞争
+                if semaphore._initial_value == semaphore._value + 1 and context_queue.empty():
+                    self.futures[session_id] = [t for t in self.futures.get(session_id, []) if not t.done()]
+                    assert len(self.futures[session_id]) == 0, "thread pool error"
+                    del self.sessions[session_id]
+                    del self.futures[session_id]
+                    return
+            semaphore.release()  # 仍有任务在处理，等其结束的回调再次调度
+            return
+
+    # 运行状态统计，供#stats指令查看
+    def get_runtime_stats(self) -> dict:
+        with self.lock:
+            dispatch = {
+                "sessions": len(self.sessions),
+                "ready_sessions": len(self.ready_sessions),
+                "latency": str(self.dispatch_latency),
+                "stream_first_reply": str(self.stream_first_reply_latency),
+            }
+            backpressure = {
+                "inflight": self.inflight,
+                "max_inflight": conf().get("max_inflight_messages", 0),
+                "session_queue_max_size": conf().get("session_queue_max_size", 0),
+                "overflow_policy": conf().get("session_queue_overflow_policy", "drop_oldest"),
+            }
+            for policy in ["drop_oldest", "drop_newest", "global_limit", "merge", "busy"]:
+                backpressure[policy] = self.overflow_counter[policy]
+        stats = {"dispatch": dispatch, "backpressure": backpressure}
+        for name, pool in handler_pools.items():
+            stats[f"{name}_pool"] = pool.stats()
+        stats.update(collect_stats())
+        return stats
 
     # 取消session_id对应的所有任务，只能取消排队的消息和已提交线程池但未执行的任务
     def cancel_session(self, session_id):
         with self.lock:
             if session_id in self.sessions:
-                for future in self.futures[session_id]:
+                for future in self.futures.get(session_id, []):
                     future.cancel()
                 cnt = self.sessions[session_id][0].qsize()
                 if cnt > 0:
                     logger.info("Cancel {} messages in session {}".format(cnt, session_id))
+                self._add_inflight(-cnt)
                 self.sessions[session_id][0] = Dequeue()
 
     def cancel_all_session(self):
         with self.lock:
             for session_id in self.sessions:
-                for future in self.futures[session_id]:
+                for future in self.futures.get(session_id, []):
                     future.cancel()
                 cnt = self.sessions[session_id][0].qsize()
                 if cnt > 0:
                     logger.info("Cancel {} messages in session {}".format(cnt, session_id))
+                self._add_inflight(-cnt)
                 self.sessions[session_id][0] = Dequeue()
 
 
+def _is_admin_command(context: Context):
+    return context.type == ContextType.TEXT and context.content.startswith("#")
+
+
+def _sender_id(context: Context):
+    msg = context.get("msg")
+    if context.get("isgroup", False) and msg is not None:
+        return msg.actual_user_id
+    return context.get("from_user_id") or context.get("session_id")
+
+
 def check_prefix(content, prefix_list):
     if not prefix_list:
         return None
@@ -28,6 +28,7 @@ self_display_name: 自身的展示名，设置群昵称时，该字段表示群
 
 _prepare_fn: 准备函数，用于准备消息的内容，比如下载图片等,
 _prepared: 是否已经调用过准备函数
+deferred_download: 图片在后台下载，处理图片消息前需调用prepare等待下载完成
 _rawmsg: 原始消息对象
 
 """
@@ -57,6 +58,7 @@ class ChatMessage(object):
 
     _prepare_fn = None
     _prepared = False
+    deferred_download = False
     _rawmsg = None
 
     def __init__(self, _rawmsg):
@@ -67,6 +69,12 @@ class ChatMessage(object):
             self._prepared = True
             self._prepare_fn()
 
+    def __getstate__(self):
+        # 多进程模式下消息会序列化后发给worker进程，准备函数是闭包，无法序列化，发送前已在主进程中调用
+        state = self.__dict__.copy()
+        state.pop("_prepare_fn", None)
+        return state
+
     def __str__(self):
         return "ChatMessage: id={}, create_time={}, ctype={}, content={}, from_user_id={}, from_user_nickname={}, to_user_id={}, to_user_nickname={}, other_user_id={}, other_user_nickname={}, is_group={}, is_at={}, actual_user_id={}, actual_user_nickname={}, at_list={}".format(
             self.msg_id,
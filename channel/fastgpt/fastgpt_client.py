@@ -2,15 +2,41 @@
 # -*- coding: utf-8 -*-
 
 import json
+import threading
 import requests
 import base64
-from typing import List, Dict, Optional, Any, Union
+from typing import Iterator, List, Dict, Optional, Any, Union
 from config import conf
+from common.http_client import create_session, request_with_retry
 from common.log import logger
+from common.metrics import LatencyStats, register_stats
+from common.sse import iter_sse_events
+
+_session = None  # 所有客户端共享的连接池
+_session_lock = threading.Lock()
+_endpoint_cache = {}  # api_base -> 上次请求成功的URL，失败后再重新探测
+_latency = {"connect": LatencyStats(), "ttfb": LatencyStats(), "total": LatencyStats()}
+
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session(conf().get("fastgpt_pool_size", 10))
+    return _session
+
+
+def get_latency_stats() -> dict:
+    return {phase: str(stats) for phase, stats in _latency.items()}
+
+
+register_stats("fastgpt", get_latency_stats)
+
 
 class FastGPTClient:
     """FastGPT API 客户端"""
-    
+
     def __init__(self):
         """初始化 FastGPT 客户端"""
         self.api_base = conf().get("fastgpt_api_base", "").rstrip('/')
@@ -20,7 +46,7 @@ class FastGPTClient:
 
     def _get_headers(self) -> Dict[str, str]:
         """获取请求头
-        
+
         Returns:
             Dict[str, str]: 包含 Authorization 的请求头
         """
@@ -29,6 +55,66 @@ class FastGPTClient:
             "Content-Type": "application/json"
         }
 
+    def _get_urls(self) -> List[str]:
+        return [
+            f"{self.api_base}/chat/completions",
+            f"{self.api_base}/v1/chat/completions",
+            f"{self.api_base}/api/v1/chat/completions"
+        ]
+
+    def _post(self, payload: Dict[str, Any], stream: bool = False) -> Union[Dict[str, Any], requests.Response]:
+        """发送请求，优先使用上次成功的URL，失败后再依次探测其他URL
+
+        Args:
+            payload: 请求体
+            stream: 是否为流式请求
+
+        Returns:
+            FastGPT 的响应，流式请求返回未读取的 Response；全部失败时返回包含 error 的字典
+        """
+        cached_url = _endpoint_cache.get(self.api_base)
+        urls_to_try = self._get_urls()
+        if cached_url:
+            urls_to_try.remove(cached_url)
+            urls_to_try.insert(0, cached_url)
+
+        last_error = None
+        for url in urls_to_try:
+            try:
+                logger.debug(f"[FastGPT] 尝试请求URL: {url}")
+                response, phases = request_with_retry(
+                    _get_session(),
+                    "POST",
+                    url,
+                    max_retries=conf().get("fastgpt_max_retries", 2),
+                    stream=stream,
+                    headers=self._get_headers(),
+                    json=payload,
+                    timeout=conf().get("request_timeout", 180)
+                )
+                for phase, cost in phases.items():
+                    _latency[phase].record(cost)
+                logger.info("[FastGPT] url={}, status={}, connect={:.0f}ms, ttfb={:.0f}ms, total={:.0f}ms".format(
+                    url, response.status_code, phases["connect"] * 1000, phases["ttfb"] * 1000, phases["total"] * 1000))
+
+                if response.status_code == 200:
+                    _endpoint_cache[self.api_base] = url
+                    return response if stream else response.json()
+                elif response.status_code == 404:
+                    last_error = f"404 错误: {response.text}"
+                else:
+                    last_error = f"请求失败: status_code={response.status_code}, response={response.text}"
+            except Exception as e:
+                last_error = f"请求异常: {str(e)}"
+            if url == cached_url:  # 已缓存的URL失败，清除缓存并重新探测
+                _endpoint_cache.pop(self.api_base, None)
+
+        error_msg = f"FastGPT API 所有请求都失败: {last_error}"
+        logger.error(error_msg)
+        return {
+            "error": error_msg
+        }
+
     def chat_completion(
         self,
         messages: List[Dict[str, str]],
@@ -39,7 +125,7 @@ class FastGPTClient:
         **kwargs
     ) -> Dict[str, Any]:
         """发送聊天请求
-        
+
         Args:
             messages: 消息历史记录，结构与 GPT 接口 chat 模式一致
             chat_id: 对话ID，如果传入则使用 FastGPT 的上下文功能
@@ -47,72 +133,14 @@ class FastGPTClient:
             variables: 模块变量，用于替换模块中的 {{key}}
             detail: 是否返回中间值
             **kwargs: 其他参数
-        
+
         Returns:
             Dict[str, Any]: FastGPT 的响应
         """
         try:
-            # 构建基础请求体
-            payload = {
-                "messages": messages,
-                "stream": False,
-                "detail": detail
-            }
-            
-            # 添加会话ID（如果不传入则不使用 FastGPT 的上下文功能）
-            if chat_id:
-                if len(chat_id) >= 250:
-                    logger.warning(f"[FastGPT] chat_id 长度超过250: {chat_id}")
-                    chat_id = chat_id[:250]  # 截断以确保符合要求
-                payload["chatId"] = chat_id
-                
-            # 添加响应消息ID
-            if response_chat_item_id:
-                payload["responseChatItemId"] = response_chat_item_id
-                
-            # 添加模块变量
-            if variables:
-                payload["variables"] = variables
-                
-            payload.update(kwargs)
-            
-            urls_to_try = [
-                f"{self.api_base}/chat/completions",
-                f"{self.api_base}/v1/chat/completions",
-                f"{self.api_base}/api/v1/chat/completions"
-            ]
-            
-            last_error = None
-            for url in urls_to_try:
-                try:
-                    logger.info(f"[FastGPT] 尝试请求URL: {url}")
-                    response = requests.post(
-                        url,
-                        headers=self._get_headers(),
-                        json=payload,
-                        timeout=conf().get("request_timeout", 180)
-                    )
-                    
-                    if response.status_code == 404:
-                        last_error = f"404 错误: {response.text}"
-                        continue
-                        
-                    if response.status_code == 200:
-                        return response.json()
-                    else:
-                        last_error = f"请求失败: status_code={response.status_code}, response={response.text}"
-                        continue
-                        
-                except Exception as e:
-                    last_error = f"请求异常: {str(e)}"
-                    continue
-            
-            error_msg = f"FastGPT API 所有请求都失败: {last_error}"
-            logger.error(error_msg)
-            return {
-                "error": error_msg
-            }
-                
+            payload = self._build_payload(messages, chat_id, response_chat_item_id, variables, detail, **kwargs)
+            return self._post(payload)
+
         except Exception as e:
             error_msg = f"FastGPT API 调用异常: {str(e)}"
             logger.error(error_msg)
@@ -120,6 +148,78 @@ class FastGPTClient:
                 "error": error_msg
             }
 
+    def chat_completion_stream(
+        self,
+        messages: List[Dict[str, str]],
+        chat_id: Optional[str] = None,
+        response_chat_item_id: Optional[str] = None,
+        variables: Optional[Dict[str, str]] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """以 SSE 流式模式发送聊天请求，参数与 chat_completion 一致
+
+        Returns:
+            Iterator[str]: 逐段返回的回复文本
+
+        Raises:
+            Exception: 请求失败或流中返回错误
+        """
+        payload = self._build_payload(messages, chat_id, response_chat_item_id, variables, False, **kwargs)
+        payload["stream"] = True
+        response = self._post(payload, stream=True)
+        if isinstance(response, dict):
+            raise Exception(response.get("error"))
+        with response:
+            for event, data in iter_sse_events(response):
+                if data == "[DONE]":
+                    break
+                if event == "error":
+                    raise Exception(f"FastGPT 流式响应错误: {data}")
+                if event not in (None, "answer", "fastAnswer"):  # detail 模式下的其他中间事件
+                    continue
+                try:
+                    chunk = json.loads(data)
+                except json.JSONDecodeError:
+                    logger.warning(f"[FastGPT] 无法解析的流式数据: {data}")
+                    continue
+                content = (chunk.get("choices") or [{}])[0].get("delta", {}).get("content")
+                if content:
+                    yield content
+
+    def _build_payload(
+        self,
+        messages: List[Dict[str, str]],
+        chat_id: Optional[str] = None,
+        response_chat_item_id: Optional[str] = None,
+        variables: Optional[Dict[str, str]] = None,
+        detail: bool = False,
+        **kwargs
+    ) -> Dict[str, Any]:
+        # 构建基础请求体
+        payload = {
+            "messages": messages,
+            "stream": False,
+            "detail": detail
+        }
+
+        # 添加会话ID（如果不传入则不使用 FastGPT 的上下文功能）
+        if chat_id:
+            if len(chat_id) >= 250:
+                logger.warning(f"[FastGPT] chat_id 长度超过250: {chat_id}")
+                chat_id = chat_id[:250]  # 截断以确保符合要求
+            payload["chatId"] = chat_id
+
+        # 添加响应消息ID
+        if response_chat_item_id:
+            payload["responseChatItemId"] = response_chat_item_id
+
+        # 添加模块变量
+        if variables:
+            payload["variables"] = variables
+
+        payload.update(kwargs)
+        return payload
+
     def chat_completion_with_image(
         self,
         messages: List[Dict[str, str]],
@@ -129,14 +229,14 @@ class FastGPTClient:
         **kwargs
     ) -> Dict[str, Any]:
         """发送带图片的聊天请求
-        
+
         Args:
             messages: 消息历史记录
             image_data: 图片数据，可以是URL或base64数据
             is_base64: 是否是base64数据
             chat_id: 会话ID
             **kwargs: 其他参数
-        
+
         Returns:
             Dict[str, Any]: FastGPT 的响应
         """
@@ -177,51 +277,16 @@ class FastGPTClient:
                 "stream": False,
                 "detail": False
             }
-            
+
             if chat_id:
                 payload["chatId"] = chat_id
-                
+
             payload.update(kwargs)
-            
+
             logger.info(f"[FastGPT] 准备发送图片分析请求")
-            
-            urls_to_try = [
-                f"{self.api_base}/chat/completions",
-                f"{self.api_base}/v1/chat/completions",
-                f"{self.api_base}/api/v1/chat/completions"
-            ]
-            
-            last_error = None
-            for url in urls_to_try:
-                try:
-                    logger.info(f"[FastGPT] 尝试请求URL: {url}")
-                    response = requests.post(
-                        url,
-                        headers=self._get_headers(),
-                        json=payload,
-                        timeout=conf().get("request_timeout", 180)
-                    )
-                    
-                    if response.status_code == 404:
-                        last_error = f"404 错误: {response.text}"
-                        continue
-                        
-                    if response.status_code == 200:
-                        return response.json()
-                    else:
-                        last_error = f"请求失败: status_code={response.status_code}, response={response.text}"
-                        continue
-                        
-                except Exception as e:
-                    last_error = f"请求异常: {str(e)}"
-                    continue
-            
-            error_msg = f"FastGPT API 所有请求都失败: {last_error}"
-            logger.error(error_msg)
-            return {
-                "error": error_msg
-            }
-                
+
+            return self._post(payload)
+
         except Exception as e:
             error_msg = f"FastGPT API 调用异常: {str(e)}"
             logger.error(error_msg)
@@ -13,6 +13,7 @@ import web
 from channel.feishu.feishu_message import FeishuMessage
 from bridge.context import Context
 from bridge.reply import Reply, ReplyType
+from common.credential_cache import get_credential_cache
 from common.log import logger
 from common.singleton import singleton
 from config import conf
@@ -24,6 +25,7 @@ import json
 import os
 
 URL_VERIFICATION = "url_verification"
+TOKEN_INVALID_CODES = (99991663, 99991668)  # tenant_access_token无效或已过期
 
 
 @singleton
@@ -95,9 +97,21 @@ class FeiShuChanel(ChatChannel):
             logger.info(f"[FeiShu] send message success")
         else:
             logger.error(f"[FeiShu] send message failed, code={res.get('code')}, msg={res.get('msg')}")
+            if res.get("code") in TOKEN_INVALID_CODES:
+                self._token_cache().invalidate()
 
 
+    def _token_cache(self):
+        return get_credential_cache(f"feishu:{self.feishu_app_id}", self._request_access_token)
+
     def fetch_access_token(self) -> str:
+        try:
+            return self._token_cache().get()
+        except Exception as e:
+            logger.error(f"[FeiShu] fetch token error: {e}")
+            return ""
+
+    def _request_access_token(self):
         url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal/"
         headers = {
             "Content-Type": "application/json"
@@ -107,16 +121,14 @@ class FeiShuChanel(ChatChannel):
             "app_secret": self.feishu_app_secret
         }
         data = bytes(json.dumps(req_body), encoding='utf8')
-        response = requests.post(url=url, data=data, headers=headers)
-        if response.status_code == 200:
-            res = response.json()
-            if res.get("code") != 0:
-                logger.error(f"[FeiShu] get tenant_access_token error, code={res.get('code')}, msg={res.get('msg')}")
-                return ""
-            else:
-                return res.get("tenant_access_token")
-        else:
-            logger.error(f"[FeiShu] fetch token error, res={response}")
+        response = requests.post(url=url, data=data, headers=headers, timeout=(5, 10))
+        if response.status_code != 200:
+            raise Exception(f"res={response}")
+        res = response.json()
+        if res.get("code") != 0:
+            raise Exception(f"get tenant_access_token error, code={res.get('code')}, msg={res.get('msg')}")
+        # expire为剩余有效秒数，通常为7200
+        return res.get("tenant_access_token"), res.get("expire", 7200)
 
 
     def _upload_image_url(self, img_url, access_token):
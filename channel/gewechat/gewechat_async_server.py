@@ -0,0 +1,100 @@
+"""
+基于aiohttp的gewechat回调服务器
+收到回调后立即应答，消息解析和投递在后台线程中进行；文件下载使用sendfile流式发送，不阻塞回调请求
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+from aiohttp import web
+
+from channel.gewechat.gewechat_channel import resolve_tmp_file
+from common.log import logger
+from common.metrics import LatencyStats, register_stats
+
+
+class CallbackServer:
+    def __init__(self, handler, path, workers=2, queue_size=10000):
+        """
+        :param handler: 处理单条回调数据的函数，参数为解析后的json
+        :param path: 回调地址的url path
+        :param workers: 解析和投递回调的后台线程数
+        :param queue_size: 待处理回调的最大数量，超出时返回503，由gewechat重试
+        """
+        self.handler = handler
+        self.path = path
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.handle_latency = LatencyStats()  # 从应答到处理完毕的耗时
+        self.lock = threading.Lock()
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._work, name=f"gewechat_callback_{i}", daemon=True).start()
+
+    def _work(self):
+        while True:
+            body, receive_time = self.queue.get()
+            try:
+                self.handler(json.loads(body))
+            except Exception as e:
+                logger.exception("[gewechat] handle callback error: {}".format(e))
+            finally:
+                self.handle_latency.record(time.monotonic() - receive_time)
+                with self.lock:
+                    self.processed += 1
+
+    async def handle_post(self, request: web.Request):
+        body = await request.read()
+        try:
+            self.queue.put_nowait((body, time.monotonic()))
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            logger.warning("[gewechat] callback queue is full, reject callback")
+            return web.Response(status=503, text="busy")
+        with self.lock:
+            self.accepted += 1
+        return web.Response(text="success")
+
+    async def handle_get(self, request: web.Request):
+        # 向gewechat服务传输语音等文件，但只允许访问tmp目录下的文件
+        file_path = request.query.get("file", "")
+        if not file_path:
+            return web.Response(text="gewechat callback server is running")
+        try:
+            clean_path = resolve_tmp_file(file_path)
+        except PermissionError:
+            raise web.HTTPForbidden()
+        if not os.path.isfile(clean_path):
+            logger.error(f"[gewechat] File not found: {clean_path}")
+            raise web.HTTPNotFound()
+        # FileResponse优先使用sendfile，不支持时分块读取，不会将整个文件读入内存
+        return web.FileResponse(clean_path)
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post(self.path, self.handle_post)
+        app.router.add_get(self.path, self.handle_get)
+        return app
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = {
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "queued": self.queue.qsize(),
+            }
+        stats["handle"] = str(self.handle_latency)
+        return stats
+
+
+def run_callback_server(channel, path, port, workers=2, host="0.0.0.0"):
+    """启动回调服务器，阻塞运行"""
+    server = CallbackServer(channel.handle_callback, path, workers)
+    register_stats("gewechat_callback", server.stats)
+    # 不接管信号处理，保留app.py中注册的退出逻辑
+    web.run_app(server.build_app(), host=host, port=port, print=None, handle_signals=False, access_log=None)
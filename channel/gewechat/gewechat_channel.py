@@ -9,33 +9,17 @@ from bridge.reply import Reply, ReplyType
 from channel.chat_channel import ChatChannel
 from channel.gewechat.gewechat_message import GeWeChatMessage
 from common.log import logger
+from common.metrics import register_stats
+from common.msg_dedup import MessageDeduplicator
 from common.singleton import singleton
 from common.tmp_dir import TmpDir
 from config import conf, save_config, get_appdata_dir
 from lib.gewechat import GewechatClient
-from voice.audio_convert import mp3_to_silk
+from voice.tts_cache import cached_to_silk
 import uuid
-from collections import OrderedDict
-from datetime import datetime, timedelta
 
 MAX_UTF8_LEN = 2048
 
-class ExpiredDict(OrderedDict):
-    def __init__(self, expired_time):
-        self.expired_time = expired_time
-        super().__init__()
-
-    def __setitem__(self, key, value):
-        item = (value, datetime.now() + timedelta(seconds=self.expired_time))
-        super().__setitem__(key, item)
-
-    def __getitem__(self, key):
-        value, expired_time = super().__getitem__(key)
-        if datetime.now() > expired_time:
-            del self[key]
-            raise KeyError(key)
-        return value
-
 @singleton
 class GeWeChatChannel(ChatChannel):
     NOT_SUPPORT_REPLYTYPE = []
@@ -43,8 +27,12 @@ class GeWeChatChannel(ChatChannel):
     def __init__(self):
         super().__init__()
 
-        # 初始化消息缓存，设置过期时间为1小时
-        self.receivedMsgs = ExpiredDict(3600)
+        # 初始化消息去重缓存，gewechat会重试推送回调，按NewMsgId过滤重复消息
+        persist_path = os.path.join(get_appdata_dir(), "gewechat_msg_ids.log") if conf().get("gewechat_dedup_persist") else None
+        self.receivedMsgs = MessageDeduplicator(
+            conf().get("gewechat_dedup_expires", 3600), conf().get("gewechat_dedup_max_size", 100000), persist_path
+        )
+        register_stats("gewechat_dedup", self.receivedMsgs.stats)
 
         self.base_url = conf().get("gewechat_base_url")
         if not self.base_url:
@@ -78,9 +66,10 @@ class GeWeChatChannel(ChatChannel):
         logger.info(f"[gewechat] init: base_url: {self.base_url}, token: {self.token}, app_id: {self.app_id}, download_url: {self.download_url}")
 
     def startup(self):
-        # 重置消息缓存
-        self.receivedMsgs.clear()
-        logger.info("[gewechat] message cache cleared")
+        # 重置消息缓存，持久化时保留重启前收到的消息id，过滤重启期间gewechat重试的回调
+        if not conf().get("gewechat_dedup_persist"):
+            self.receivedMsgs.clear()
+            logger.info("[gewechat] message cache cleared")
 
         # 获取二维码
         qr_response = self.client.get_qr(self.app_id)
@@ -139,10 +128,70 @@ class GeWeChatChannel(ChatChannel):
         # 如果没有指定端口，使用默认端口80
         port = parsed_url.port or 80
         logger.info(f"[gewechat] start callback server: {callback_url}, using port {port}")
+        if conf().get("gewechat_callback_server", "webpy") == "aiohttp":
+            from channel.gewechat.gewechat_async_server import run_callback_server
+            run_callback_server(self, path, port, conf().get("gewechat_callback_workers", 2))
+            return
         urls = (path, "channel.gewechat.gewechat_channel.Query")
         app = web.application(urls, globals(), autoreload=False)
         web.httpserver.runsimple(app.wsgifunc(), ("0.0.0.0", port))
 
+    def handle_callback(self, data):
+        """处理gewechat回调的消息数据，过滤无需处理的消息后投递到消息队列"""
+        logger.debug("[gewechat] receive data: {}".format(data))
+
+        # gewechat服务发送的回调测试消息
+        if isinstance(data, dict) and 'testMsg' in data and 'token' in data:
+            logger.debug(f"[gewechat] 收到gewechat服务发送的回调测试消息")
+            return
+
+        # 在解析消息、下载图片之前过滤重复推送的回调
+        msg_id = None
+        msg_data = data.get('Data') if isinstance(data, dict) else None
+        if isinstance(msg_data, dict):
+            msg_id = msg_data.get('NewMsgId') or msg_data.get('MsgId')
+            if self.receivedMsgs.is_duplicate(msg_id):
+                logger.debug(f"[gewechat] ignore duplicate message, msg_id={msg_id}")
+                return
+        try:
+            self._handle_msg(data)
+        except Exception:
+            # 处理失败的消息不记为已收到，gewechat重试推送时再次处理
+            self.receivedMsgs.forget(msg_id)
+            raise
+
+    def _handle_msg(self, data):
+        gewechat_msg = GeWeChatMessage(data, self.client)
+
+        # 微信客户端的状态同步消息
+        if gewechat_msg.ctype == ContextType.STATUS_SYNC:
+            logger.debug(f"[gewechat] ignore status sync message: {gewechat_msg.content}")
+            return
+
+        # 忽略非用户消息（如公众号、系统通知等）
+        if gewechat_msg.ctype == ContextType.NON_USER_MSG:
+            logger.debug(f"[gewechat] ignore non-user message from {gewechat_msg.from_user_id}: {gewechat_msg.content}")
+            return
+
+        # 忽略来自自己的消息
+        if gewechat_msg.my_msg:
+            logger.debug(f"[gewechat] ignore message from myself: {gewechat_msg.actual_user_id}: {gewechat_msg.content}")
+            return
+
+        # 忽略过期的消息
+        if int(gewechat_msg.create_time) < int(time.time()) - 60 * 5: # 跳过5分钟前的历史消息
+            logger.debug(f"[gewechat] ignore expired message from {gewechat_msg.actual_user_id}: {gewechat_msg.content}")
+            return
+
+        context = self._compose_context(
+            gewechat_msg.ctype,
+            gewechat_msg.content,
+            isgroup=gewechat_msg.is_group,
+            msg=gewechat_msg,
+        )
+        if context:
+            self.produce(context)
+
     def send(self, reply: Reply, context: Context):
         receiver = context["receiver"]
         gewechat_message = context.get("msg")
@@ -158,8 +207,7 @@ class GeWeChatChannel(ChatChannel):
                 content = reply.content
                 if content.endswith('.mp3'):
                     # 如果是mp3文件，转换为silk格式
-                    silk_path = content + '.silk'
-                    duration = mp3_to_silk(content, silk_path)
+                    silk_path, duration = cached_to_silk(content, content + '.silk')
                     callback_url = conf().get("gewechat_callback_url")
                     silk_url = callback_url + "?file=" + silk_path
                     self.client.post_voice(self.app_id, receiver, silk_url, duration)
@@ -188,19 +236,31 @@ class GeWeChatChannel(ChatChannel):
             self.client.post_image(self.app_id, receiver, img_url)
             logger.info("[gewechat] sendImage, receiver={}, url={}".format(receiver, img_url))
 
+def resolve_tmp_file(file_path):
+    """
+    校验回调服务器提供下载的文件路径，只允许访问tmp目录下的文件
+    :return: 清理后的绝对路径，不在tmp目录下时抛出PermissionError
+    """
+    # 使用os.path.abspath清理路径
+    clean_path = os.path.abspath(file_path)
+    # 获取tmp目录的绝对路径
+    tmp_dir = os.path.abspath("tmp")
+    # 检查文件路径是否在tmp目录下
+    if not clean_path.startswith(tmp_dir):
+        logger.error(f"[gewechat] Forbidden access to file outside tmp directory: file_path={file_path}, clean_path={clean_path}, tmp_dir={tmp_dir}")
+        raise PermissionError(file_path)
+    return clean_path
+
+
 class Query:
     def GET(self):
         # 搭建简单的文件服务器，用于向gewechat服务传输语音等文件，但只允许访问tmp目录下的文件
         params = web.input(file="")
         file_path = params.file
         if file_path:
-            # 使用os.path.abspath清理路径
-            clean_path = os.path.abspath(file_path)
-            # 获取tmp目录的绝对路径
-            tmp_dir = os.path.abspath("tmp")
-            # 检查文件路径是否在tmp目录下
-            if not clean_path.startswith(tmp_dir):
-                logger.error(f"[gewechat] Forbidden access to file outside tmp directory: file_path={file_path}, clean_path={clean_path}, tmp_dir={tmp_dir}")
+            try:
+                clean_path = resolve_tmp_file(file_path)
+            except PermissionError:
                 raise web.forbidden()
 
             if os.path.exists(clean_path):
@@ -214,41 +274,5 @@ class Query:
     def POST(self):
         channel = GeWeChatChannel()
         data = json.loads(web.data())
-        logger.debug("[gewechat] receive data: {}".format(data))
-        
-        # gewechat服务发送的回调测试消息
-        if isinstance(data, dict) and 'testMsg' in data and 'token' in data:
-            logger.debug(f"[gewechat] 收到gewechat服务发送的回调测试消息")
-            return "success"
-
-        gewechat_msg = GeWeChatMessage(data, channel.client)
-        
-        # 微信客户端的状态同步消息
-        if gewechat_msg.ctype == ContextType.STATUS_SYNC:
-            logger.debug(f"[gewechat] ignore status sync message: {gewechat_msg.content}")
-            return "success"
-
-        # 忽略非用户消息（如公众号、系统通知等）
-        if gewechat_msg.ctype == ContextType.NON_USER_MSG:
-            logger.debug(f"[gewechat] ignore non-user message from {gewechat_msg.from_user_id}: {gewechat_msg.content}")
-            return "success"
-
-        # 忽略来自自己的消息
-        if gewechat_msg.my_msg:
-            logger.debug(f"[gewechat] ignore message from myself: {gewechat_msg.actual_user_id}: {gewechat_msg.content}")
-            return "success"
-
-        # 忽略过期的消息
-        if int(gewechat_msg.create_time) < int(time.time()) - 60 * 5: # 跳过5分钟前的历史消息
-            logger.debug(f"[gewechat] ignore expired message from {gewechat_msg.actual_user_id}: {gewechat_msg.content}")
-            return "success"
-
-        context = channel._compose_context(
-            gewechat_msg.ctype,
-            gewechat_msg.content,
-            isgroup=gewechat_msg.is_group,
-            msg=gewechat_msg,
-        )
-        if context:
-            channel.produce(context)
+        channel.handle_callback(data)
         return "success"
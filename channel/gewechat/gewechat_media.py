@@ -0,0 +1,102 @@
+"""
+gewechat图片、语音文件的下载
+- 在有界的线程池中下载，回调线程只提交任务，不等待下载完成
+- 按msg_id去重，同一消息只下载一次，prepare()等待进行中的下载而不是重新下载，下载失败后再次调用会重试
+- 文件使用带连接池的session下载，设置超时，流式写入临时文件后再改名，不会读到写了一半的文件
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+from common.expired_dict import ExpiredDict
+from common.handler_pool import HandlerPool
+from common.http_client import create_session
+from common.log import logger
+from common.metrics import LatencyStats, register_stats
+from config import conf
+
+CHUNK_SIZE = 64 * 1024
+
+
+class MediaDownloader:
+    def __init__(self, max_workers=4, timeout=30, keep_seconds=600):
+        """
+        :param max_workers: 同时下载的文件数，也是每个host保持的连接数
+        :param timeout: 连接和读取的超时秒数
+        :param keep_seconds: 下载完成后保留去重记录的秒数
+        """
+        self.pool = HandlerPool("gewechat_media", max_workers)
+        self.session = create_session(max_workers)
+        self.timeout = timeout
+        self.futures = ExpiredDict(keep_seconds, max_size=10000)  # msg_id -> Future
+        self.lock = threading.Lock()
+        self.latency = LatencyStats()
+        self.submitted = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.downloaded_bytes = 0
+
+    def submit(self, key, fn, *args, **kwargs) -> Future:
+        """提交下载任务，同一key已在下载或已下载成功时返回原来的Future"""
+        with self.lock:
+            future = self.futures.get(key)
+            if future is not None and not (future.done() and (future.cancelled() or future.exception())):
+                self.deduplicated += 1
+                return future
+            future = self.pool.submit(self._run, fn, *args, **kwargs)
+            self.futures[key] = future
+            self.submitted += 1
+        return future
+
+    def _run(self, fn, *args, **kwargs):
+        start = time.monotonic()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.latency.record(time.monotonic() - start)
+
+    def download_to_file(self, url, path) -> int:
+        """流式下载url到path，返回文件大小"""
+        tmp_path = path + ".part"
+        size = 0
+        try:
+            with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                with open(tmp_path, "wb") as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):  # 下载中途失败，删除不完整的文件
+                os.remove(tmp_path)
+        self.downloaded_bytes += size
+        return size
+
+    def stats(self) -> dict:
+        return {
+            "pool": "queued={}, active={}".format(self.pool.queued, self.pool.active),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "failed": self.failed,
+            "downloaded_bytes": self.downloaded_bytes,
+            "latency": str(self.latency),
+        }
+
+
+_downloader = None
+_downloader_lock = threading.Lock()
+
+
+def get_media_downloader() -> MediaDownloader:
+    global _downloader
+    if _downloader is None:
+        with _downloader_lock:
+            if _downloader is None:
+                _downloader = MediaDownloader(conf().get("gewechat_media_workers", 4), conf().get("gewechat_media_timeout", 30))
+                register_stats("gewechat_media", _downloader.stats)
+    return _downloader
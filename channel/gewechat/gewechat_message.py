@@ -4,11 +4,11 @@ import re
 from bridge.context import ContextType
 from bridge.context import Context
 from channel.chat_message import ChatMessage
+from channel.gewechat.gewechat_media import get_media_downloader
 from common.log import logger
 from common.tmp_dir import TmpDir
 from config import conf
 from lib.gewechat import GewechatClient
-import requests
 import xml.etree.ElementTree as ET
 import os
 
@@ -301,6 +301,8 @@ import os
 """
 
 class GeWeChatMessage(ChatMessage):
+    deferred_download = True  # 回调时提交到下载线程池，prepare()时等待下载完成
+
     def __init__(self, msg, client: GewechatClient):
         super().__init__(msg)
         self.msg = msg
@@ -360,18 +362,18 @@ class GeWeChatMessage(ChatMessage):
                 # TODO: silk2mp3
                 self.content = silk_file_path
                 logger.debug(f"[gewechat] 收到语音消息，保存到：{silk_file_path}")
+            else:
+                # 回调中没有语音数据，提交到下载线程池，prepare()时等待下载完成
+                self.content = TmpDir().path() + f"voice_{self.msg_id}.silk"
+                self._submit_download()
         elif msg_type == 3:  # Image message
             logger.info("[gewechat] 收到图片消息")
             self.ctype = ContextType.IMAGE
             self.content = TmpDir().path() + str(self.msg_id) + ".png"
             logger.info(f"[gewechat] 设置临时文件路径：{self.content}")
 
-            # 立即下载图片
-            try:
-                self.download_image()
-                logger.info("[gewechat] 图片下载并保存成功")
-            except Exception as e:
-                logger.error(f"[gewechat] 图片下载失败：{e}")
+            # 提交到下载线程池后立即返回，不阻塞回调线程，prepare()时等待下载完成
+            self._submit_download()
 
             # 更新最后的图片上下文
             Context._last_image_context = self
@@ -561,13 +563,23 @@ class GeWeChatMessage(ChatMessage):
 
         self.my_msg = self.msg['Wxid'] == self.from_user_id  # 消息是否来自自己
 
+    def _submit_download(self):
+        """提交下载任务，同一消息只下载一次，返回Future"""
+        download = self.download_image if self.ctype == ContextType.IMAGE else self.download_voice
+        return get_media_downloader().submit(self.msg_id, download)
+
+    def _download_file(self, file_url):
+        download_url = conf().get("gewechat_download_url").rstrip('/')
+        full_url = download_url + '/' + file_url
+        logger.debug(f"[gewechat] 完整下载URL: {full_url}")
+        return get_media_downloader().download_to_file(full_url, self.content)
+
     def download_voice(self):
-        try:
-            voice_data = self.client.download_voice(self.msg['Wxid'], self.msg_id)
-            with open(self.content, "wb") as f:
-                f.write(voice_data)
-        except Exception as e:
-            logger.error(f"[gewechat] Failed to download voice file: {e}")
+        voice_info = self.client.download_voice(self.app_id, self.msg['Data']['Content']['string'], self.msg['Data']['MsgId'])
+        if voice_info['ret'] != 200 or not voice_info['data']:
+            raise Exception(f"获取语音信息失败: {voice_info}")
+        size = self._download_file(voice_info['data']['fileUrl'])
+        logger.info(f"[gewechat] 语音下载成功，数据大小: {size} bytes")
 
     def download_image(self):
         """下载图片
@@ -595,29 +607,15 @@ class GeWeChatMessage(ChatMessage):
             if image_info['ret'] == 200 and image_info['data']:
                 file_url = image_info['data']['fileUrl']
                 logger.info(f"[gewechat] 获取到图片URL: {file_url}")
-                download_url = conf().get("gewechat_download_url").rstrip('/')
-                full_url = download_url + '/' + file_url
-                logger.info(f"[gewechat] 完整下载URL: {full_url}")
 
                 try:
-                    logger.info("[gewechat] 开始从URL下载图片...")
-                    response = requests.get(full_url)
-                    image_data = response.content
-                    logger.info(f"[gewechat] 图片下载成功，数据大小: {len(image_data)} bytes")
+                    # 流式写入临时文件
+                    size = self._download_file(file_url)
+                    logger.info(f"[gewechat] 图片下载成功，数据大小: {size} bytes")
                 except Exception as e:
                     error_msg = f"从URL下载图片失败: {e}"
                     logger.error(f"[gewechat] {error_msg}")
                     raise Exception(error_msg)
-
-                try:
-                    logger.info(f"[gewechat] 开始将图片保存到临时文件...")
-                    with open(self.content, "wb") as f:
-                        f.write(image_data)
-                    logger.info("[gewechat] 图片成功保存到临时文件")
-                except Exception as e:
-                    error_msg = f"保存图片到临时文件失败: {e}"
-                    logger.error(f"[gewechat] {error_msg}")
-                    raise Exception(error_msg)
             else:
                 error_msg = f"获取图片信息失败: {image_info}"
                 logger.error(f"[gewechat] {error_msg}")
@@ -626,16 +624,18 @@ class GeWeChatMessage(ChatMessage):
             raise e
 
     def prepare(self):
-        """准备上下文数据，对于图片类型，会下载图片并返回图片的本地路径"""
-        if self.ctype == ContextType.IMAGE:
-            logger.info("[gewechat] 准备图片数据...")
-            try:
-                self.download_image()
-                return self.content
-            except Exception as e:
-                logger.error(f"[gewechat] 图片下载失败: {e}")
-                raise e
-        return self.content
+        """准备上下文数据，对于图片和需要下载的语音，等待下载完成并返回本地路径"""
+        if self._prepared or self.ctype not in [ContextType.IMAGE, ContextType.VOICE] or os.path.exists(self.content or ""):
+            return self.content
+        logger.info("[gewechat] 等待媒体文件下载...")
+        try:
+            # 回调时已提交的下载仍在进行或已完成时直接等待其结果，失败后重新提交
+            self._submit_download().result()
+            self._prepared = True
+            return self.content
+        except Exception as e:
+            logger.error(f"[gewechat] 媒体文件下载失败: {e}")
+            raise e
 
     def _is_non_user_message(self, msg_source: str, from_user_id: str) -> bool:
         """检查消息是否来自非用户账号（如公众号、腾讯游戏、微信团队等）
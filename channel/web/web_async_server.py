@@ -0,0 +1,75 @@
+"""
+基于aiohttp的Web Channel服务器
+SSE连接在事件循环中等待消息，不占用线程，可同时保持大量浏览器连接
+"""
+import asyncio
+
+from aiohttp import web
+
+from channel.web.web_channel import format_sse_events
+from common.log import logger
+from config import conf
+
+
+def build_app(channel) -> web.Application:
+    heartbeat_interval = conf().get("web_heartbeat_interval", 15)
+
+    async def sse(request: web.Request):
+        user_id = request.match_info["user_id"]
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "Connection": "keep-alive"}
+        )
+        await response.prepare(request)
+
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def listener():  # 在发送消息的线程中调用
+            loop.call_soon_threadsafe(event.set)
+
+        mailbox = channel.acquire_mailbox(user_id)
+        mailbox.add_listener(listener)
+        cursor = mailbox.start_cursor(request.headers.get("Last-Event-ID"))
+        try:
+            await response.write(b": connected\n\n")
+            while True:
+                # 先清除事件再取消息，取消息之后到达的消息会再次唤醒
+                event.clear()
+                items = mailbox.get_since(cursor)
+                if items:
+                    cursor = items[-1][0]
+                    await response.write(format_sse_events(items).encode("utf-8"))
+                    mailbox.ack(cursor)
+                    continue
+                try:
+                    await asyncio.wait_for(event.wait(), heartbeat_interval)
+                except asyncio.TimeoutError:
+                    await response.write(b": heartbeat\n\n")
+        except ConnectionResetError:
+            pass
+        except Exception as e:
+            logger.error(f"SSE Error: {e}")
+        finally:
+            mailbox.remove_listener(listener)
+            channel.release_mailbox(user_id)
+        return response
+
+    async def message(request: web.Request):
+        data = await request.read()
+        # 组装上下文可能调用插件，放到线程中执行
+        result = await asyncio.get_running_loop().run_in_executor(None, channel.handle_message, data)
+        return web.Response(text=result, content_type="application/json")
+
+    async def chat(request: web.Request):
+        return web.Response(text=channel.chat_page(), content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/sse/{user_id}", sse)
+    app.router.add_post("/message", message)
+    app.router.add_get("/chat", chat)
+    return app
+
+
+def run_web_server(channel, port, host="0.0.0.0"):
+    """启动Web Channel服务器，阻塞运行"""
+    web.run_app(build_app(channel), host=host, port=port, print=None, handle_signals=False, access_log=None)
@@ -1,8 +1,9 @@
 import sys
+import threading
 import time
 import web
 import json
-from queue import Queue
+from collections import deque
 from bridge.context import *
 from bridge.reply import Reply, ReplyType
 from channel.chat_channel import ChatChannel, check_prefix
@@ -31,9 +32,80 @@ class WebMessage(ChatMessage):
         self.other_user_id = other_user_id
 
 
+class UserMailbox:
+    """
+    单个用户待推送的消息，每条消息有递增的事件id
+    已推送的消息保留在有限长度的缓冲区中，断线重连时可按Last-Event-ID补发
+    """
+
+    def __init__(self, max_size=100):
+        self.messages = deque(maxlen=max_size)  # (event_id, message)
+        self.last_id = 0  # 最新一条消息的事件id
+        self.delivered_id = 0  # 已推送给任一连接的最大事件id
+        self.connections = 0
+        self.cond = threading.Condition()
+        self.listeners = []  # 有新消息时在发送线程中调用，用于唤醒异步连接
+
+    def put(self, message) -> int:
+        with self.cond:
+            self.last_id += 1
+            self.messages.append((self.last_id, message))
+            self.cond.notify_all()
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener()
+        return self.last_id
+
+    def add_listener(self, listener):
+        with self.cond:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.cond:
+            self.listeners.remove(listener)
+
+    def start_cursor(self, last_event_id=None) -> int:
+        """新连接的起始位置：有Last-Event-ID时从该id之后补发，否则从未推送过的消息开始"""
+        with self.cond:
+            if last_event_id:
+                try:
+                    return min(int(last_event_id), self.last_id)
+                except ValueError:
+                    pass
+            return self.delivered_id
+
+    def get_since(self, cursor):
+        """取出事件id大于cursor的所有消息"""
+        with self.cond:
+            if cursor >= self.last_id:
+                return []
+            return [item for item in self.messages if item[0] > cursor]
+
+    def ack(self, event_id):
+        """消息写出成功后确认，已断开的连接写出失败不会确认，新连接仍能收到"""
+        with self.cond:
+            self.delivered_id = max(self.delivered_id, event_id)
+
+    def wait(self, cursor, timeout):
+        """阻塞等待cursor之后的消息，超时返回空列表"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.last_id > cursor, timeout)
+            return self.get_since(cursor)
+
+    def has_undelivered(self):
+        with self.cond:
+            return self.last_id > self.delivered_id
+
+
+def format_sse_events(items) -> str:
+    """将多条消息拼接为一次写入的SSE事件"""
+    return "".join(f"id: {event_id}\ndata: {json.dumps(message)}\n\n" for event_id, message in items)
+
+
 @singleton
 class WebChannel(ChatChannel):
     NOT_SUPPORT_REPLYTYPE = [ReplyType.VOICE]
+    reply_in_ingress = True  # 消息推送给连接在主进程上的SSE客户端
     _instance = None
     
     # def __new__(cls):
@@ -43,7 +115,8 @@ class WebChannel(ChatChannel):
 
     def __init__(self):
         super().__init__()
-        self.message_queues = {}  # 为每个用户存储一个消息队列
+        self.mailboxes = {}  # 为每个用户存储一个消息队列
+        self.mailboxes_lock = threading.RLock()
         self.msg_id_counter = 0  # 添加消息ID计数器
 
     def _generate_msg_id(self):
@@ -51,6 +124,30 @@ class WebChannel(ChatChannel):
         self.msg_id_counter += 1
         return str(int(time.time())) + str(self.msg_id_counter)
 
+    def get_mailbox(self, user_id) -> UserMailbox:
+        with self.mailboxes_lock:
+            mailbox = self.mailboxes.get(user_id)
+            if mailbox is None:
+                mailbox = UserMailbox(conf().get("web_queue_max_size", 100))
+                self.mailboxes[user_id] = mailbox
+            return mailbox
+
+    def acquire_mailbox(self, user_id) -> UserMailbox:
+        with self.mailboxes_lock:
+            mailbox = self.get_mailbox(user_id)
+            mailbox.connections += 1
+            return mailbox
+
+    def release_mailbox(self, user_id):
+        with self.mailboxes_lock:
+            mailbox = self.mailboxes.get(user_id)
+            if mailbox is None:
+                return
+            mailbox.connections -= 1
+            # 没有连接且消息都已推送时删除，否则保留到用户重新连接
+            if mailbox.connections <= 0 and not mailbox.has_undelivered():
+                del self.mailboxes[user_id]
+
     def send(self, reply: Reply, context: Context):
         try:
             if reply.type == ReplyType.IMAGE:
@@ -82,17 +179,14 @@ class WebChannel(ChatChannel):
             # 获取用户ID，如果没有则使用默认值
             # user_id = getattr(context.get("session", None), "session_id", "default_user")
             user_id = context["receiver"]
-            # 确保用户有对应的消息队列
-            if user_id not in self.message_queues:
-                self.message_queues[user_id] = Queue()
-                
             # 将消息放入对应用户的队列
             message_data = {
                 "type": str(reply.type),
                 "content": reply.content,
                 "timestamp": time.time()
             }
-            self.message_queues[user_id].put(message_data)
+            with self.mailboxes_lock:  # 避免与连接断开时删除队列并发，导致消息放入已删除的队列
+                self.get_mailbox(user_id).put(message_data)
             logger.debug(f"Message queued for user {user_id}")
             
         except Exception as e:
@@ -106,38 +200,35 @@ class WebChannel(ChatChannel):
         web.header('Content-Type', 'text/event-stream')
         web.header('Cache-Control', 'no-cache')
         web.header('Connection', 'keep-alive')
-        
-        # 确保用户有消息队列
-        if user_id not in self.message_queues:
-            self.message_queues[user_id] = Queue()
-        
-        try:    
+
+        heartbeat_interval = conf().get("web_heartbeat_interval", 15)
+        mailbox = self.acquire_mailbox(user_id)
+        cursor = mailbox.start_cursor(web.ctx.env.get("HTTP_LAST_EVENT_ID"))
+        try:
+            yield f": connected\n\n"
             while True:
-                try:
-                    # 发送心跳
+                # 阻塞等待新消息，一次写出所有待推送的消息，空闲时才发送心跳
+                items = mailbox.wait(cursor, heartbeat_interval)
+                if items:
+                    cursor = items[-1][0]
+                    yield format_sse_events(items)
+                    mailbox.ack(cursor)
+                else:
                     yield f": heartbeat\n\n"
-                    
-                    # 非阻塞方式获取消息
-                    if not self.message_queues[user_id].empty():
-                        message = self.message_queues[user_id].get_nowait()
-                        yield f"data: {json.dumps(message)}\n\n"
-                    time.sleep(0.5)
-                except Exception as e:
-                    logger.error(f"SSE Error: {e}")
-                    break
+        except Exception as e:
+            logger.error(f"SSE Error: {e}")
         finally:
             # 清理资源
-            if user_id in self.message_queues:
-                # 只有当队列为空时才删除
-                if self.message_queues[user_id].empty():
-                    del self.message_queues[user_id]
+            self.release_mailbox(user_id)
 
     def post_message(self):
         """
         Handle incoming messages from users via POST request.
         """
+        return self.handle_message(web.data())  # 获取原始POST数据
+
+    def handle_message(self, data):
         try:
-            data = web.data()  # 获取原始POST数据
             json_data = json.loads(data)
             user_id = json_data.get('user_id', 'default_user')
             prompt = json_data.get('message', '')
@@ -185,6 +276,10 @@ class WebChannel(ChatChannel):
             '/chat', 'ChatHandler', 
         )
         port = conf().get("web_port", 9899)
+        if conf().get("web_server", "webpy") == "aiohttp":
+            from channel.web.web_async_server import run_web_server
+            run_web_server(self, port)
+            return
         app = web.application(urls, globals(), autoreload=False)
         web.httpserver.runsimple(app.wsgifunc(), ("0.0.0.0", port))
 
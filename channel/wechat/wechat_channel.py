@@ -156,7 +156,9 @@ class WechatChannel(ChatChannel):
             time.sleep(2)
             self.auto_login_times += 1
             if self.auto_login_times < 3:
-                chat_channel.handler_pool._shutdown = False
+                for pool in chat_channel.handler_pools.values():
+                    if pool.is_shutdown:
+                        pool.reopen()
                 self.startup()
         except Exception as e:
             pass
@@ -19,7 +19,7 @@ from common.log import logger
 from common.singleton import singleton
 from common.utils import compress_imgfile, fsize, split_string_by_utf8_length, convert_webp_to_png, remove_markdown_symbol
 from config import conf, subscribe_msg
-from voice.audio_convert import any_to_amr, split_audio
+from voice.tts_cache import cached_to_amr_segments
 
 MAX_UTF8_LEN = 2048
 
@@ -66,8 +66,7 @@ class WechatComAppChannel(ChatChannel):
                 media_ids = []
                 file_path = reply.content
                 amr_file = os.path.splitext(file_path)[0] + ".amr"
-                any_to_amr(file_path, amr_file)
-                duration, files = split_audio(amr_file, 60 * 1000)
+                duration, files = cached_to_amr_segments(file_path, amr_file, 60 * 1000)
                 if len(files) > 1:
                     logger.info("[wechatcom] voice too long {}s > 60s , split into {} parts".format(duration / 1000.0, len(files)))
                 for path in files:
@@ -16,11 +16,13 @@ from bridge.reply import Reply, ReplyType
 from channel.chat_channel import ChatChannel
 from channel.wechatcom.wechatcomapp_client import WechatComAppClient
 from channel.wechatcs.wechatcomservice_message import WechatComServiceMessage
+from channel.wechatcs.wechatcomservice_sync import KfMessageSyncer
 from common.log import logger
+from common.metrics import register_stats
 from common.singleton import singleton
 from common.utils import compress_imgfile, fsize, split_string_by_utf8_length
-from config import conf, subscribe_msg
-from voice.audio_convert import any_to_amr, split_audio
+from config import conf, get_appdata_dir, subscribe_msg
+from voice.tts_cache import cached_to_amr_segments
 
 import web
 import json
@@ -31,6 +33,7 @@ from wechatpy.exceptions import InvalidSignatureException
 from wechatpy.enterprise.exceptions import InvalidCorpIdException
 
 MAX_UTF8_LEN = 2048
+MSG_ORIGIN_CUSTOMER = 3  # 消息来源：3为微信客户发送的消息，4为系统事件，5为接待人员发送的消息
 
 
 @singleton
@@ -54,6 +57,10 @@ class WechatComServiceChannel(ChatChannel):
         )
         self.crypto = WeChatCrypto(self.token, self.aes_key, self.corp_id)
         self.client = WechatComAppClient(self.corp_id, self.secret)
+        self.syncer = KfMessageSyncer(
+            self.fetch_sync_page, self.handle_sync_message, os.path.join(get_appdata_dir(), "wechatcs_cursors.json")
+        )
+        register_stats("wechatcs_sync", self.syncer.stats)
 
     def startup(self):
         # start message listener
@@ -83,8 +90,7 @@ class WechatComServiceChannel(ChatChannel):
                 media_ids = []
                 file_path = reply.content
                 amr_file = os.path.splitext(file_path)[0] + ".amr"
-                any_to_amr(file_path, amr_file)
-                duration, files = split_audio(amr_file, 60 * 1000)
+                duration, files = cached_to_amr_segments(file_path, amr_file, 60 * 1000)
                 if len(files) > 1:
                     logger.info(
                         "[wechatcs] voice too long {}s > 60s , split into {} parts".format(duration / 1000.0,
@@ -247,23 +253,19 @@ class WechatComServiceChannel(ChatChannel):
             print(f"Something error: {response}")
         return response
 
-    def get_latest_message(self, token, open_kfid, next_cursor=""):
-        logger.debug(f"self.client.fetch_access_token():{self.client.fetch_access_token()}")
+    def fetch_sync_page(self, token, open_kfid, cursor=""):
+        """拉取一页客服消息，返回sync_msg接口的响应，失败时返回None"""
         url = f"https://qyapi.weixin.qq.com/cgi-bin/kf/sync_msg?access_token={self.client.fetch_access_token()}"
         data = {
             "token": token,
             "open_kfid": open_kfid,
             "limit": 1000
         }
-        if next_cursor:
-            data["cursor"] = next_cursor
+        if cursor:
+            data["cursor"] = cursor
 
-        response = requests.post(url, json=data)
+        response = requests.post(url, json=data, timeout=(5, 10))
         response_data = response.json()
-        # if response_data["errcode"] == 0 and response_data["msg_list"]:
-        #     return response_data["msg_list"][-1]  # 返回最新的一条消息
-        # else:
-        #     return None
 
         # 检查是否有错误码并打印相关错误信息
         if response_data.get("errcode") != 0:
@@ -272,10 +274,24 @@ class WechatComServiceChannel(ChatChannel):
             return None
 
         logger.debug(f"response_data:{response_data}")
-        if response_data.get("msg_list"):
-            return response_data["msg_list"][-1]  # 返回最新的一条消息
-        else:
-            return None
+        return response_data
+
+    def handle_sync_message(self, msg):
+        # 只处理微信客户发送的消息，忽略系统事件和接待人员发送的消息
+        if msg.get("origin") != MSG_ORIGIN_CUSTOMER or msg.get("msgtype") not in ("text", "image", "voice"):
+            logger.debug(f"[wechatcs] ignore message: origin={msg.get('origin')}, msgtype={msg.get('msgtype')}")
+            return
+        wechatcom_copy_msg = WechatComServiceMessage(msg=msg, client=self.client)
+        logger.debug(f"[wechatcs] wechatcom_copy_msg: {wechatcom_copy_msg}")
+        context = self._compose_context(
+            wechatcom_copy_msg.ctype,
+            wechatcom_copy_msg.content,
+            isgroup=False,
+            msg=wechatcom_copy_msg,
+        )
+        logger.debug(f"[wechatcs] context: {context}")
+        if context:
+            self.produce(context)
 
 
 class Query:
@@ -317,26 +333,8 @@ class Query:
                 # 示例代码，根据实际情况修改
                 token = xml_tree.find("Token").text
                 open_kfid = xml_tree.find("OpenKfId").text
-                next_cursor = ""  # 第一次请求时不需要提供 cursor
-
-                latest_message = channel.get_latest_message(token, open_kfid, next_cursor)
-                logger.debug(f"[wechatcs] latest_message: {latest_message}")
-                try:
-                    wechatcom_copy_msg = WechatComServiceMessage(msg=latest_message, client=channel.client)
-                    logger.debug(f"[wechatcs] wechatcom_copy_msg: {wechatcom_copy_msg}")
-                except NotImplementedError as e:
-                    logger.debug("[wechatcs] " + str(e))
-                    return "success"
-                context = channel._compose_context(
-                    wechatcom_copy_msg.ctype,
-                    wechatcom_copy_msg.content,
-                    isgroup=False,
-                    msg=wechatcom_copy_msg,
-                )
-                logger.debug(f"[wechatcs] context: {context}")
-                if context:
-                    channel.produce(context)
-                logger.debug(f"[wechatcs] get latest message: {latest_message}")
+                # 在后台按cursor拉取所有新消息，同一客服账号的并发回调合并为一次同步
+                channel.syncer.request_sync(token, open_kfid)
                 return json.dumps({"status": "success"})
             else:
                 return "Unsupported event type"
@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common.log import logger
+
+
+class KfMessageSyncer:
+    """
+    微信客服消息同步
+    - 为每个客服账号(open_kfid)保存next_cursor，按has_more分页拉取，每条新消息按顺序分发
+    - 同一客服账号同一时间只有一个同步任务，同步期间到达的回调合并为同步结束后的一次补充同步
+    - cursor保存到文件，重启后从上次的位置继续
+    - 分发失败的消息先重试，仍失败时不推进cursor，下次同步从该页重新拉取，已分发的消息不会重复分发
+    """
+
+    def __init__(self, fetch_page, dispatch, cursor_path=None, max_workers=4, max_age=300, dispatch_retries=2, retry_interval=1.0, max_failed_syncs=3):
+        """
+        :param fetch_page: fetch_page(token, open_kfid, cursor)，返回sync_msg接口的响应dict，失败时返回None
+        :param dispatch: dispatch(msg)，处理单条消息
+        :param cursor_path: cursor的保存路径，为None时不保存
+        :param max_age: 跳过发送时间早于该秒数的消息，避免首次同步时处理历史消息
+        :param dispatch_retries: 单条消息分发失败后立即重试的次数
+        :param retry_interval: 重试间隔秒数，按重试次数递增
+        :param max_failed_syncs: 同一条消息在这么多次同步中都分发失败时放弃，避免一直阻塞该客服账号
+        """
+        self.fetch_page = fetch_page
+        self.dispatch = dispatch
+        self.cursor_path = cursor_path
+        self.max_age = max_age
+        self.dispatch_retries = dispatch_retries
+        self.retry_interval = retry_interval
+        self.max_failed_syncs = max_failed_syncs
+        self.done_msgids = {}  # open_kfid -> 当前cursor之后已分发的msgid，cursor推进后清空
+        self.failed_syncs = {}  # msgid -> 分发失败的同步次数
+        self.cursors = self._load_cursors()
+        self.pending_tokens = {}  # open_kfid -> 同步进行中收到的最新回调token
+        self.running = set()
+        self.lock = threading.Lock()  # 保护cursors、pending_tokens和running
+        self.save_lock = threading.Lock()  # 多个客服账号同时同步时，串行写入cursor文件
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wechatcs_sync")
+        self.pages = 0
+        self.dispatched = 0
+        self.merged = 0
+        self.dropped = 0
+
+    def request_sync(self, token, open_kfid):
+        """收到客服消息回调时调用，立即返回，在后台线程中同步"""
+        with self.lock:
+            self.pending_tokens[open_kfid] = token
+            if open_kfid in self.running:
+                self.merged += 1
+                return
+            self.running.add(open_kfid)
+        self.executor.submit(self._run, open_kfid)
+
+    def _run(self, open_kfid):
+        while True:
+            with self.lock:
+                token = self.pending_tokens.pop(open_kfid, None)
+                if token is None:
+                    self.running.discard(open_kfid)
+                    return
+            try:
+                self._sync(token, open_kfid)
+            except Exception as e:
+                logger.exception("[wechatcs] sync messages failed, open_kfid={}: {}".format(open_kfid, e))
+
+    def _sync(self, token, open_kfid):
+        while True:
+            with self.lock:
+                cursor = self.cursors.get(open_kfid, "")
+            response = self.fetch_page(token, open_kfid, cursor)
+            if not response:
+                return
+            self.pages += 1
+            min_send_time = time.time() - self.max_age
+            done_msgids = self.done_msgids.setdefault(open_kfid, set())  # 同一客服账号同时只有一个同步任务，无需加锁
+            for msg in response.get("msg_list") or []:
+                msgid = msg.get("msgid")
+                if msg.get("send_time", 0) < min_send_time:
+                    logger.debug("[wechatcs] skip history message, msgid={}".format(msgid))
+                    continue
+                if msgid in done_msgids:
+                    continue
+                if not self._dispatch_with_retry(msg):
+                    return  # 不推进cursor，保持消息顺序，等下次回调重新同步
+                done_msgids.add(msgid)
+            next_cursor = response.get("next_cursor")
+            if next_cursor:
+                with self.lock:
+                    self.cursors[open_kfid] = next_cursor
+                done_msgids.clear()
+                self._save_cursors()
+            if not response.get("has_more"):
+                return
+
+    # 分发单条消息，失败时重试；返回False表示应停止本次同步
+    def _dispatch_with_retry(self, msg) -> bool:
+        msgid = msg.get("msgid")
+        for attempt in range(self.dispatch_retries + 1):
+            try:
+                self.dispatch(msg)
+                self.dispatched += 1
+                self.failed_syncs.pop(msgid, None)
+                return True
+            except Exception as e:
+                logger.warning("[wechatcs] dispatch message failed, msgid={}, attempt={}: {}".format(msgid, attempt + 1, e))
+            if attempt < self.dispatch_retries:
+                time.sleep(self.retry_interval * (attempt + 1))
+        failed_syncs = self.failed_syncs.get(msgid, 0) + 1
+        if failed_syncs >= self.max_failed_syncs:
+            self.failed_syncs.pop(msgid, None)
+            self.dropped += 1
+            logger.error("[wechatcs] give up message after {} failed syncs, msgid={}".format(failed_syncs, msgid))
+            return True
+        self.failed_syncs[msgid] = failed_syncs
+        return False
+
+    def _load_cursors(self) -> dict:
+        if not self.cursor_path or not os.path.exists(self.cursor_path):
+            return {}
+        try:
+            with open(self.cursor_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning("[wechatcs] load sync cursors failed: {}".format(e))
+            return {}
+
+    def _save_cursors(self):
+        if not self.cursor_path:
+            return
+        with self.save_lock:
+            # 在写文件的锁内取快照，后写入的一定是较新的cursor
+            with self.lock:
+                data = json.dumps(self.cursors)
+            tmp_path = self.cursor_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.cursor_path)
+
+    def stats(self) -> dict:
+        return {"pages": self.pages, "dispatched": self.dispatched, "merged_callbacks": self.merged, "dropped": self.dropped}
+
@@ -0,0 +1,61 @@
+"""
+基于aiohttp的公众号被动回复服务器
+等待回复的请求在事件循环中挂起，不占用线程，并发用户数不再受服务器线程数限制
+"""
+import asyncio
+import time
+
+import web as webpy
+from aiohttp import web
+
+from channel.wechatmp.common import verify_server
+from channel.wechatmp.passive_reply import REPLY_WAIT_SECONDS, RETRY_HOLD_SECONDS, PendingReply, begin_request, finish_request
+from channel.wechatmp.wechatmp_channel import WechatMPChannel
+from common.log import logger
+
+
+def _verify(request: web.Request):
+    args = webpy.storage(request.query)
+    try:
+        return args, verify_server(args)
+    except webpy.Forbidden:
+        raise web.HTTPForbidden(text="Invalid signature")
+
+
+async def handle_get(request: web.Request):
+    _, echostr = _verify(request)
+    return web.Response(text=echostr or "")
+
+
+async def handle_post(request: web.Request):
+    args, _ = _verify(request)
+    request_time = time.time()
+    message = await request.read()
+    loop = asyncio.get_running_loop()
+    try:
+        # 解析消息和组装上下文可能调用插件，放到线程中执行
+        peer = request.transport.get_extra_info("peername") or (None, None)
+        result = await loop.run_in_executor(None, begin_request, args, message, request_time, peer[0], peer[1])
+        if isinstance(result, PendingReply):
+            channel = WechatMPChannel()
+            ready = await channel.reply_waiter.wait_async(result.from_user, request_time + REPLY_WAIT_SECONDS - time.time())
+            result = finish_request(result, not ready)
+            if result is None:
+                await asyncio.sleep(RETRY_HOLD_SECONDS)
+                result = "success"
+    except Exception as e:
+        logger.exception(e)
+        result = str(e)
+    return web.Response(text=result if isinstance(result, str) else result.decode("utf-8"))
+
+
+def build_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/wx", handle_get)
+    app.router.add_post("/wx", handle_post)
+    return app
+
+
+def run_passive_reply_server(port, host="0.0.0.0"):
+    """启动被动回复服务器，阻塞运行"""
+    web.run_app(build_app(), host=host, port=port, print=None, handle_signals=False, access_log=None)
@@ -21,7 +21,8 @@ from common.log import logger
 from common.singleton import singleton
 from common.utils import split_string_by_utf8_length, remove_markdown_symbol
 from config import conf
-from voice.audio_convert import any_to_mp3, split_audio
+from voice.audio_convert import any_to_mp3
+from voice.tts_cache import cached_split_audio
 
 # If using SSL, uncomment the following lines, and modify the certificate path.
 # from cheroot.server import HTTPServer
@@ -31,11 +32,70 @@ from voice.audio_convert import any_to_mp3, split_audio
 #         private_key='/ssl/cert.key')
 
 
+class ReplyWaiter:
+    """
+    被动回复的等待：微信服务器的请求等待用户的回复生成
+    channel缓存回复或任务结束时调用notify唤醒等待的请求，同时支持线程和asyncio中等待
+    """
+
+    def __init__(self, is_ready):
+        """:param is_ready: is_ready(from_user)，回复已生成或任务已结束时返回True"""
+        self.is_ready = is_ready
+        self.cond = threading.Condition()
+        self.listeners = defaultdict(list)  # from_user -> 异步等待的唤醒函数
+
+    def notify(self, from_user):
+        with self.cond:
+            self.cond.notify_all()
+            listeners = self.listeners.pop(from_user, [])
+        for listener in listeners:
+            listener()
+
+    def wait(self, from_user, timeout) -> bool:
+        """阻塞等待，返回回复是否已就绪"""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.is_ready(from_user), max(0, timeout))
+
+    async def wait_async(self, from_user, timeout) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max(0, timeout)
+        while True:
+            future = loop.create_future()
+
+            def wake(future=future):
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result(True))
+
+            # 先注册再检查，检查之后的notify会唤醒future
+            with self.cond:
+                self.listeners[from_user].append(wake)
+            if self.is_ready(from_user):
+                self._remove_listener(from_user, wake)
+                return True
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                self._remove_listener(from_user, wake)
+                return False
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                self._remove_listener(from_user, wake)
+                return self.is_ready(from_user)
+
+    def _remove_listener(self, from_user, listener):
+        with self.cond:
+            listeners = self.listeners.get(from_user)
+            if listeners and listener in listeners:
+                listeners.remove(listener)
+                if not listeners:
+                    del self.listeners[from_user]
+
+
 @singleton
 class WechatMPChannel(ChatChannel):
     def __init__(self, passive_reply=True):
         super().__init__()
         self.passive_reply = passive_reply
+        self.reply_in_ingress = passive_reply  # 被动回复由主进程中等待的请求返回
         self.NOT_SUPPORT_REPLYTYPE = []
         appid = conf().get("wechatmp_app_id")
         secret = conf().get("wechatmp_app_secret")
@@ -52,32 +112,39 @@ class WechatMPChannel(ChatChannel):
             self.running = set()
             # Count the request from wechat official server by message_id
             self.request_cnt = dict()
-            # The permanent media need to be deleted to avoid media number limit
-            self.delete_media_loop = asyncio.new_event_loop()
-            t = threading.Thread(target=self.start_loop, args=(self.delete_media_loop,))
-            t.setDaemon(True)
-            t.start()
+            # Wake up the requests waiting for the reply
+            self.reply_waiter = ReplyWaiter(self.is_reply_ready)
 
     def startup(self):
+        port = conf().get("wechatmp_port", 8080)
+        if self.passive_reply and conf().get("wechatmp_server", "webpy") == "aiohttp":
+            from channel.wechatmp.passive_reply_async import run_passive_reply_server
+            run_passive_reply_server(port)
+            return
         if self.passive_reply:
             urls = ("/wx", "channel.wechatmp.passive_reply.Query")
         else:
             urls = ("/wx", "channel.wechatmp.active_reply.Query")
         app = web.application(urls, globals(), autoreload=False)
-        port = conf().get("wechatmp_port", 8080)
         web.httpserver.runsimple(app.wsgifunc(), ("0.0.0.0", port))
 
-    def start_loop(self, loop):
-        asyncio.set_event_loop(loop)
-        loop.run_forever()
-
     async def delete_media(self, media_id):
         logger.debug("[wechatmp] permanent media {} will be deleted in 10s".format(media_id))
         await asyncio.sleep(10)
-        self.client.material.delete(media_id)
+        await asyncio.get_running_loop().run_in_executor(None, self.client.material.delete, media_id)
         logger.info("[wechatmp] permanent media {} has been deleted".format(media_id))
 
+    def is_reply_ready(self, from_user):
+        return from_user not in self.running or bool(self.cache_dict.get(from_user))
+
     def send(self, reply: Reply, context: Context):
+        try:
+            self._do_send(reply, context)
+        finally:
+            if self.passive_reply:  # 回复已缓存，唤醒等待回复的请求
+                self.reply_waiter.notify(context["receiver"])
+
+    def _do_send(self, reply: Reply, context: Context):
         receiver = context["receiver"]
         if self.passive_reply:
             if reply.type == ReplyType.TEXT or reply.type == ReplyType.INFO or reply.type == ReplyType.ERROR:
@@ -86,7 +153,7 @@ class WechatMPChannel(ChatChannel):
                 self.cache_dict[receiver].append(("text", reply_text))
             elif reply.type == ReplyType.VOICE:
                 voice_file_path = reply.content
-                duration, files = split_audio(voice_file_path, 60 * 1000)
+                duration, files = cached_split_audio(voice_file_path, 60 * 1000)
                 if len(files) > 1:
                     logger.info("[wechatmp] voice too long {}s > 60s , split into {} parts".format(duration / 1000.0, len(files)))
 
@@ -204,7 +271,7 @@ class WechatMPChannel(ChatChannel):
                         file_type = "audio/mpeg"
                     logger.info("[wechatmp] file_name: {}, file_type: {} ".format(file_name, file_type))
                     media_ids = []
-                    duration, files = split_audio(file_path, 60 * 1000)
+                    duration, files = cached_split_audio(file_path, 60 * 1000)
                     if len(files) > 1:
                         logger.info("[wechatmp] voice too long {}s > 60s , split into {} parts".format(duration / 1000.0, len(files)))
                     for path in files:
@@ -296,9 +363,11 @@ class WechatMPChannel(ChatChannel):
         logger.debug("[wechatmp] Success to generate reply, msgId={}".format(context["msg"].msg_id))
         if self.passive_reply:
             self.running.remove(session_id)
+            self.reply_waiter.notify(session_id)
 
     def _fail_callback(self, session_id, exception, context, **kwargs):  # 线程异常结束时的回调函数
         logger.exception("[wechatmp] Fail to generate reply to user, msgId={}, exception={}".format(context["msg"].msg_id, exception))
         if self.passive_reply:
             assert session_id not in self.cache_dict
             self.running.remove(session_id)
+            self.reply_waiter.notify(session_id)
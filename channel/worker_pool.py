@@ -0,0 +1,275 @@
+"""
+多进程部署模式
+主进程运行回调服务器、解析消息和组装上下文，会话队列、并发限制和溢出策略仍在主进程中生效，
+轮到处理的上下文按session_id一致性哈希分发给N个worker进程，worker进程运行插件和bot生成回复，处理完后通知主进程
+- 同一session的消息始终由同一个worker处理，主进程按concurrency_in_session限制同时分发的数量
+- 回复需要由主进程发出的通道(公众号被动回复、Web Channel的SSE推送)，worker只交回回复内容，主进程用原上下文发送
+- worker进程异常退出时按原编号重启，哈希环不变，各session仍路由到原来的worker
+- 用户数据通过sqlite后端在进程间共享；bot的会话按session_id固定在一个worker内，无需共享
+"""
+import bisect
+import hashlib
+import multiprocessing
+import pickle
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import Future
+
+from channel.chat_channel import get_handler_pool
+from common.log import logger
+from common.metrics import register_stats
+from config import conf
+
+# 支持多进程模式的回调型通道
+WORKER_CHANNELS = ["gewechat", "wechatmp", "wechatmp_service", "wechatcom_app", "wechatcom_service", "feishu", "web"]
+
+
+class HashRing:
+    """一致性哈希环，每个节点对应replicas个虚拟节点，增减节点时只有少量key改变归属"""
+
+    def __init__(self, nodes, replicas=160):
+        self.replicas = replicas
+        self.keys = []  # 有序的虚拟节点哈希值
+        self.nodes = {}  # 虚拟节点哈希值 -> 节点
+        for node in nodes:
+            self.add_node(node)
+
+    @staticmethod
+    def _hash(key) -> int:
+        # 内置hash()在每个进程中随机化，使用md5保证结果在重启后保持一致
+        return int.from_bytes(hashlib.md5(str(key).encode("utf-8")).digest()[:8], "big")
+
+    def add_node(self, node):
+        for i in range(self.replicas):
+            h = self._hash("{}#{}".format(node, i))
+            if h not in self.nodes:
+                bisect.insort(self.keys, h)
+            self.nodes[h] = node
+
+    def remove_node(self, node):
+        for i in range(self.replicas):
+            h = self._hash("{}#{}".format(node, i))
+            if self.nodes.get(h) == node:
+                del self.nodes[h]
+                self.keys.pop(bisect.bisect_left(self.keys, h))
+
+    def get_node(self, key):
+        if not self.keys:
+            return None
+        idx = bisect.bisect(self.keys, self._hash(key)) % len(self.keys)
+        return self.nodes[self.keys[idx]]
+
+
+class WorkerPool:
+    """
+    管理worker进程，把上下文按session_id路由到worker，并在主进程中处理worker交回的回复
+    """
+
+    def __init__(self, channel, channel_type, workers):
+        self.channel = channel
+        self.channel_type = channel_type
+        self.workers = workers
+        self.ring = HashRing(range(workers))
+        self.mp = multiprocessing.get_context("spawn")  # 主进程已有多个线程，fork后锁的状态不可靠
+        self.in_queues = [self.mp.Queue() for _ in range(workers)]
+        self.out_queue = self.mp.Queue()
+        self.processes = [None] * workers
+        self.lock = threading.Lock()
+        self.started = False
+        self.pending = {}  # ticket -> (worker编号, Future, 主进程中的上下文)
+        self.next_ticket = 0
+        self.dispatched = [0] * workers
+        self.relayed = 0
+        self.restarts = 0
+        self.local_fallbacks = 0
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            # 在第一条消息到达时才启动，此时主进程已完成登录，获取的token、app_id等配置可以传给worker
+            for index in range(self.workers):
+                self._start_worker(index)
+            threading.Thread(target=self._relay_loop, name="worker_relay", daemon=True).start()
+            self.started = True
+        logger.info("[WorkerPool] started {} worker processes for channel {}".format(self.workers, self.channel_type))
+
+    def _start_worker(self, index):
+        process = self.mp.Process(
+            target=_worker_main,
+            args=(self.channel_type, index, dict(conf()), self.in_queues[index], self.out_queue),
+            name="worker-{}".format(index),
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+
+    def dispatch(self, context) -> Future:
+        """
+        代替channel._submit_handle，把上下文发给session_id对应的worker
+        返回的Future在worker处理完后完成，主进程据此释放会话的并发名额、调用成功或失败回调
+        """
+        if not self.started:
+            self.start()
+        future = Future()
+        # 准备函数可能需要下载语音、图片，放到处理线程池中执行，不阻塞consume线程
+        get_handler_pool(context).submit(self._send_to_worker, context, future)
+        return future
+
+    def _send_to_worker(self, context, future: Future):
+        if future.cancelled():
+            return
+        session_id = context.get("session_id", 0)
+        msg = context.get("msg")
+        with self.lock:
+            self.next_ticket += 1
+            ticket = self.next_ticket
+        try:
+            if msg is not None and hasattr(msg, "prepare"):
+                msg.prepare()  # 准备函数依赖主进程中的对象，先下载好语音、图片再发给worker
+            data = pickle.dumps((ticket, context))
+        except Exception as e:
+            # 插件放入了无法序列化的对象等情况，在主进程中处理
+            logger.warning("[WorkerPool] context can not be sent to worker, handle locally, session_id={}: {}".format(session_id, e))
+            self.local_fallbacks += 1
+            self._handle_locally(context, future)
+            return
+        index = self.ring.get_node(session_id)
+        with self.lock:
+            self.pending[ticket] = (index, future, context)
+            self.dispatched[index] += 1
+        self.in_queues[index].put(data)
+
+    def _handle_locally(self, context, future: Future):
+        try:
+            self.channel._handle(context)
+        except Exception as e:
+            _finish(future, exception=e)
+        else:
+            _finish(future)
+
+    def _relay_loop(self):
+        last_check = time.monotonic()
+        while True:
+            try:
+                item = pickle.loads(self.out_queue.get(timeout=1))
+                self._handle_relay(item)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                logger.exception("[WorkerPool] handle relayed reply failed: {}".format(e))
+            if time.monotonic() - last_check > 5:
+                last_check = time.monotonic()
+                self._check_workers()
+
+    def _handle_relay(self, item):
+        kind, ticket, payload = item
+        with self.lock:
+            if kind == "done":
+                pending = self.pending.pop(ticket, None)
+            else:
+                pending = self.pending.get(ticket)
+        if pending is None:
+            logger.warning("[WorkerPool] relayed {} for unknown context, ticket={}".format(kind, ticket))
+            return
+        _, future, context = pending
+        if kind == "send":
+            self.relayed += 1
+            self.channel.send(payload, context)
+        elif kind == "done":
+            _finish(future, exception=Exception(payload) if payload else None)
+
+    def _check_workers(self):
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.error("[WorkerPool] worker {} exited with code {}, restarting".format(index, process.exitcode))
+                self.restarts += 1
+                # 已发给该worker的上下文不会再有结果，按失败处理，释放会话的并发名额
+                with self.lock:
+                    lost = [ticket for ticket, (i, _, _) in self.pending.items() if i == index]
+                    futures = [self.pending.pop(ticket)[1] for ticket in lost]
+                for future in futures:
+                    _finish(future, exception=Exception("worker {} exited".format(index)))
+                self._start_worker(index)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "alive": sum(1 for p in self.processes if p is not None and p.is_alive()),
+            "dispatched": str(self.dispatched),
+            "pending": len(self.pending),
+            "relayed": self.relayed,
+            "restarts": self.restarts,
+            "local_fallbacks": self.local_fallbacks,
+        }
+
+
+def attach_worker_pool(channel, channel_type):
+    """
+    开启多进程模式，消息仍经channel.produce排队，轮到处理时分发给worker进程，返回WorkerPool
+    通道不支持多进程模式时返回None，仍在当前进程中处理
+    """
+    workers = conf().get("worker_processes", 1)
+    if workers <= 1:
+        return None
+    if channel_type not in WORKER_CHANNELS:
+        logger.warning("[WorkerPool] channel {} does not support worker_processes, run in single process".format(channel_type))
+        return None
+    if conf().get("user_data_backend", "sqlite") != "sqlite":
+        logger.warning("[WorkerPool] user data is not shared between workers unless user_data_backend is sqlite")
+    pool = WorkerPool(channel, channel_type, workers)
+    channel._submit_handle = pool.dispatch
+    register_stats("workers", pool.stats)
+    return pool
+
+
+def _worker_main(channel_type, index, config_dict, in_queue, out_queue):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C由主进程处理，worker随主进程退出
+    import config
+
+    config.load_config()
+    config.conf().update(config_dict)  # 使用主进程的配置，包括环境变量覆盖和运行时获取的token等
+
+    from channel import channel_factory
+    from plugins import PluginManager
+
+    channel = channel_factory.create_channel(channel_type)
+    PluginManager().load_plugins()
+    if channel.reply_in_ingress:
+        _relay_to_ingress(channel, out_queue)
+    logger.info("[WorkerPool] worker {} ready, pid={}".format(index, multiprocessing.current_process().pid))
+    while True:
+        ticket, context = pickle.loads(in_queue.get())
+        _handle_in_worker(channel, ticket, context, out_queue)
+
+
+def _handle_in_worker(channel, ticket, context, out_queue):
+    """排队和并发限制已在主进程中完成，worker直接提交到处理线程池，处理完后通知主进程"""
+    context["worker_ticket"] = ticket
+
+    def done(future: Future):
+        exception = future.exception()
+        out_queue.put(pickle.dumps(("done", ticket, repr(exception) if exception else None)))
+
+    get_handler_pool(context).submit(channel._handle, context).add_done_callback(done)
+
+
+def _relay_to_ingress(channel, out_queue):
+    """回复需要由主进程发出的通道，只把回复交回主进程，由主进程用原上下文发送"""
+
+    def send(reply, context):
+        # worker中的上下文带有channel等无法序列化的对象，只传ticket，主进程据此找到原上下文
+        out_queue.put(pickle.dumps(("send", context.get("worker_ticket"), reply)))
+
+    channel.send = send
+
+
+def _finish(future: Future, exception=None):
+    if future.done():  # 会话被重置时排队中的Future已取消
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(None)
@@ -0,0 +1,133 @@
+"""
+进程内共享的后台asyncio事件循环
+- 同步代码通过run()/submit()把协程提交到同一个后台线程的事件循环中执行，不再每次asyncio.run()新建和销毁事件循环
+- 延迟任务通过call_later()登记在事件循环上，不需要为每个任务单独启动线程或事件循环
+- 提供共享的aiohttp连接器，协程中的请求复用DNS缓存和keep-alive连接
+- 事件循环中只能执行非阻塞的协程，阻塞调用需要用run_in_executor放到线程池中
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from common.log import logger
+from common.metrics import LatencyStats, register_stats
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+if aiohttp is not None:
+
+    class SharedConnector(aiohttp.TCPConnector):
+        """多个ClientSession共用的连接器，session关闭时不关闭连接器，由AsyncRuntime.close()关闭"""
+
+        def close(self, *args, **kwargs):
+            return asyncio.sleep(0)
+
+        def shutdown(self):
+            return super().close()
+
+
+class AsyncRuntime:
+    def __init__(self, name="async_runtime"):
+        self.name = name
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run_loop, name=name, daemon=True)
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.running = 0
+        self.failed = 0
+        self.latency = LatencyStats()
+        self._connector = None
+        self._session = None
+        self.thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro) -> Future:
+        """提交协程，返回concurrent.futures.Future，可以在任意线程中调用"""
+        start = time.monotonic()
+        with self.lock:
+            self.submitted += 1
+            self.running += 1
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(lambda f: self._on_done(f, start))
+        return future
+
+    def _on_done(self, future: Future, start):
+        self.latency.record(time.monotonic() - start)
+        with self.lock:
+            self.running -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.failed += 1
+
+    def run(self, coro, timeout=None):
+        """在事件循环中执行协程并等待结果，超时后取消协程"""
+        if threading.current_thread() is self.thread:
+            coro.close()
+            raise RuntimeError("[{}] run() cannot be called from the event loop thread".format(self.name))
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def call_later(self, delay, callback, *args):
+        """delay秒后在事件循环线程中调用callback，callback不能阻塞"""
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay, callback, *args)
+
+    def connector(self):
+        """
+        共享的aiohttp连接器，只能在事件循环中调用
+        创建ClientSession时传入connector，session关闭后连接器和其中的连接继续保留
+        """
+        if self._connector is None:
+            self._connector = SharedConnector(limit=100, ttl_dns_cache=300)
+        return self._connector
+
+    def session(self):
+        """共享的aiohttp ClientSession，只能在事件循环中调用"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=self.connector(), connector_owner=False)
+        return self._session
+
+    def close(self):
+        async def _close():
+            if self._session is not None:
+                await self._session.close()
+            if self._connector is not None:
+                await self._connector.shutdown()
+
+        try:
+            self.run(_close(), timeout=5)
+        except Exception as e:
+            logger.warning("[{}] close failed: {}".format(self.name, e))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def stats(self) -> dict:
+        return {
+            "submitted": self.submitted,
+            "running": self.running,
+            "failed": self.failed,
+            "latency": str(self.latency),
+        }
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_async_runtime() -> AsyncRuntime:
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = AsyncRuntime()
+                register_stats("async_runtime", _runtime.stats)
+    return _runtime
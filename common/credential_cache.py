@@ -0,0 +1,136 @@
+import threading
+import time
+
+from common.log import logger
+from common.metrics import register_stats
+
+
+class CredentialCache:
+    """
+    缓存access_token等有有效期的凭证
+    - 并发获取时只有一个线程请求凭证接口，其余线程等待并复用结果
+    - 后台线程在凭证过期前refresh_ahead秒提前刷新，发送消息时无需等待凭证接口
+    """
+
+    def __init__(self, name, fetcher, refresh_ahead=300, expire_margin=60):
+        """
+        :param fetcher: 无参函数，返回(凭证, 有效期秒数)，失败时抛出异常
+        :param refresh_ahead: 距过期少于该秒数时由后台线程提前刷新
+        :param expire_margin: 距过期少于该秒数时视为已过期，同步重新获取
+        """
+        self.name = name
+        self.fetcher = fetcher
+        self.refresh_ahead = refresh_ahead
+        self.expire_margin = expire_margin
+        self.entry = (None, 0)  # (凭证, time.monotonic()下的过期时间)，整体替换保证读取一致
+        self.lock = threading.Lock()  # 保证同一时间只有一个线程请求凭证接口
+        self.attempts = 0  # 已完成的凭证接口请求次数
+        self.last_error = None  # 最近一次请求的异常，成功时为None
+        self.hits = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def get(self):
+        credential, expires_at = self.entry
+        if credential and time.monotonic() < expires_at - self.expire_margin:
+            self.hits += 1
+            return credential
+        attempts = self.attempts
+        with self.lock:
+            # 等待锁期间其他线程可能已获取到新凭证
+            credential, expires_at = self.entry
+            if credential and time.monotonic() < expires_at - self.expire_margin:
+                self.hits += 1
+                return credential
+            if self.attempts != attempts and self.last_error is not None:
+                raise self.last_error  # 等待期间其他线程刚请求失败，共用同一结果，不再接连请求
+            return self._refresh()
+
+    def invalidate(self):
+        """凭证被接口拒绝时调用，下次get时重新获取"""
+        with self.lock:
+            self.entry = (None, 0)
+
+    def refresh_if_needed(self):
+        """即将过期时提前刷新，由后台线程调用"""
+        credential, expires_at = self.entry
+        if not credential or time.monotonic() < expires_at - self.refresh_ahead:
+            return
+        with self.lock:
+            if time.monotonic() < self.entry[1] - self.refresh_ahead:
+                return
+            self._refresh()
+
+    def _refresh(self):
+        try:
+            credential, expires_in = self.fetcher()
+            if not credential:
+                raise Exception("[CredentialCache] {} fetched empty credential".format(self.name))
+        except Exception as e:
+            self.failures += 1
+            self.last_error = e
+            raise
+        finally:
+            self.attempts += 1
+        self.last_error = None
+        self.entry = (credential, time.monotonic() + float(expires_in))
+        self.refreshes += 1
+        logger.debug("[CredentialCache] {} refreshed, expires_in={}s".format(self.name, expires_in))
+        return credential
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "expires_in": max(0, int(self.entry[1] - time.monotonic())),
+        }
+
+
+class _Refresher:
+    """所有凭证共用的后台刷新线程"""
+
+    def __init__(self, interval=30):
+        self.interval = interval
+        self.caches = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def get_or_create(self, name, fetcher, refresh_ahead) -> CredentialCache:
+        with self.lock:
+            cache = self.caches.get(name)
+            if cache is None:
+                cache = CredentialCache(name, fetcher, refresh_ahead)
+                self.caches[name] = cache
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="credential_refresher", daemon=True)
+                self.thread.start()
+            return cache
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                caches = list(self.caches.values())
+            for cache in caches:
+                try:
+                    cache.refresh_if_needed()
+                except Exception as e:
+                    logger.warning("[CredentialCache] refresh {} failed: {}".format(cache.name, e))
+
+    def stats(self) -> dict:
+        with self.lock:
+            caches = list(self.caches.values())
+        return {cache.name: str(cache.stats()) for cache in caches}
+
+
+_refresher = _Refresher()
+register_stats("credentials", _refresher.stats)
+
+
+def get_credential_cache(name, fetcher, refresh_ahead=300) -> CredentialCache:
+    """
+    获取名为name的凭证缓存，不存在时创建并注册到后台刷新线程
+    同一凭证(如同一app_id的token)使用相同的name，在各处共享
+    """
+    return _refresher.get_or_create(name, fetcher, refresh_ahead)
@@ -1,22 +1,84 @@
-from datetime import datetime, timedelta
+import heapq
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
 
 
-class ExpiredDict(dict):
-    def __init__(self, expires_in_seconds):
-        super().__init__()
+class ExpiredDict(MutableMapping):
+    """
+    带过期时间的字典，读取时会刷新过期时间
+    - 使用单调时钟，不受系统时间调整影响
+    - max_size大于0时，超出容量按LRU淘汰最久未访问的key
+    - 过期时间记录在小顶堆中，写入和后台线程定期清理过期项，读取只更新时间不入堆
+    - on_evict(key, value, reason)在key被淘汰时回调，reason为expired或size
+    """
+
+    def __init__(self, expires_in_seconds, max_size=0, on_evict=None):
         self.expires_in_seconds = expires_in_seconds if expires_in_seconds else 3600
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self._data = OrderedDict()  # key -> (value, expiry_time)，按访问顺序排列，用于LRU
+        self._heap = []  # (expiry_time, key)，expiry_time可能已被读取刷新，出堆时再校验
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _sweeper.register(self)
 
     def __getitem__(self, key):
-        value, expiry_time = super().__getitem__(key)
-        if datetime.now() > expiry_time:
-            del self[key]
-            raise KeyError("expired {}".format(key))
-        self.__setitem__(key, value)
-        return value
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                raise KeyError(key)
+            value, expiry_time = item
+            now = time.monotonic()
+            if now > expiry_time:
+                del self._data[key]
+                self.misses += 1
+                evicted = [(key, value, "expired")]
+            else:
+                self._data[key] = (value, now + self.expires_in_seconds)
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+        self._notify_evicted(evicted)
+        raise KeyError("expired {}".format(key))
 
     def __setitem__(self, key, value):
-        expiry_time = datetime.now() + timedelta(seconds=self.expires_in_seconds)
-        super().__setitem__(key, (value, expiry_time))
+        self.set(key, value)
+
+    def set(self, key, value, expires_in_seconds=None):
+        """写入key，expires_in_seconds指定这次写入的过期秒数，默认使用字典的过期时间；读取后仍按字典的过期时间刷新"""
+        with self._lock:
+            now = time.monotonic()
+            expiry_time = now + (self.expires_in_seconds if expires_in_seconds is None else expires_in_seconds)
+            self._data[key] = (value, expiry_time)
+            self._data.move_to_end(key)
+            heapq.heappush(self._heap, (expiry_time, key))
+            evicted = self._purge(now)
+            while self.max_size > 0 and len(self._data) > self.max_size:
+                old_key, (old_value, _) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value, "size"))
+        self._notify_evicted(evicted)
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and time.monotonic() <= item[1]
+
+    def __len__(self):
+        self.purge()
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self.keys())
 
     def get(self, key, default=None):
         try:
@@ -24,19 +86,101 @@ class ExpiredDict(dict):
         except KeyError:
             return default
 
-    def __contains__(self, key):
-        try:
-            self[key]
-            return True
-        except KeyError:
-            return False
-
     def keys(self):
-        keys = list(super().keys())
-        return [key for key in keys if key in self]
+        now = time.monotonic()
+        with self._lock:
+            return [key for key, (_, expiry_time) in self._data.items() if now <= expiry_time]
+
+    def values(self):
+        now = time.monotonic()
+        with self._lock:
+            return [value for value, expiry_time in self._data.values() if now <= expiry_time]
 
     def items(self):
-        return [(key, self[key]) for key in self.keys()]
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (value, expiry_time) in self._data.items() if now <= expiry_time]
 
-    def __iter__(self):
-        return self.keys().__iter__()
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._heap.clear()
+
+    def purge(self):
+        """清理所有已过期的key"""
+        with self._lock:
+            evicted = self._purge(time.monotonic())
+        self._notify_evicted(evicted)
+
+    def _purge(self, now):
+        evicted = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            _, key = heapq.heappop(heap)
+            item = self._data.get(key)
+            if item is None:
+                continue
+            if item[1] <= now:
+                del self._data[key]
+                evicted.append((key, item[0], "expired"))
+            else:  # 读取时刷新过的过期时间，按新的时间重新入堆
+                heapq.heappush(heap, (item[1], key))
+        if len(heap) > 2 * len(self._data) + 64:  # 重复写入同一key会留下冗余的堆节点，过多时重建
+            self._heap = [(expiry_time, key) for key, (_, expiry_time) in self._data.items()]
+            heapq.heapify(self._heap)
+        return evicted
+
+    def _notify_evicted(self, evicted):
+        if not evicted:
+            return
+        with self._lock:
+            self.evictions += len(evicted)
+        if self.on_evict:
+            for key, value, reason in evicted:
+                self.on_evict(key, value, reason)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __repr__(self):
+        return "{}({}, expires_in_seconds={})".format(type(self).__name__, dict(self.items()), self.expires_in_seconds)
+
+
+class _Sweeper:
+    """所有ExpiredDict共用的后台清理线程，避免没有读写的过期key一直占用内存"""
+
+    def __init__(self, interval=60):
+        self.interval = interval
+        self.refs = []  # ExpiredDict不可哈希，用弱引用列表保存
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def register(self, d: ExpiredDict):
+        with self.lock:
+            self.refs.append(weakref.ref(d))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="expired_dict_sweeper", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self.lock:
+                self.refs = [ref for ref in self.refs if ref() is not None]
+                dicts = [ref() for ref in self.refs]
+            for d in dicts:
+                if d is None:
+                    continue
+                try:
+                    d.purge()
+                except Exception:
+                    pass
+
+
+_sweeper = _Sweeper()
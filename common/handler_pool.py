@@ -0,0 +1,83 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class HandlerPool:
+    """
+    可动态调整大小的线程池，统计排队数、执行中数量和利用率
+    调整大小时新建线程池替换旧池，旧池中已提交的任务会继续执行完毕
+    """
+
+    def __init__(self, name, max_workers, initializer=None):
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.initializer = initializer
+        self.lock = threading.Lock()
+        self.queued = 0  # 已提交未开始执行的任务数
+        self.active = 0  # 正在执行的任务数
+        self.completed = 0  # 已执行完毕的任务数
+        self.executor = self._new_executor(self.max_workers)
+
+    def _new_executor(self, max_workers):
+        return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{self.name}_handler", initializer=self.initializer)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        with self.lock:
+            self.queued += 1
+            executor = self.executor
+        future = executor.submit(self._run, fn, *args, **kwargs)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _run(self, fn, *args, **kwargs):
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.completed += 1
+
+    def _on_done(self, future: Future):
+        if future.cancelled():  # 排队中被取消的任务不会执行_run
+            with self.lock:
+                self.queued -= 1
+
+    def resize(self, max_workers):
+        max_workers = int(max_workers)
+        if max_workers < 1:
+            raise ValueError("max_workers must be greater than 0")
+        with self.lock:
+            if max_workers == self.max_workers:
+                return
+            old_executor = self.executor
+            self.executor = self._new_executor(max_workers)
+            self.max_workers = max_workers
+        old_executor.shutdown(wait=False)
+
+    @property
+    def is_shutdown(self) -> bool:
+        return self.executor._shutdown
+
+    def reopen(self):
+        """线程池被关闭后新建线程池，使之可以继续接收任务"""
+        with self.lock:
+            if self.executor._shutdown:
+                self.executor = self._new_executor(self.max_workers)
+
+    def set_initializer(self, initializer):
+        with self.lock:
+            self.initializer = initializer
+            self.executor._initializer = initializer
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "workers": self.max_workers,
+                "active": self.active,
+                "queued": self.queued,
+                "utilization": "{:.0%}".format(self.active / self.max_workers),
+                "completed": self.completed,
+            }
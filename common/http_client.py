@@ -0,0 +1,94 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+
+from common.log import logger
+
+_timing = threading.local()  # 记录当前线程最近一次请求建立连接的耗时
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"}
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.monotonic()
+        super().connect()
+        _timing.connect = time.monotonic() - start
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.monotonic()
+        super().connect()  # 包含TCP和TLS握手
+        _timing.connect = time.monotonic() - start
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """记录建连耗时的连接池适配器，复用长连接时建连耗时为0"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+
+def create_session(pool_size=10) -> requests.Session:
+    """
+    创建带连接池的session，同一host的连接会保持长连接复用
+    :param pool_size: 每个host最多保持的连接数
+    """
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _is_connect_error(e: requests.exceptions.ConnectionError) -> bool:
+    """建连阶段的错误(拒绝连接、DNS解析失败、建连超时)，请求尚未发出，任何方法都可以安全重试"""
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    return isinstance(reason, ConnectTimeoutError)  # NewConnectionError是ConnectTimeoutError的子类
+
+
+def request_with_retry(session: requests.Session, method, url, max_retries=2, backoff=0.5, stream=False, **kwargs):
+    """
+    发送请求，按带抖动的指数退避重试：建连阶段的错误总是重试；请求发出后的连接错误和5xx只对幂等方法重试，
+    避免POST等请求被服务端重复执行；读超时等其他错误不重试
+    :param stream: 为True时不读取响应体，由调用方逐步读取，total等于ttfb
+    :return: (response, phases)，phases为各阶段耗时(秒)：connect建连, ttfb首字节, total总耗时
+    """
+    idempotent = method.upper() in _IDEMPOTENT_METHODS
+    attempt = 0
+    while True:
+        _timing.connect = 0.0
+        start = time.monotonic()
+        try:
+            response = session.request(method, url, stream=True, **kwargs)
+            ttfb = time.monotonic() - start
+            if not stream or response.status_code >= 500:
+                response.content  # 读取完整响应体，连接随后归还连接池
+        except requests.exceptions.ConnectionError as e:
+            if attempt >= max_retries or not (idempotent or _is_connect_error(e)):
+                raise
+            logger.warning("[http_client] connection error, retry {}/{}: {}, {}".format(attempt + 1, max_retries, url, e))
+        else:
+            phases = {"connect": _timing.connect, "ttfb": ttfb, "total": time.monotonic() - start}
+            if response.status_code < 500 or attempt >= max_retries or not idempotent:
+                return response, phases
+            logger.warning("[http_client] server error {}, retry {}/{}: {}".format(response.status_code, attempt + 1, max_retries, url))
+        time.sleep(backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+        attempt += 1
@@ -0,0 +1,61 @@
+import threading
+from collections import deque
+
+
+class LatencyStats:
+    """滑动窗口延迟统计，只保留最近window个样本，用于计算p50/p99等分位数"""
+
+    def __init__(self, window=2048):
+        self.samples = deque(maxlen=window)
+        self.count = 0  # 累计样本数
+        self.total = 0.0  # 累计耗时(秒)
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, p):
+        with self.lock:
+            data = sorted(self.samples)
+        if not data:
+            return 0.0
+        index = min(len(data) - 1, max(0, int(round(p / 100 * len(data))) - 1))
+        return data[index]
+
+    def summary(self) -> dict:
+        """返回单位为毫秒的统计摘要"""
+        return {
+            "count": self.count,
+            "p50_ms": round(self.percentile(50) * 1000, 2),
+            "p99_ms": round(self.percentile(99) * 1000, 2),
+        }
+
+    def __str__(self):
+        s = self.summary()
+        return "count={}, p50={}ms, p99={}ms".format(s["count"], s["p50_ms"], s["p99_ms"])
+
+
+# 各模块注册的统计项，#stats指令会一并展示
+_stats_providers = {}
+
+
+def register_stats(name, provider):
+    """
+    注册统计项
+    :param name: 统计项名称
+    :param provider: 无参函数，返回dict
+    """
+    _stats_providers[name] = provider
+
+
+def collect_stats() -> dict:
+    stats = {}
+    for name, provider in list(_stats_providers.items()):
+        try:
+            stats[name] = provider()
+        except Exception as e:
+            stats[name] = {"error": str(e)}
+    return stats
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+
+from common.expired_dict import ExpiredDict
+from common.log import logger
+
+
+class MessageDeduplicator:
+    """
+    按消息id去重，用于过滤消息平台重试推送的重复回调
+    - 容量和过期时间有上限，超出容量时淘汰最久未出现的id
+    - 指定persist_path时追加写入文件，重启后仍能识别重启前收到的消息
+    """
+
+    def __init__(self, expires_in_seconds=3600, max_size=100000, persist_path=None):
+        self.expires_in_seconds = expires_in_seconds
+        self.persist_path = persist_path
+        self.msg_ids = ExpiredDict(expires_in_seconds, max_size=max_size)  # msg_id -> 过期的时间戳
+        self.lock = threading.Lock()
+        self.duplicates = 0
+        self.file = None
+        self.file_lines = 0
+        if persist_path:
+            self._load()
+
+    def is_duplicate(self, msg_id) -> bool:
+        """检查消息id是否已出现过，未出现过时记录下来；处理失败时需调用forget，让平台重试推送的消息能再次处理"""
+        if msg_id is None:
+            return False
+        msg_id = str(msg_id)
+        with self.lock:
+            if msg_id in self.msg_ids:
+                self.duplicates += 1
+                return True
+            expire_at = time.time() + self.expires_in_seconds
+            self.msg_ids[msg_id] = expire_at
+            if self.file:
+                self._append(msg_id, expire_at)
+        return False
+
+    def forget(self, msg_id):
+        """删除消息id的记录"""
+        if msg_id is None:
+            return
+        msg_id = str(msg_id)
+        with self.lock:
+            if self.msg_ids.pop(msg_id, None) is not None and self.file:
+                self._append(msg_id, 0)  # 过期时间为0的记录在加载时删除之前的记录
+
+    def clear(self):
+        with self.lock:
+            self.msg_ids.clear()
+            if self.file:
+                self._compact()
+
+    def stats(self) -> dict:
+        return {"size": len(self.msg_ids), "duplicates": self.duplicates}
+
+    def _load(self):
+        now = time.time()
+        if os.path.exists(self.persist_path):
+            try:
+                with open(self.persist_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        expire_at, _, msg_id = line.strip().partition(" ")
+                        if not msg_id:
+                            continue
+                        remaining = float(expire_at) - now
+                        if remaining > 0:
+                            self.msg_ids.set(msg_id, float(expire_at), remaining)  # 按剩余时间过期，不重新计时
+                        else:
+                            self.msg_ids.pop(msg_id, None)
+                logger.info("[MessageDeduplicator] loaded {} message ids from {}".format(len(self.msg_ids), self.persist_path))
+            except Exception as e:
+                logger.warning("[MessageDeduplicator] load {} failed: {}".format(self.persist_path, e))
+        self._compact()
+
+    def _append(self, msg_id, expire_at):
+        try:
+            self.file.write("{:.0f} {}\n".format(expire_at, msg_id))
+            self.file.flush()
+            self.file_lines += 1
+            # 文件中过期和被淘汰的记录过多时重写
+            if self.file_lines > 2 * max(len(self.msg_ids), 1000):
+                self._compact()
+        except Exception as e:
+            logger.warning("[MessageDeduplicator] persist message id failed: {}".format(e))
+
+    def _compact(self):
+        if self.file:
+            self.file.close()
+        items = self.msg_ids.items()
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines("{:.0f} {}\n".format(expire_at, msg_id) for msg_id, expire_at in items)
+        os.replace(tmp_path, self.persist_path)
+        self.file = open(self.persist_path, "a", encoding="utf-8")
+        self.file_lines = len(items)
@@ -0,0 +1,303 @@
+"""
+会话持久化存储，bot的会话(对话历史、Dify/Coze的conversation_id等)写入SQLite，重启和重载插件后可以继续之前的对话
+- 写回(write-behind)：会话在内存中修改，后台线程定期把修改过的会话在一个事务中批量写入
+- 懒加载：会话首次访问时才从磁盘读取
+- 内存中最多保留max_resident个会话，超出时按LRU把最久未访问的会话写回磁盘后移出内存
+"""
+import atexit
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+
+from common.expired_dict import ExpiredDict
+from common.log import logger
+from common.metrics import register_stats
+from config import conf, get_appdata_dir
+
+NEVER_EXPIRES = 10 * 365 * 24 * 3600
+
+
+class SQLiteSessionStore:
+    """
+    按(namespace, session_id)保存pickle序列化后的会话，namespace区分不同的会话类型
+    每个线程使用独立连接，WAL模式下多进程共享同一文件也是安全的
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "namespace TEXT NOT NULL, session_id TEXT NOT NULL, value BLOB, updated_at REAL, "
+            "PRIMARY KEY (namespace, session_id)) WITHOUT ROWID"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def load(self, namespace, session_id):
+        """返回(value, updated_at)，不存在时返回None"""
+        return self._conn().execute(
+            "SELECT value, updated_at FROM sessions WHERE namespace = ? AND session_id = ?", (namespace, str(session_id))
+        ).fetchone()
+
+    def write(self, namespace, rows):
+        """在一个事务中批量写入[(session_id, value)]，value为None时删除"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            for session_id, value in rows:
+                if value is None:
+                    conn.execute("DELETE FROM sessions WHERE namespace = ? AND session_id = ?", (namespace, str(session_id)))
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO sessions (namespace, session_id, value, updated_at) VALUES (?, ?, ?, ?)",
+                        (namespace, str(session_id), value, now),
+                    )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self, namespace):
+        self._conn().execute("DELETE FROM sessions WHERE namespace = ?", (namespace,))
+
+    def purge_expired(self, namespace, expires_in_seconds):
+        self._conn().execute(
+            "DELETE FROM sessions WHERE namespace = ? AND updated_at < ?", (namespace, time.time() - expires_in_seconds)
+        )
+
+    def count(self, namespace):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+
+class PersistentSessionDict(MutableMapping):
+    """
+    用法与SessionManager原来使用的dict/ExpiredDict相同，会话对象在内存中被直接修改
+    读取会话即视为可能修改，距最后一次读取settle秒后由后台线程写入，避免写入正在修改中的会话
+    len和遍历只包含内存中的会话
+    """
+
+    def __init__(self, store: SQLiteSessionStore, namespace, max_resident=10000, expires_in_seconds=None, settle=1):
+        self.store = store
+        self.namespace = namespace
+        self.expires_in_seconds = expires_in_seconds
+        self.settle = settle
+        self.resident = ExpiredDict(expires_in_seconds or NEVER_EXPIRES, max_size=max_resident, on_evict=self._on_evict)
+        self.dirty = {}  # session_id -> (会话, 最后访问时间)，等待写入的会话
+        self.pending = {}  # session_id -> 序列化后的会话或None(删除)，已移出内存等待写入
+        self.writing = {}  # 正在写入磁盘的pending，写入完成前读取时以此为准
+        self.lock = threading.RLock()
+        self.loads = 0
+        self.writes = 0
+        self.flushes = 0
+
+    def __getitem__(self, session_id):
+        with self.lock:
+            session = self._get(session_id)
+            self.dirty[session_id] = (session, time.monotonic())
+            return session
+
+    def __contains__(self, session_id):
+        with self.lock:
+            try:
+                self._get(session_id)
+                return True
+            except KeyError:
+                return False
+
+    def __setitem__(self, session_id, session):
+        with self.lock:
+            self.resident[session_id] = session
+            self.dirty[session_id] = (session, time.monotonic())
+
+    def __delitem__(self, session_id):
+        with self.lock:
+            found = session_id in self
+            self.resident.pop(session_id, None)
+            self.dirty.pop(session_id, None)
+            self.pending[session_id] = None
+            if not found:
+                raise KeyError(session_id)
+
+    def __len__(self):
+        return len(self.resident)
+
+    def __iter__(self):
+        return iter(self.resident.keys())
+
+    def clear(self):
+        with self.lock:
+            self.resident.clear()
+            self.dirty.clear()
+            self.pending.clear()
+            self.store.clear(self.namespace)
+
+    def _get(self, session_id):
+        if session_id in self.resident:
+            return self.resident[session_id]
+        session = self._load(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        self.resident[session_id] = session
+        return session
+
+    def _load(self, session_id):
+        if session_id in self.pending:  # 仍保留在pending中等待写入，与之后的修改按顺序写入
+            value = self.pending[session_id]
+        elif session_id in self.writing:
+            value = self.writing[session_id]
+        else:
+            row = self.store.load(self.namespace, session_id)
+            if row is None:
+                return None
+            value, updated_at = row
+            if self.expires_in_seconds and updated_at < time.time() - self.expires_in_seconds:
+                return None
+        if value is None:
+            return None
+        self.loads += 1
+        try:
+            return pickle.loads(value)
+        except Exception as e:
+            logger.warning("[SessionStore] load session {} failed: {}".format(session_id, e))
+            return None
+
+    def _on_evict(self, session_id, session, reason):
+        with self.lock:
+            item = self.dirty.pop(session_id, None)
+            if reason == "expired":
+                self.pending[session_id] = None
+            elif item is not None:  # 超出容量，修改过的会话写回磁盘
+                self.pending[session_id] = pickle.dumps(session)
+
+    def flush(self, force=False):
+        """把修改过的会话写入磁盘，force为True时不等待settle，用于退出前"""
+        now = time.monotonic()
+        with self.lock:
+            ready = [
+                (session_id, session)
+                for session_id, (session, accessed_at) in self.dirty.items()
+                if force or now - accessed_at >= self.settle
+            ]
+            for session_id, _ in ready:
+                del self.dirty[session_id]
+            self.writing, self.pending = self.pending, {}
+            # 在锁内序列化，得到一致的快照；序列化失败的会话留在dirty中，下次重试
+            rows = list(self.writing.items())
+            for session_id, session in ready:
+                try:
+                    rows.append((session_id, pickle.dumps(session)))
+                except Exception as e:
+                    logger.warning("[SessionStore] session {} can not be saved: {}".format(session_id, e))
+                    self.dirty.setdefault(session_id, (session, now))
+        try:
+            if rows:
+                self.store.write(self.namespace, rows)
+                self.writes += len(rows)
+                self.flushes += 1
+        except Exception as e:
+            logger.warning("[SessionStore] write {} sessions failed: {}".format(len(rows), e))
+            with self.lock:  # 下次重试，期间已有新的修改的会话以新的为准
+                for session_id, session in ready:
+                    self.dirty.setdefault(session_id, (session, 0))
+                for session_id, value in self.writing.items():
+                    self.pending.setdefault(session_id, value)
+        finally:
+            with self.lock:
+                self.writing = {}
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "resident": len(self.resident),
+                "dirty": len(self.dirty),
+                "loads": self.loads,
+                "writes": self.writes,
+                "flushes": self.flushes,
+            }
+
+
+class _Flusher:
+    """所有持久化会话共用的后台写入线程，进程退出时写入全部修改"""
+
+    def __init__(self, interval=5):
+        self.interval = interval
+        self.sessions = {}  # namespace -> PersistentSessionDict
+        self.store = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def get_or_create(self, namespace, max_resident, expires_in_seconds) -> PersistentSessionDict:
+        with self.lock:
+            sessions = self.sessions.get(namespace)
+            if sessions is None:
+                if self.store is None:
+                    self.store = SQLiteSessionStore(os.path.join(get_appdata_dir(), "sessions.db"))
+                    atexit.register(self.flush_all)
+                if expires_in_seconds:
+                    self.store.purge_expired(namespace, expires_in_seconds)
+                sessions = PersistentSessionDict(self.store, namespace, max_resident, expires_in_seconds)
+                self.sessions[namespace] = sessions
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="session_flusher", daemon=True)
+                self.thread.start()
+            return sessions
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush_all(force=False)
+
+    def flush_all(self, force=True):
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for s in sessions:
+            try:
+                s.flush(force)
+            except Exception as e:
+                logger.warning("[SessionStore] flush {} failed: {}".format(s.namespace, e))
+
+    def stats(self) -> dict:
+        with self.lock:
+            sessions = list(self.sessions.values())
+        return {s.namespace: str(s.stats()) for s in sessions}
+
+
+_flusher = _Flusher()
+register_stats("sessions", _flusher.stats)
+
+
+def session_namespace(owner, sessioncls, model=None) -> str:
+    """
+    会话的namespace，按使用会话的bot类型、会话类型和模型区分，如ChatGPTBot/ChatGPTSession/gpt-4o
+    多个bot使用同一会话类型，或切换模型后，会话互不影响
+    """
+    parts = [type(owner).__name__ if owner is not None else None, sessioncls.__name__, model]
+    return "/".join(str(part) for part in parts if part)
+
+
+def create_session_dict(namespace):
+    """
+    创建保存会话的dict，session_backend为sqlite时返回持久化的PersistentSessionDict
+    同一namespace的会话共享一个实例，bot重新创建(如#reloadp)后会话仍然保留
+    :param namespace: 由session_namespace生成，不同namespace的会话互不影响
+    """
+    expires_in_seconds = conf().get("expires_in_seconds")
+    if conf().get("session_backend", "memory") != "sqlite":
+        return ExpiredDict(expires_in_seconds) if expires_in_seconds else dict()
+    try:
+        return _flusher.get_or_create(namespace, conf().get("session_max_resident", 10000), expires_in_seconds)
+    except Exception as e:
+        logger.error("[SessionStore] open session store failed, fallback to memory: {}".format(e))
+        return ExpiredDict(expires_in_seconds) if expires_in_seconds else dict()
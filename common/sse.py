@@ -0,0 +1,86 @@
+import re
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import requests
+
+SENTENCE_ENDINGS = "。！？!?；;…\n"
+# 不能在其中切分的片段：markdown链接和图片(包括尚未接收完整的)、URL
+_UNBREAKABLE_RE = re.compile(r"!?\[[^\]\n]*(?:\](?:\([^)\n]*\)?)?)?|https?://[A-Za-z0-9\-._~:/?#\[\]@!$&'()*+,;=%]+")
+
+
+def iter_sse_events(response: requests.Response) -> Iterator[Tuple[Optional[str], str]]:
+    """
+    逐个解析SSE响应中的事件
+    :param response: 以stream=True发起请求的响应
+    :return: (event, data)，未指定event时为None，多行data以换行拼接
+    """
+    event, data_lines = None, []
+    for line in response.iter_lines(decode_unicode=False):
+        line = line.decode("utf-8") if isinstance(line, bytes) else line
+        if not line:  # 空行表示一个事件结束
+            if data_lines:
+                yield event, "\n".join(data_lines)
+            event, data_lines = None, []
+            continue
+        if line.startswith(":"):  # 注释或心跳
+            continue
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            event = value
+        elif field == "data":
+            data_lines.append(value)
+    if data_lines:
+        yield event, "\n".join(data_lines)
+
+
+class SentenceChunker:
+    """
+    将流式返回的文本片段按整句或段落切分
+    缓冲区中完整句子的长度达到min_chunk_size，或距上次输出超过flush_interval秒时输出
+    不在markdown链接、图片和URL内部切分
+    """
+
+    def __init__(self, min_chunk_size=50, flush_interval=3.0):
+        self.min_chunk_size = min_chunk_size
+        self.flush_interval = flush_interval
+        self.buffer = ""
+        self.last_flush_time = time.monotonic()
+
+    def feed(self, text) -> List[str]:
+        self.buffer += text
+        cut = self._last_boundary()
+        if cut <= 0:
+            return []
+        now = time.monotonic()
+        if cut < self.min_chunk_size and now - self.last_flush_time < self.flush_interval:
+            return []
+        chunk, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:]
+        self.last_flush_time = now
+        return [chunk] if chunk else []
+
+    def poll(self) -> List[str]:
+        """流暂时没有新内容时调用，距上次输出超过flush_interval时输出已完整的句子"""
+        return self.feed("")
+
+    def flush(self) -> str:
+        chunk, self.buffer = self.buffer.strip(), ""
+        return chunk
+
+    def _last_boundary(self):
+        buffer = self.buffer
+        spans = [m.span() for m in _UNBREAKABLE_RE.finditer(buffer)]
+        for i in range(len(buffer) - 1, -1, -1):
+            c = buffer[i]
+            if c == ".":
+                if i + 1 >= len(buffer) or buffer[i + 1] not in " \n":  # 英文句号后需有空白，避免切断数字和链接
+                    continue
+            elif c not in SENTENCE_ENDINGS:
+                continue
+            elif c == "!" and i == len(buffer) - 1:  # 可能是图片![...](...)的开头，等待后续内容
+                continue
+            if not any(start <= i < end for start, end in spans):
+                return i + 1
+        return 0
@@ -0,0 +1,144 @@
+"""
+网页链接总结结果的共享缓存
+- 按规范化后的url缓存总结结果，同一篇文章分享到多个群只抓取和总结一次，命中缓存时不发起任何网络请求
+- 同一url正在总结时，后来的请求等待同一个任务的结果(single-flight)，不重复抓取
+- 所有总结任务共用一个并发上限，超出时排队等待
+- 总结失败的结果不缓存，等待同一任务的请求会收到同样的异常
+"""
+import html
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from common.expired_dict import ExpiredDict
+from common.log import logger
+from common.metrics import LatencyStats, register_stats
+from config import conf
+
+# 各网站通用的统计参数，另外所有utm_开头的参数都会去掉
+TRACKING_QUERY_PARAMS = {"spm", "isappinstalled", "share_token", "share_source", "fbclid", "gclid"}
+# 公众号文章分享链接中与内容无关的会话参数，只对mp.weixin.qq.com去掉，其他网站上同名参数可能决定页面内容
+WECHAT_SHARE_PARAMS = {
+    "from", "chksm", "scene", "subscene", "ascene", "clicktime", "enterid", "sessionid", "devicetype", "version", "nettype",
+    "abtest_cookie", "lang", "pass_ticket", "wx_header", "exportkey", "key", "uin", "poc_token", "fasttmpl_type",
+}
+HOST_IGNORED_QUERY_PARAMS = {"mp.weixin.qq.com": WECHAT_SHARE_PARAMS}
+
+
+def normalize_url(url: str) -> str:
+    """
+    规范化url：反转义、协议和域名小写、去掉锚点和统计参数、参数排序
+    """
+    url = html.unescape(url.strip())
+    parts = urlsplit(url)
+    netloc = parts.netloc.lower()
+    ignored = HOST_IGNORED_QUERY_PARAMS.get(parts.hostname or "", ())
+    query = [
+        (k, v)
+        for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in TRACKING_QUERY_PARAMS and k not in ignored and not k.startswith("utm_")
+    ]
+    path = parts.path or "/"
+    return urlunsplit((parts.scheme.lower(), netloc, path, urlencode(sorted(query)), ""))
+
+
+class SummaryCache:
+    def __init__(self, expires_in_seconds=6 * 3600, max_size=2000, max_concurrency=4):
+        self.results = ExpiredDict(expires_in_seconds, max_size=max_size)  # (namespace, url) -> 总结结果
+        self.inflight = {}  # (namespace, url) -> Future
+        self.lock = threading.Lock()
+        self.semaphore = threading.BoundedSemaphore(max(1, max_concurrency))
+        self.latency = LatencyStats()
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0  # 等待进行中任务的请求数
+        self.running = 0
+        self.failed = 0
+
+    def get(self, namespace, url):
+        """只查缓存，未命中返回None"""
+        key = (namespace, normalize_url(url))
+        result = self.results.get(key)
+        if result is not None:
+            with self.lock:
+                self.hits += 1
+        return result
+
+    def get_or_compute(self, namespace, url, compute, timeout=None):
+        """
+        返回url的总结结果，未缓存时调用compute()生成
+        :param namespace: 区分总结方式，如插件名、模型和提示词，不同namespace分别缓存
+        :param compute: 无参函数，返回总结结果，返回None表示失败，不缓存
+        """
+        key = (namespace, normalize_url(url))
+        with self.lock:
+            result = self.results.get(key)
+            if result is not None:
+                self.hits += 1
+                return result
+            future = self.inflight.get(key)
+            if future is not None:
+                self.joined += 1
+                leader = False
+            else:
+                future = Future()
+                self.inflight[key] = future
+                self.misses += 1
+                leader = True
+        if not leader:
+            logger.debug("[SummaryCache] wait for in-flight summary, url={}".format(key[1]))
+            return future.result(timeout)
+
+        try:
+            with self.semaphore:
+                with self.lock:
+                    self.running += 1
+                start = time.monotonic()
+                try:
+                    result = compute()
+                finally:
+                    self.latency.record(time.monotonic() - start)
+                    with self.lock:
+                        self.running -= 1
+            if result is not None:
+                self.results[key] = result
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            with self.lock:
+                self.failed += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses + self.joined
+            return {
+                "size": len(self.results),
+                "hits": self.hits,
+                "misses": self.misses,
+                "joined": self.joined,
+                "hit_rate": "{:.1%}".format((self.hits + self.joined) / total) if total else "-",
+                "running": self.running,
+                "inflight": len(self.inflight),
+                "failed": self.failed,
+                "latency": str(self.latency),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_summary_cache() -> SummaryCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SummaryCache(conf().get("summary_cache_seconds", 6 * 3600), max_concurrency=conf().get("summary_max_concurrency", 4))
+                register_stats("summary_cache", _cache.stats)
+    return _cache
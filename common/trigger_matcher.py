@@ -0,0 +1,157 @@
+"""
+消息触发条件的预编译索引
+- 前缀用trie匹配，关键词用Aho-Corasick自动机匹配，耗时与列表长度无关
+- 群名白名单的判断结果按群名缓存
+- 去除@的正则按名字列表缓存，一次替换去除所有@
+- 配置修改(Config.version变化或重新加载配置)后自动重建
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from config import conf
+
+
+class PrefixMatcher:
+    """与check_prefix结果一致：返回列表中第一个匹配的前缀，没有匹配返回None"""
+
+    def __init__(self, prefixes):
+        self.root = {}
+        self.root_index = None  # 空前缀在列表中的位置
+        for index, prefix in enumerate(prefixes or []):
+            if not prefix:
+                if self.root_index is None:
+                    self.root_index = index
+                continue
+            node = self.root
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            node.setdefault(None, (index, prefix))  # None为结束标记，重复的前缀保留第一个
+
+    def match(self, content):
+        best = (self.root_index, "") if self.root_index is not None else None
+        node = self.root
+        for ch in content:
+            node = node.get(ch)
+            if node is None:
+                break
+            end = node.get(None)
+            if end is not None and (best is None or end[0] < best[0]):
+                best = end
+        return best[1] if best else None
+
+
+class KeywordMatcher:
+    """与check_contain结果一致：文本包含任一关键词返回True，否则返回None"""
+
+    def __init__(self, keywords):
+        keywords = list(keywords or [])
+        self.always = "" in keywords
+        self.goto = [{}]  # 状态 -> {字符: 状态}
+        self.fail = [0]
+        self.output = [False]
+        for word in keywords:
+            s = 0
+            for ch in word:
+                t = self.goto[s].get(ch)
+                if t is None:
+                    t = len(self.goto)
+                    self.goto[s][ch] = t
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(False)
+                s = t
+            self.output[s] = True
+        queue = list(self.goto[0].values())
+        for s in queue:
+            for ch, t in self.goto[s].items():
+                f = self.fail[s]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[t] = self.goto[f].get(ch, 0)
+                self.output[t] = self.output[t] or self.output[self.fail[t]]
+                queue.append(t)
+
+    def match(self, content):
+        if self.always:
+            return True
+        goto, fail, output = self.goto, self.fail, self.output
+        s = 0
+        for ch in content:
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if output[s]:
+                return True
+        return None
+
+
+class TriggerIndex:
+    """根据一份配置预编译的触发条件"""
+
+    MAX_CACHED_GROUPS = 10000
+    MAX_CACHED_PATTERNS = 1000
+
+    def __init__(self, config):
+        self.group_name_white_list = set(config.get("group_name_white_list", []) or [])
+        self.group_name_keyword = KeywordMatcher(config.get("group_name_keyword_white_list", []))
+        self.group_chat_in_one_session = set(config.get("group_chat_in_one_session", []) or [])
+        self.group_chat_prefix = PrefixMatcher(config.get("group_chat_prefix"))
+        self.group_chat_keyword = KeywordMatcher(config.get("group_chat_keyword"))
+        self.single_chat_prefix = PrefixMatcher(config.get("single_chat_prefix", [""]))
+        self.image_create_prefix = PrefixMatcher(config.get("image_create_prefix", [""]))
+        self.nick_name_black_list = set(config.get("nick_name_black_list", []) or [])
+        self.group_at_off = config.get("group_at_off", False)
+        self.trigger_by_self = config.get("trigger_by_self", True)
+        self.always_reply_voice = config.get("always_reply_voice")
+        self.voice_reply_voice = config.get("voice_reply_voice")
+        self.group_decisions = {}  # 群名 -> (是否在白名单中, 是否共享会话)
+        self.at_patterns = OrderedDict()  # 名字元组 -> 编译后的正则
+        self.lock = threading.Lock()
+
+    def group_decision(self, group_name):
+        """返回(群是否在白名单中, 群是否共享会话)"""
+        decision = self.group_decisions.get(group_name)
+        if decision is None:
+            allowed = (
+                group_name in self.group_name_white_list
+                or "ALL_GROUP" in self.group_name_white_list
+                or self.group_name_keyword.match(group_name or "") is not None
+            )
+            shared = group_name in self.group_chat_in_one_session or "ALL_GROUP" in self.group_chat_in_one_session
+            decision = (allowed, shared)
+            if len(self.group_decisions) >= self.MAX_CACHED_GROUPS:
+                self.group_decisions.clear()
+            self.group_decisions[group_name] = decision
+        return decision
+
+    def at_pattern(self, names):
+        """去除@name加空格的正则，较长的名字优先匹配"""
+        key = tuple(names)
+        with self.lock:
+            pattern = self.at_patterns.get(key)
+            if pattern is not None:
+                self.at_patterns.move_to_end(key)
+                return pattern
+        alternatives = "|".join(re.escape(name) for name in sorted(set(names), key=len, reverse=True))
+        pattern = re.compile(f"@(?:{alternatives})(\u2005|\u0020)")
+        with self.lock:
+            self.at_patterns[key] = pattern
+            if len(self.at_patterns) > self.MAX_CACHED_PATTERNS:
+                self.at_patterns.popitem(last=False)
+        return pattern
+
+
+_cached = (None, None)  # (配置标识, 索引)
+
+
+def get_trigger_index() -> TriggerIndex:
+    """返回当前配置对应的索引，配置对象被替换或修改后重建"""
+    global _cached
+    config = conf()
+    key = (id(config), getattr(config, "version", 0))
+    cached_key, index = _cached
+    if key != cached_key:
+        index = TriggerIndex(config)
+        _cached = (key, index)
+    return index
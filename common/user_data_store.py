@@ -0,0 +1,211 @@
+import os
+import pickle
+import sqlite3
+import threading
+
+from common.log import logger
+
+
+class UserDataStore:
+    """
+    用户数据存储后端，按用户和key读写，由Config.get_user_data使用
+    """
+
+    def load(self, user) -> dict:
+        raise NotImplementedError
+
+    def set(self, user, key, value):
+        raise NotImplementedError
+
+    def delete(self, user, key):
+        raise NotImplementedError
+
+    def clear(self, user):
+        raise NotImplementedError
+
+    def save(self):
+        """将内存中的修改落盘，按key写入的后端无需实现"""
+        pass
+
+    def close(self):
+        pass
+
+
+class PickleUserDataStore(UserDataStore):
+    """
+    旧版存储方式，全部数据常驻内存，save时整体写入pickle文件
+    path为None时只保存在内存中
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.RLock()
+        self.datas = {}
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                self.datas = pickle.load(f)
+
+    def load(self, user) -> dict:
+        with self.lock:
+            return dict(self.datas.get(user) or {})
+
+    def set(self, user, key, value):
+        with self.lock:
+            self.datas.setdefault(user, {})[key] = value
+
+    def delete(self, user, key):
+        with self.lock:
+            self.datas.get(user, {}).pop(key, None)
+
+    def clear(self, user):
+        with self.lock:
+            self.datas.pop(user, None)
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = pickle.dumps(self.datas)
+        # 先写临时文件再替换，避免写入中途退出导致文件损坏
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+
+class SQLiteUserDataStore(UserDataStore):
+    """
+    基于SQLite(WAL模式)的存储，每个(用户, key)一行，修改只写入对应的行
+    每个线程使用独立连接，WAL模式下读写互不阻塞，多进程共享同一文件也是安全的
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.conns = []
+        self.conns_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_data ("
+            "user TEXT NOT NULL, key TEXT NOT NULL, value BLOB, PRIMARY KEY (user, key)) WITHOUT ROWID"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # isolation_level=None为自动提交，每条语句是一个事务
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            with self.conns_lock:
+                self.conns.append(conn)
+        return conn
+
+    def load(self, user) -> dict:
+        rows = self._conn().execute("SELECT key, value FROM user_data WHERE user = ?", (user,)).fetchall()
+        return {key: pickle.loads(value) for key, value in rows}
+
+    def set(self, user, key, value):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO user_data (user, key, value) VALUES (?, ?, ?)", (user, key, pickle.dumps(value))
+        )
+
+    def delete(self, user, key):
+        self._conn().execute("DELETE FROM user_data WHERE user = ? AND key = ?", (user, key))
+
+    def clear(self, user):
+        self._conn().execute("DELETE FROM user_data WHERE user = ?", (user,))
+
+    def count_users(self):
+        return self._conn().execute("SELECT COUNT(DISTINCT user) FROM user_data").fetchone()[0]
+
+    def import_datas(self, user_datas: dict):
+        """在一个事务中批量导入{用户: {key: value}}"""
+        rows = [(user, key, pickle.dumps(value)) for user, data in user_datas.items() for key, value in (data or {}).items()]
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO user_data (user, key, value) VALUES (?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def migrate_from_pickle(self, pkl_path):
+        """从旧版user_datas.pkl导入数据，导入后将原文件重命名为.migrated，只执行一次"""
+        if not os.path.exists(pkl_path):
+            return
+        with open(pkl_path, "rb") as f:
+            user_datas = pickle.load(f)
+        self.import_datas(user_datas)
+        os.replace(pkl_path, pkl_path + ".migrated")
+        logger.info("[UserDataStore] migrated {} users from {}".format(len(user_datas), pkl_path))
+
+    def close(self):
+        with self.conns_lock:
+            conns, self.conns = self.conns, []
+        for conn in conns:
+            conn.close()
+        self.local = threading.local()
+
+
+class UserData(dict):
+    """
+    单个用户的数据，用法与dict相同，修改会同步写入存储后端
+    """
+
+    def __init__(self, store: UserDataStore, user, data=None):
+        super().__init__(data or {})
+        self.store = store
+        self.user = user
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.store.set(self.user, key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.store.delete(self.user, key)
+
+    def pop(self, key, *args):
+        existed = key in self
+        value = super().pop(key, *args)
+        if existed:
+            self.store.delete(self.user, key)
+        return value
+
+    def popitem(self):
+        key, value = super().popitem()
+        self.store.delete(self.user, key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        super().clear()
+        self.store.clear(self.user)
+
+
+def create_user_data_store(backend, appdata_dir) -> UserDataStore:
+    """
+    :param backend: sqlite或pickle
+    :param appdata_dir: 数据文件所在目录
+    """
+    pkl_path = os.path.join(appdata_dir, "user_datas.pkl")
+    if backend == "pickle":
+        return PickleUserDataStore(pkl_path)
+    store = SQLiteUserDataStore(os.path.join(appdata_dir, "user_datas.db"))
+    store.migrate_from_pickle(pkl_path)
+    return store
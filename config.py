@@ -3,10 +3,12 @@
 import json
 import logging
 import os
-import pickle
 import copy
+import itertools
+import threading
 
 from common.log import logger
+from common.user_data_store import PickleUserDataStore, UserData, create_user_data_store
 
 def get_root():
     return os.path.dirname(os.path.abspath(__file__))
@@ -71,12 +73,26 @@ available_setting = {
     "image_proxy": True,  # 是否需要图片代理，国内访问LinkAI时需要
     "image_create_prefix": ["画", "看", "找"],  # 开启图片回复的前缀
     "concurrency_in_session": 1,  # 同一会话最多有多少条消息在处理中，大于1可能乱序
+    "handler_pool_size": 8,  # 处理文字消息的线程数
+    "voice_handler_pool_size": 4,  # 处理语音消息的线程数
+    "image_handler_pool_size": 4,  # 处理图片识别和画图消息的线程数
+    "max_inflight_messages": 0,  # 全局排队中和处理中的消息数上限，0为不限制，如设置为1000
+    "session_queue_max_size": 0,  # 单个会话排队消息数上限，0为不限制，如设置为20
+    "session_queue_overflow_policy": "drop_oldest",  # 超出上限时的处理策略，可选 drop_oldest(丢弃最早), drop_newest(丢弃最新), merge(合并同一用户的连续文字), busy(回复繁忙提示)
+    "busy_reply": "当前消息较多，请稍后再试",  # 溢出策略为busy时的回复
+    "stream_reply": False,  # 是否使用流式回复，目前支持FastGPT和Dify chatbot/chatflow，回复按整句或段落分多条消息发送
+    "stream_min_chunk_size": 50,  # 流式回复每条消息的最少字数，不足时等待更多内容
+    "stream_flush_interval": 3,  # 流式回复距上一条消息超过该秒数时，即使字数不足也发送已完整的句子
+    "worker_processes": 1,  # 大于1时开启多进程模式，回调型通道按session_id把消息分发给多个worker进程处理，需使用sqlite用户数据存储
+    "user_data_backend": "sqlite",  # 用户数据存储方式，sqlite按key增量写入，pickle为旧版整体写入；旧版user_datas.pkl会自动导入sqlite
     "image_create_size": "256x256",  # 图片大小,可选有 256x256, 512x512, 1024x1024 (dall-e-3默认为1024x1024)
     "group_chat_exit_group": False,
     "group_exit_msg": "",  # 退出群聊的消息
     "accept_friend_msg": "",  # 接受好友请求后发送的消息
     # chatgpt会话参数
     "expires_in_seconds": 3600,  # 无操作会话的过期时间
+    "session_backend": "memory",  # 会话存储方式，memory为只保存在内存中；sqlite为持久化到磁盘，重启后保留上下文，超过expires_in_seconds未访问的会话会被删除
+    "session_max_resident": 10000,  # sqlite存储时内存中最多保留的会话数，超出时最久未访问的会话移出内存，下次访问时再从磁盘读取
     # 人格描述
     "character_desc": "你是ChatGPT, 一个由OpenAI训练的大型语言模型, 你旨在回答并解决人们的任何问题，并且可以使用多种语言与人交流。",
     "conversation_max_tokens": 1000,  # 支持上下文记忆的最多字符数
@@ -138,6 +154,7 @@ available_setting = {
     "text_to_voice": "openai",  # 语音合成引擎，支持openai,baidu,google,azure,xunfei,ali,pytts(offline),elevenlabs,edge(online)
     "text_to_voice_model": "tts-1",
     "tts_voice_id": "alloy",
+    "tts_cache_max_mb": 200,  # 语音合成结果缓存(appdata/tts_cache)的大小上限，相同文本不再重复合成和转码，0为不缓存
     # baidu 语音api配置， 使用百度语音识别和语音合成时需要
     "baidu_app_id": "",
     "baidu_api_key": "",
@@ -172,6 +189,7 @@ available_setting = {
     "wechatmp_app_id": "",  # 微信公众平台的appID
     "wechatmp_app_secret": "",  # 微信公众平台的appsecret
     "wechatmp_aes_key": "",  # 微信公众平台的EncodingAESKey，加密模式需要
+    "wechatmp_server": "webpy",  # 被动回复服务器实现，webpy或aiohttp；aiohttp下等待回复的请求不占用线程，需安装aiohttp
     # wechatcom的通用配置
     "wechatcom_corp_id": "",  # 企业微信公司的corpID
     # wechatcomapp的配置
@@ -196,6 +214,13 @@ available_setting = {
     "gewechat_token": "",
     "gewechat_app_id": "",
     "gewechat_callback_url": "", # 回调地址，示例：http://172.17.0.1:9919/v2/api/callback/collect
+    "gewechat_callback_server": "webpy",  # 回调服务器实现，webpy或aiohttp；aiohttp收到回调立即应答，后台解析投递，需安装aiohttp
+    "gewechat_callback_workers": 2,  # aiohttp回调服务器中解析和投递回调消息的线程数
+    "gewechat_dedup_expires": 3600,  # 回调消息id去重的有效期（秒）
+    "gewechat_dedup_max_size": 100000,  # 去重缓存最多保存的消息id数量
+    "gewechat_dedup_persist": False,  # 是否将已收到的消息id保存到文件，重启后仍能过滤重复回调
+    "gewechat_media_workers": 4,  # 同时下载图片、语音文件的线程数，回调线程只提交下载任务
+    "gewechat_media_timeout": 30,  # 下载图片、语音文件的连接和读取超时（秒）
     
     # chatgpt指令自定义触发词
     "clear_memory_commands": ["#清除记忆"],  # 重置会话指令，必须以#开头
@@ -220,14 +245,22 @@ available_setting = {
     "linkai_api_key": "",
     "linkai_app_code": "",
     "linkai_api_base": "https://api.link-ai.tech",  # linkAI服务地址
+    # 链接总结(LinkAI总结、JinaSum插件)的结果缓存
+    "summary_cache_seconds": 21600,  # 同一链接的总结结果缓存秒数
+    "summary_max_concurrency": 4,  # 同时进行的链接总结任务数上限
     "Minimax_api_key": "",
     "Minimax_group_id": "",
     "Minimax_base_url": "",
     "web_port": 9899,
+    "web_server": "webpy",  # Web Channel服务器实现，webpy或aiohttp；aiohttp下SSE连接不占用线程，适合大量用户同时在线，需安装aiohttp
+    "web_queue_max_size": 100,  # 每个用户缓存的待推送消息数，超出时丢弃最早的消息，也用于断线重连时补发
+    "web_heartbeat_interval": 15,  # SSE连接空闲时发送心跳的间隔（秒）
     # fastgpt
     "use_fastgpt": True,
     "fastgpt_api_base": "https://admin.xiaoyibao.com.cn/api/v1",
     "fastgpt_api_key":"",
+    "fastgpt_pool_size": 10,  # FastGPT 连接池大小
+    "fastgpt_max_retries": 2,  # FastGPT 建连失败时的重试次数，对话请求为POST，请求发出后的错误不重试以免重复执行
     #oss配置
     "oss_base_url": "https://objectstorageapi.cloud.sealos.top",
     "oss_access_key": "7el7pqc7",
@@ -237,14 +270,19 @@ available_setting = {
 
 
 class Config(dict):
+    _versions = itertools.count(1)  # 所有Config对象共用的版本号，配置被修改或重新加载后一定不同
+
     def __init__(self, d=None):
         super().__init__()
+        self.version = next(self._versions)  # 依赖配置预编译的对象(如触发条件索引)据此判断是否需要重建
         if d is None:
             d = {}
         for k, v in d.items():
             self[k] = v
-        # user_datas: 用户数据，key为用户名，value为用户数据，也是dict
-        self.user_datas = {}
+        # user_data_store: 用户数据存储，key为用户名，value为用户数据，也是dict
+        self.user_data_store = PickleUserDataStore()
+        self.user_datas = {}  # 用户名 -> UserData，同一用户始终返回同一对象
+        self.user_datas_lock = threading.Lock()
         # OSS 配置
         self.oss_base_url = None
         self.oss_access_key = None
@@ -263,6 +301,7 @@ class Config(dict):
     def __setitem__(self, key, value):
         if key not in available_setting:
             raise Exception("key {} not in available_setting".format(key))
+        self.version = next(self._versions)
         return super().__setitem__(key, value)
 
     def get(self, key, default=None):
@@ -279,30 +318,30 @@ class Config(dict):
         except Exception as e:
             raise e
 
-    # Make sure to return a dictionary to ensure atomic
+    # 返回的UserData用法与dict相同，修改会立即写入存储；同一用户返回同一对象，嵌套修改在进程内不会丢失
     def get_user_data(self, user) -> dict:
-        if self.user_datas.get(user) is None:
-            self.user_datas[user] = {}
-        return self.user_datas[user]
+        with self.user_datas_lock:
+            user_data = self.user_datas.get(user)
+            if user_data is None or user_data.store is not self.user_data_store:
+                user_data = UserData(self.user_data_store, user, self.user_data_store.load(user))
+                self.user_datas[user] = user_data
+            return user_data
 
     def load_user_datas(self):
+        backend = self.get("user_data_backend", "sqlite")
         try:
-            with open(os.path.join(get_appdata_dir(), "user_datas.pkl"), "rb") as f:
-                self.user_datas = pickle.load(f)
-                logger.info("[Config] User datas loaded.")
-        except FileNotFoundError as e:
-            logger.info("[Config] User datas file not found, ignore.")
+            self.user_data_store = create_user_data_store(backend, get_appdata_dir())
+            logger.info("[Config] User datas loaded, backend={}".format(backend))
         except Exception as e:
-            logger.info("[Config] User datas error: {}".format(e))
-            self.user_datas = {}
+            logger.error("[Config] User datas error: {}".format(e))
+            self.user_data_store = PickleUserDataStore()
 
     def save_user_datas(self):
         try:
-            with open(os.path.join(get_appdata_dir(), "user_datas.pkl"), "wb") as f:
-                pickle.dump(self.user_datas, f)
-                logger.info("[Config] User datas saved.")
+            self.user_data_store.save()
+            logger.info("[Config] User datas saved.")
         except Exception as e:
-            logger.info("[Config] User datas error: {}".format(e))
+            logger.error("[Config] User datas error: {}".format(e))
 
 
 config = Config()
@@ -320,7 +359,7 @@ def drag_sensitive(config):
             return json.dumps(conf_dict_copy, indent=4)
 
         elif isinstance(config, dict):
-            config_copy = copy.deepcopy(config)
+            config_copy = copy.deepcopy(dict(config))  # Config上挂有用户数据存储等无法复制的属性，只复制配置项
             for key in config:
                 if "key" in key or "secret" in key:
                     if isinstance(config_copy[key], str):
@@ -2,14 +2,19 @@
 
 import json
 import os
+import threading
+import time
 
 import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from config import get_appdata_dir
 from plugins import *
 
-from .lib.WordsSearch import WordsSearch
+from .lib.ArrayWordsSearch import ArrayWordsSearch
+
+RELOAD_CHECK_INTERVAL = 5  # 检查词库文件是否修改的间隔秒数
 
 
 @plugins.register(
@@ -35,16 +40,15 @@ class Banwords(Plugin):
                     with open(config_path, "w") as f:
                         json.dump(conf, f, indent=4)
 
-            self.searchr = WordsSearch()
             self.action = conf["action"]
-            banwords_path = os.path.join(curdir, "banwords.txt")
-            with open(banwords_path, "r", encoding="utf-8") as f:
-                words = []
-                for line in f:
-                    word = line.strip()
-                    if word:
-                        words.append(word)
-            self.searchr.SetKeywords(words)
+            self.banwords_path = os.path.join(curdir, "banwords.txt")
+            # 编译结果缓存在appdata中，词库未修改时重启直接加载
+            self.cache_path = os.path.join(get_appdata_dir(), "banwords.cache")
+            self.banwords_mtime = os.path.getmtime(self.banwords_path)
+            self.searchr = ArrayWordsSearch.from_keywords(self._read_words(), self.cache_path)
+            self.last_check = time.monotonic()
+            self.reloading = False
+            self.reload_lock = threading.Lock()
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
             if conf.get("reply_filter", True):
                 self.handlers[Event.ON_DECORATE_REPLY] = self.on_decorate_reply
@@ -54,7 +58,45 @@ class Banwords(Plugin):
             logger.warn("[Banwords] init failed, ignore or see https://github.com/zhayujie/chatgpt-on-wechat/tree/master/plugins/banwords .")
             raise e
 
+    def _read_words(self):
+        with open(self.banwords_path, "r", encoding="utf-8") as f:
+            words = []
+            for line in f:
+                word = line.strip()
+                if word:
+                    words.append(word)
+        return words
+
+    def _check_reload(self):
+        """词库文件修改后在后台线程中重新编译，编译完成前仍使用旧的词库"""
+        now = time.monotonic()
+        if now - self.last_check < RELOAD_CHECK_INTERVAL:
+            return
+        self.last_check = now
+        try:
+            mtime = os.path.getmtime(self.banwords_path)
+        except OSError:
+            return
+        with self.reload_lock:
+            if mtime == self.banwords_mtime or self.reloading:
+                return
+            self.reloading = True
+        threading.Thread(target=self._reload, args=(mtime,), name="banwords_reload", daemon=True).start()
+
+    def _reload(self, mtime):
+        try:
+            start = time.time()
+            words = self._read_words()
+            self.searchr = ArrayWordsSearch.from_keywords(words, self.cache_path)
+            self.banwords_mtime = mtime
+            logger.info("[Banwords] reloaded {} words in {:.2f}s".format(len(words), time.time() - start))
+        except Exception as e:
+            logger.warning("[Banwords] reload banwords failed: {}".format(e))
+        finally:
+            self.reloading = False
+
     def on_handle_context(self, e_context: EventContext):
+        self._check_reload()
         if e_context["context"].type not in [
             ContextType.TEXT,
             ContextType.IMAGE_CREATE,
@@ -77,6 +119,7 @@ class Banwords(Plugin):
                 return
 
     def on_decorate_reply(self, e_context: EventContext):
+        self._check_reload()
         if e_context["reply"].type not in [ReplyType.TEXT]:
             return
 
@@ -0,0 +1,307 @@
+# encoding:utf-8
+"""
+编译后的敏感词自动机，接口和匹配结果与WordsSearch完全一致
+- 状态为整数，每个状态一个已合并失败链的转移dict，不再为每个节点创建对象，编译结果可保存到磁盘
+- 安装了numpy时，长文本改用向量化的滑动窗口哈希：一次算出每种关键词长度下所有窗口的哈希，
+  在有序的关键词哈希表中二分查找，只有哈希命中的位置才在Python中比较字符串
+"""
+import hashlib
+import os
+import pickle
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ["ArrayWordsSearch"]
+
+CACHE_VERSION = 1
+LONG_TEXT = 320  # 不短于该长度的文本使用numpy查找，短文本调用numpy的固定开销高于自动机
+FIRST_CHUNK = 2048  # 只需第一个匹配时分段查找的长度
+MASK = (1 << 64) - 1
+HASH_BASE = 0x100000001B3
+HASH_BASE_INV = pow(HASH_BASE, -1, 1 << 64)
+
+
+def _mix(x):
+    # splitmix64，把字符编码打散为64位，与_mix_array结果一致
+    z = (x + 0x9E3779B97F4A7C15) & MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+    return z ^ (z >> 31)
+
+
+def _mix_array(x):
+    z = x + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _word_hash(word):
+    h = 0
+    p = 1
+    for ch in word:
+        h = (h + _mix(ord(ch)) * p) & MASK
+        p = (p * HASH_BASE) & MASK
+    return h
+
+
+class ArrayWordsSearch:
+    def __init__(self):
+        self._keywords = []
+        self._digest = None
+        self._goto = [{}]  # 状态 -> {字符: 状态}，已合并失败链上的转移，没有转移时回到根状态重新匹配
+        self._outs = [()]  # 状态 -> 匹配到的关键词下标，按关键词从长到短排列
+        self._word_ids = {}  # 关键词 -> 下标，重复的关键词有多个下标
+        self._hashes = {}  # 关键词长度 -> 该长度所有关键词的哈希
+        self._tables = []  # [(长度, 位移, 哈希高位的位图, 有序的哈希数组)]，numpy查找使用
+        self._powers = None  # (HASH_BASE的幂, 逆元的幂)，按最长文本增长
+        self._chars = set()
+
+    @staticmethod
+    def digest(keywords) -> str:
+        return hashlib.sha1("\n".join(keywords).encode("utf-8", "surrogatepass")).hexdigest()
+
+    def SetKeywords(self, keywords):
+        self._keywords = list(keywords)
+        self._digest = self.digest(self._keywords)
+
+        # 构建trie，按层编号，保证计算失败指针时较浅的状态已处理
+        children = [{}]
+        own = [[]]
+        depth = [0]
+        for i, word in enumerate(self._keywords):
+            s = 0
+            for ch in word:
+                t = children[s].get(ch)
+                if t is None:
+                    t = len(children)
+                    children[s][ch] = t
+                    children.append({})
+                    own.append([])
+                    depth.append(depth[s] + 1)
+                s = t
+            own[s].append(i)
+        order = sorted(range(len(children)), key=lambda s: depth[s])
+        renumber = [0] * len(children)
+        for new, old in enumerate(order):
+            renumber[old] = new
+        children = [{ch: renumber[t] for ch, t in children[old].items()} for old in order]
+        own = [own[old] for old in order]
+
+        n = len(children)
+        fail = [0] * n
+        goto = [None] * n
+        outs = [()] * n
+        goto[0] = children[0]
+        for s in range(n):
+            for ch, t in children[s].items():
+                if s:
+                    f = fail[s]
+                    while True:
+                        if ch in children[f]:
+                            fail[t] = children[f][ch]
+                            break
+                        if f == 0:
+                            break
+                        f = fail[f]
+            if s == 0:
+                continue
+            f = fail[s]
+            if f:
+                merged = dict(goto[f])
+                merged.update(children[s])
+                goto[s] = merged
+            else:
+                goto[s] = children[s]
+            items = list(own[s])
+            items.extend(item for item in outs[f] if item not in items)
+            outs[s] = tuple(items)
+        self._goto = goto
+        self._outs = outs
+
+        self._word_ids = {}
+        self._hashes = {}
+        for i, word in enumerate(self._keywords):
+            if not word:
+                continue
+            if word not in self._word_ids:
+                self._word_ids[word] = []
+                self._hashes.setdefault(len(word), []).append(_word_hash(word))
+            self._word_ids[word].append(i)
+        self._compile_tables()
+
+    def _compile_tables(self):
+        self._chars = set("".join(self._word_ids))
+        self._tables = []
+        if np is None:
+            return
+        for length, hashes in sorted(self._hashes.items()):
+            table = np.unique(np.array(hashes, dtype=np.uint64))
+            # 位图大小约为关键词数的64倍，绝大多数窗口一次查表即可排除，只有约1/64的窗口需要二分查找
+            bits = min(max((len(table) * 64).bit_length(), 12), 26)
+            shift = np.uint64(64 - bits)
+            bitmap = np.zeros(1 << bits, dtype=bool)
+            bitmap[table >> shift] = True
+            self._tables.append((length, shift, bitmap, table))
+
+    def _get_powers(self, n):
+        if self._powers is None or len(self._powers[0]) < n:
+            size = max(n, 4096)
+            pw = np.full(size, HASH_BASE, dtype=np.uint64)
+            pw[0] = 1
+            pinv = np.full(size, HASH_BASE_INV, dtype=np.uint64)
+            pinv[0] = 1
+            self._powers = (np.cumprod(pw, dtype=np.uint64), np.cumprod(pinv, dtype=np.uint64))
+        return self._powers
+
+    def _matches(self, text, stop_at_first=False):
+        """返回[(结束位置, -关键词长度, 关键词下标)]，已排序，与自动机在每个位置输出的结果和顺序一致"""
+        if np is None or len(text) < LONG_TEXT or not self._tables:
+            outs = self._outs
+            return [(i, -len(self._keywords[item]), item) for i, s in self._states(text, stop_at_first) for item in outs[s]]
+        if not stop_at_first:
+            return self._scan(text)
+        # 分段查找，找到即返回，文本开头就有敏感词时不必计算整段文本的哈希
+        overlap = self._tables[-1][0] - 1
+        for start in range(0, len(text), FIRST_CHUNK):
+            matches = self._scan(text[start : start + FIRST_CHUNK + overlap], stop_at_first=True)
+            if matches:
+                return [(end + start, neg_length, item) for end, neg_length, item in matches]
+        return []
+
+    def _scan(self, text, stop_at_first=False):
+        """numpy滑动窗口哈希查找，返回值同_matches"""
+        n = len(text)
+        codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32).astype(np.uint64)
+        pw, pinv = self._get_powers(n + 1)
+        prefix = np.zeros(n + 1, dtype=np.uint64)
+        np.cumsum(_mix_array(codes) * pw[:n], out=prefix[1:])
+        matches = []
+        for length, shift, bitmap, table in self._tables:
+            if length > n:
+                break
+            # 窗口哈希 = (prefix[i+L] - prefix[i]) / HASH_BASE^i，除法用模2^64下的逆元代替
+            window = (prefix[length:] - prefix[: n - length + 1]) * pinv[: n - length + 1]
+            candidates = np.flatnonzero(bitmap[window >> shift])
+            if not len(candidates):
+                continue
+            window = window[candidates]
+            idx = np.minimum(np.searchsorted(table, window), len(table) - 1)
+            for i in candidates[table[idx] == window].tolist():
+                ids = self._word_ids.get(text[i : i + length])
+                if ids:
+                    matches.extend((i + length - 1, -length, item) for item in ids)
+                    if stop_at_first:  # 每种长度只需最早的位置，较短的关键词可能结束得更早，仍要查找其他长度
+                        break
+        matches.sort()
+        return matches
+
+    def _states(self, text, stop_at_first=False):
+        """自动机逐字符匹配，产生有匹配结果的(位置, 状态)"""
+        goto, outs = self._goto, self._outs
+        root = goto[0]
+        s = 0
+        for i, ch in enumerate(text):
+            t = goto[s].get(ch)
+            if t is None and s:
+                t = root.get(ch)
+            if t is None:
+                s = 0
+                continue
+            s = t
+            if outs[s]:
+                yield i, s
+                if stop_at_first:
+                    return
+
+    def _result(self, end, item):
+        keyword = self._keywords[item]
+        return {"Keyword": keyword, "Success": True, "End": end, "Start": end + 1 - len(keyword), "Index": item}
+
+    def FindFirst(self, text):
+        matches = self._matches(text, stop_at_first=True)
+        if not matches:
+            return None
+        end, _, item = matches[0]
+        return self._result(end, item)
+
+    def FindAll(self, text):
+        return [self._result(end, item) for end, _, item in self._matches(text)]
+
+    def FindAllBatch(self, texts):
+        """
+        批量查找，返回每个文本的FindAll结果
+        有numpy时把所有文本用不在任何关键词中的分隔符拼接后一次查找，短文本也能用上向量化
+        """
+        texts = list(texts)
+        sep = "\x00"
+        if np is None or sep in self._chars or any(sep in text for text in texts):
+            return [self.FindAll(text) for text in texts]
+        offsets = []
+        pos = 0
+        for text in texts:
+            offsets.append(pos)
+            pos += len(text) + 1
+        results = [[] for _ in texts]
+        starts = np.array(offsets)
+        for end, _, item in self._matches(sep.join(texts)):
+            index = int(np.searchsorted(starts, end, side="right")) - 1
+            results[index].append(self._result(end - offsets[index], item))
+        return results
+
+    def ContainsAny(self, text):
+        return bool(self._matches(text, stop_at_first=True))
+
+    def Replace(self, text, replaceChar="*"):
+        result = None
+        last_end = -1
+        for end, neg_length, _ in self._matches(text):
+            if end == last_end:  # 同一位置只替换最长的关键词
+                continue
+            last_end = end
+            if result is None:
+                result = list(text)
+            for j in range(end + 1 + neg_length, end + 1):
+                result[j] = replaceChar
+        return text if result is None else "".join(result)
+
+    def save(self, path):
+        """保存编译结果，先写临时文件再替换"""
+        data = (CACHE_VERSION, self._digest, self._keywords, self._goto, self._outs, self._word_ids, self._hashes)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load(self, path, keywords=None) -> bool:
+        """加载编译结果，指定keywords时只有词库一致才加载，返回是否加载成功"""
+        if not os.path.exists(path):
+            return False
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data[0] != CACHE_VERSION or (keywords is not None and data[1] != self.digest(keywords)):
+            return False
+        _, self._digest, self._keywords, self._goto, self._outs, self._word_ids, self._hashes = data
+        self._compile_tables()
+        return True
+
+    @classmethod
+    def from_keywords(cls, keywords, cache_path=None):
+        """创建自动机，指定cache_path时优先加载与词库一致的编译结果，否则构建后保存"""
+        search = cls()
+        if cache_path:
+            try:
+                if search.load(cache_path, keywords):
+                    return search
+            except Exception:
+                pass
+        search.SetKeywords(keywords)
+        if cache_path:
+            try:
+                search.save(cache_path)
+            except Exception:
+                pass
+        return search
@@ -131,6 +131,19 @@ ADMIN_COMMANDS = {
         "alias": ["debug", "调试模式", "DEBUG"],
         "desc": "开启机器调试日志",
     },
+    "stats": {
+        "alias": ["stats", "运行状态"],
+        "desc": "查看消息调度等运行状态",
+    },
+    "pstats": {
+        "alias": ["pstats", "插件耗时"],
+        "desc": "查看各插件处理事件的耗时",
+    },
+    "setpool": {
+        "alias": ["setpool", "设置线程池"],
+        "args": ["线程池名", "线程数"],
+        "desc": "调整消息处理线程池大小，线程池名可选chat/voice/image",
+    },
 }
 
 
@@ -352,6 +365,23 @@ class Godcmd(Plugin):
                             else:
                                 logger.setLevel(logging.DEBUG)
                                 ok, result = True, "DEBUG模式已开启"
+                        elif cmd == "stats":
+                            if hasattr(channel, "get_runtime_stats"):
+                                ok, result = True, self.format_stats(channel.get_runtime_stats())
+                            else:
+                                ok, result = False, "当前通道不支持查看运行状态"
+                        elif cmd == "pstats":
+                            ok, result = True, self.format_plugin_stats(PluginManager().get_handler_stats())
+                        elif cmd == "setpool":
+                            from channel import chat_channel
+
+                            if len(args) != 2 or not args[1].isdigit() or int(args[1]) < 1:
+                                ok, result = False, "请提供线程池名和大于0的线程数"
+                            elif args[0] not in chat_channel.handler_pools:
+                                ok, result = False, "线程池不存在，可选：" + "/".join(chat_channel.handler_pools.keys())
+                            else:
+                                chat_channel.handler_pools[args[0]].resize(int(args[1]))
+                                ok, result = True, f"线程池{args[0]}大小已设置为{args[1]}"
                         elif cmd == "plist":
                             plugins = PluginManager().list_plugins()
                             ok = True
@@ -471,6 +501,24 @@ class Godcmd(Plugin):
         return False
 
 
+    def format_stats(self, stats: dict) -> str:
+        result = "运行状态：\n"
+        for section, items in stats.items():
+            result += f"[{section}]\n"
+            for k, v in items.items():
+                result += f"{k}: {v}\n"
+        return result
+
+    def format_plugin_stats(self, items) -> str:
+        if not items:
+            return "暂无插件耗时统计"
+        result = "插件耗时(按累计耗时排序)：\n"
+        for name, event, stats in items:
+            s = stats.summary()
+            avg_ms = round(stats.total / stats.count * 1000, 2)
+            result += f"{name} {event.name}: count={s['count']}, avg={avg_ms}ms, p50={s['p50_ms']}ms, p99={s['p99_ms']}ms, total={round(stats.total, 2)}s\n"
+        return result
+
     def model_mapping(self, model) -> str:
         if model == "gpt-4-turbo":
             return const.GPT4_TURBO_PREVIEW
@@ -1,4 +1,5 @@
 # encoding:utf-8
+import hashlib
 import json
 import os
 import html
@@ -10,6 +11,7 @@ import plugins
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.summary_cache import get_summary_cache
 from plugins import *
 
 @plugins.register(
@@ -54,7 +56,7 @@ class JinaSum(Plugin):
             logger.error(f"[JinaSum] 初始化异常：{e}")
             raise "[JinaSum] init failed, ignore "
 
-    def on_handle_context(self, e_context: EventContext, retry_count: int = 0):
+    def on_handle_context(self, e_context: EventContext):
         try:
             context = e_context["context"]
             content = context.content
@@ -63,41 +65,53 @@ class JinaSum(Plugin):
             if not self._check_url(content):
                 logger.debug(f"[JinaSum] {content} is not a valid url, skip")
                 return
-            if retry_count == 0:
+
+            target_url = html.unescape(content) # 解决公众号卡片链接校验问题，参考 https://github.com/fatwang2/sum4all/commit/b983c49473fc55f13ba2c44e4d8b226db3517c45
+            # 同一链接的总结在各会话间共享，命中缓存时直接回复，不发起网络请求
+            cache = get_summary_cache()
+            result = cache.get(self._cache_namespace(), target_url)
+            if result is None:
                 logger.debug("[JinaSum] on_handle_context. content: %s" % content)
                 reply = Reply(ReplyType.TEXT, "🎉正在为您生成总结，请稍候...")
                 channel = e_context["channel"]
                 channel.send(reply, context)
-
-            target_url = html.unescape(content) # 解决公众号卡片链接校验问题，参考 https://github.com/fatwang2/sum4all/commit/b983c49473fc55f13ba2c44e4d8b226db3517c45
-            jina_url = self._get_jina_url(target_url)
-            headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"}
-            response = requests.get(jina_url, headers=headers, timeout=60)
-            response.raise_for_status()
-            target_url_content = response.text
-
-            openai_chat_url = self._get_openai_chat_url()
-            openai_headers = self._get_openai_headers()
-            openai_payload = self._get_openai_payload(target_url_content)
-            logger.debug(f"[JinaSum] openai_chat_url: {openai_chat_url}, openai_headers: {openai_headers}, openai_payload: {openai_payload}")
-            response = requests.post(openai_chat_url, headers={**openai_headers, **headers}, json=openai_payload, timeout=60)
-            response.raise_for_status()
-            result = response.json()['choices'][0]['message']['content']
+                result = cache.get_or_compute(self._cache_namespace(), target_url, lambda: self._summarize(target_url))
             reply = Reply(ReplyType.TEXT, result)
             e_context["reply"] = reply
             e_context.action = EventAction.BREAK_PASS
 
         except Exception as e:
-            if retry_count < 3:
-                logger.warning(f"[JinaSum] {str(e)}, retry {retry_count + 1}")
-                self.on_handle_context(e_context, retry_count + 1)
-                return
-
             logger.exception(f"[JinaSum] {str(e)}")
             reply = Reply(ReplyType.ERROR, "我暂时无法总结链接，请稍后再试")
             e_context["reply"] = reply
             e_context.action = EventAction.BREAK_PASS
 
+    def _summarize(self, target_url, max_retry: int = 3):
+        for retry_count in range(max_retry + 1):
+            try:
+                jina_url = self._get_jina_url(target_url)
+                headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"}
+                response = requests.get(jina_url, headers=headers, timeout=60)
+                response.raise_for_status()
+                target_url_content = response.text
+
+                openai_chat_url = self._get_openai_chat_url()
+                openai_headers = self._get_openai_headers()
+                openai_payload = self._get_openai_payload(target_url_content)
+                logger.debug(f"[JinaSum] openai_chat_url: {openai_chat_url}, openai_headers: {openai_headers}, openai_payload: {openai_payload}")
+                response = requests.post(openai_chat_url, headers={**openai_headers, **headers}, json=openai_payload, timeout=60)
+                response.raise_for_status()
+                return response.json()['choices'][0]['message']['content']
+            except Exception as e:
+                if retry_count >= max_retry:
+                    raise
+                logger.warning(f"[JinaSum] {str(e)}, retry {retry_count + 1}")
+
+    def _cache_namespace(self):
+        # 模型、提示词不同时总结结果不同，分别缓存
+        settings = "{}\n{}\n{}\n{}\n{}".format(self.jina_reader_base, self.open_ai_api_base, self.open_ai_model, self.max_words, self.prompt)
+        return "jina_sum:" + hashlib.md5(settings.encode("utf-8")).hexdigest()
+
     def get_help_text(self, verbose, **kwargs):
         return f'使用jina reader和ChatGPT总结网页链接内容'
 
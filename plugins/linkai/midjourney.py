@@ -1,13 +1,14 @@
 from enum import Enum
 from config import conf
+from common.expired_dict import ExpiredDict
 from common.log import logger
 import requests
 import threading
 import time
 from bridge.reply import Reply, ReplyType
-import asyncio
 from bridge.context import ContextType
 from plugins import EventContext, EventAction
+from .mj_tracker import get_mj_tracker
 from .utils import Util
 
 
@@ -73,10 +74,10 @@ class MJBot:
         self.headers = {"Authorization": "Bearer " + conf().get("linkai_api_key")}
         self.config = config
         self.fetch_group_app_code = fetch_group_app_code
-        self.tasks = {}
-        self.temp_dict = {}
+        # 任务和已放大/变换过的图片记录一段时间后自动清理，避免常驻内存无限增长
+        self.tasks = ExpiredDict(24 * 3600, max_size=10000)
+        self.temp_dict = ExpiredDict(24 * 3600, max_size=10000)
         self.tasks_lock = threading.Lock()
-        self.event_loop = asyncio.new_event_loop()
 
     def judge_mj_task_type(self, e_context: EventContext):
         """
@@ -220,7 +221,6 @@ class MJBot:
                               task_type=TaskType.GENERATE)
                 # put to memory dict
                 self.tasks[task.id] = task
-                # asyncio.run_coroutine_threadsafe(self.check_task(task, e_context), self.event_loop)
                 self._do_check_task(task, e_context)
                 return reply
         else:
@@ -255,7 +255,6 @@ class MJBot:
                 self.tasks[task.id] = task
                 key = f"{task_type.name}_{img_id}_{index}"
                 self.temp_dict[key] = True
-                # asyncio.run_coroutine_threadsafe(self.check_task(task, e_context), self.event_loop)
                 self._do_check_task(task, e_context)
                 return reply
         else:
@@ -267,38 +266,15 @@ class MJBot:
             reply = Reply(ReplyType.ERROR, error_msg or "图片生成失败，请稍后再试")
             return reply
 
-    def check_task_sync(self, task: MJTask, e_context: EventContext):
+    def _do_check_task(self, task: MJTask, e_context: EventContext):
         logger.debug(f"[MJ] start check task status, {task}")
-        max_retry_times = 90
-        while max_retry_times > 0:
-            time.sleep(10)
-            url = f"{self.base_url}/tasks/{task.id}"
-            try:
-                res = requests.get(url, headers=self.headers, timeout=8)
-                if res.status_code == 200:
-                    res_json = res.json()
-                    logger.debug(f"[MJ] task check res sync, task_id={task.id}, status={res.status_code}, "
-                                 f"data={res_json.get('data')}, thread={threading.current_thread().name}")
-                    if res_json.get("data") and res_json.get("data").get("status") == Status.FINISHED.name:
-                        # process success res
-                        if self.tasks.get(task.id):
-                            self.tasks[task.id].status = Status.FINISHED
-                        self._process_success_task(task, res_json.get("data"), e_context)
-                        return
-                    max_retry_times -= 1
-                else:
-                    res_json = res.json()
-                    logger.warn(f"[MJ] image check error, status_code={res.status_code}, res={res_json}")
-                    max_retry_times -= 20
-            except Exception as e:
-                max_retry_times -= 20
-                logger.warn(e)
-        logger.warn("[MJ] end from poll")
-        if self.tasks.get(task.id):
-            self.tasks[task.id].status = Status.EXPIRED
 
-    def _do_check_task(self, task: MJTask, e_context: EventContext):
-        threading.Thread(target=self.check_task_sync, args=(task, e_context)).start()
+        def on_expired():
+            if self.tasks.get(task.id):
+                self.tasks[task.id].status = Status.EXPIRED
+
+        get_mj_tracker().track(task.id, f"{self.base_url}/tasks/{task.id}", self.headers,
+                               lambda data: self._process_success_task(task, data, e_context), on_expired)
 
     def _process_success_task(self, task: MJTask, res: dict, e_context: EventContext):
         """
@@ -366,14 +342,6 @@ class MJBot:
             return TaskMode.RELAX.value
         return mode or TaskMode.FAST.value
 
-    def _run_loop(self, loop: asyncio.BaseEventLoop):
-        """
-        运行事件循环，用于轮询任务的线程
-        :param loop: 事件循环
-        """
-        loop.run_forever()
-        loop.stop()
-
     def _print_tasks(self):
         for id in self.tasks:
             logger.debug(f"[MJ] current task: {self.tasks[id]}")
@@ -0,0 +1,143 @@
+"""
+Midjourney任务状态的轮询调度
+- 所有任务共用一个调度器：下次轮询时间登记在共享事件循环上，到期后提交到有界线程池中查询，不再每个任务一个睡眠线程
+- 查询间隔随任务已等待的时间变化：提交后半分钟内几乎不会出图；fast模式通常在2分钟内完成，这段时间间隔最短；之后逐渐拉长，减少relax等慢任务的请求数
+- 使用带连接池的session查询，超过最长等待时间或连续出错达到上限后放弃
+- LinkAI没有批量查询任务状态的接口，逐个任务查询
+"""
+import threading
+import time
+
+from common.async_runtime import get_async_runtime
+from common.expired_dict import ExpiredDict
+from common.handler_pool import HandlerPool
+from common.http_client import create_session
+from common.log import logger
+from common.metrics import LatencyStats, register_stats
+
+# (任务已等待的秒数上限, 查询间隔秒数)
+POLL_SCHEDULE = ((30, 10), (120, 5), (300, 10), (None, 15))
+
+
+class TrackedTask:
+    def __init__(self, task_id, url, headers, on_finished, on_expired):
+        self.task_id = task_id
+        self.url = url
+        self.headers = headers
+        self.on_finished = on_finished  # on_finished(data)，在查询线程中调用
+        self.on_expired = on_expired  # on_expired()
+        self.start_time = time.monotonic()
+        self.errors = 0  # 连续出错次数
+
+
+class MJTaskTracker:
+    def __init__(self, max_workers=4, schedule=POLL_SCHEDULE, max_duration=15 * 60, max_errors=5, timeout=8):
+        """
+        :param max_workers: 同时查询的任务数
+        :param schedule: 查询间隔，((已等待秒数上限, 间隔秒数), ...)，最后一项的上限为None
+        :param max_duration: 任务最长等待秒数
+        :param max_errors: 连续出错多少次后放弃
+        """
+        self.pool = HandlerPool("mj_tracker", max_workers)
+        self.session = create_session(max_workers)
+        self.schedule = schedule
+        self.max_duration = max_duration
+        self.max_errors = max_errors
+        self.timeout = timeout
+        self.tasks = ExpiredDict(max_duration * 2, max_size=10000)  # task_id -> TrackedTask，只保留等待中的任务
+        self.latency = LatencyStats()
+        self.lock = threading.Lock()
+        self.polls = 0
+        self.finished = 0
+        self.expired = 0
+        self.errors = 0
+
+    def track(self, task_id, url, headers, on_finished, on_expired=None):
+        """开始跟踪任务，立即返回"""
+        task = TrackedTask(task_id, url, headers, on_finished, on_expired)
+        self.tasks[task_id] = task
+        self._schedule(task)
+
+    def _interval(self, task):
+        age = time.monotonic() - task.start_time
+        for limit, interval in self.schedule:
+            if limit is None or age < limit:
+                return interval
+        return self.schedule[-1][1]
+
+    def _schedule(self, task):
+        get_async_runtime().call_later(self._interval(task), self._submit, task)
+
+    def _submit(self, task):
+        # 在事件循环线程中调用，只提交任务，不阻塞
+        self.pool.submit(self._poll, task)
+
+    def _poll(self, task):
+        if time.monotonic() - task.start_time > self.max_duration:
+            logger.warn("[MJ] task {} end from poll, waited {}s".format(task.task_id, self.max_duration))
+            self._expire(task)
+            return
+        start = time.monotonic()
+        data = None
+        failed = True
+        try:
+            res = self.session.get(task.url, headers=task.headers, timeout=self.timeout)
+            if res.status_code == 200:
+                data = res.json().get("data")
+                failed = False
+                logger.debug(f"[MJ] task check res, task_id={task.task_id}, data={data}")
+            else:
+                logger.warn(f"[MJ] image check error, status_code={res.status_code}, res={res.text}")
+        except Exception as e:
+            logger.warn("[MJ] image check error, task_id={}, {}".format(task.task_id, e))
+        finally:
+            self.latency.record(time.monotonic() - start)
+            task.errors = task.errors + 1 if failed else 0
+            with self.lock:
+                self.polls += 1
+                self.errors += 1 if failed else 0
+
+        if data and data.get("status") == "FINISHED":
+            self.tasks.pop(task.task_id, None)
+            with self.lock:
+                self.finished += 1
+            try:
+                task.on_finished(data)
+            except Exception as e:
+                logger.exception("[MJ] process task {} failed: {}".format(task.task_id, e))
+        elif task.errors >= self.max_errors:
+            self._expire(task)
+        else:
+            self._schedule(task)
+
+    def _expire(self, task):
+        self.tasks.pop(task.task_id, None)
+        with self.lock:
+            self.expired += 1
+        if task.on_expired:
+            task.on_expired()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self.tasks),
+            "polls": self.polls,
+            "finished": self.finished,
+            "expired": self.expired,
+            "errors": self.errors,
+            "pool": "queued={}, active={}".format(self.pool.queued, self.pool.active),
+            "latency": str(self.latency),
+        }
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def get_mj_tracker() -> MJTaskTracker:
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = MJTaskTracker()
+                register_stats("mj_tracker", _tracker.stats)
+    return _tracker
@@ -1,6 +1,7 @@
 import requests
 from config import conf
 from common.log import logger
+from common.summary_cache import get_summary_cache
 import os
 import html
 
@@ -24,6 +25,10 @@ class LinkSummary:
 
     def summary_url(self, url: str, app_code: str):
         url = html.unescape(url)
+        # 同一链接在各群、各用户间共享总结结果，并发请求只调用一次接口
+        return get_summary_cache().get_or_compute(f"linkai:{app_code}", url, lambda: self._summary_url(url, app_code))
+
+    def _summary_url(self, url: str, app_code: str):
         body = {
             "url": url,
             "app_code": app_code
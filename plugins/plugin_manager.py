@@ -3,10 +3,14 @@
 import importlib
 import importlib.util
 import json
+import logging
 import os
 import sys
+import threading
+import time
 
 from common.log import logger
+from common.metrics import LatencyStats
 from common.singleton import singleton
 from common.sorted_dict import SortedDict
 from config import conf, remove_plugin_config, write_plugin_config
@@ -23,6 +27,11 @@ class PluginManager:
         self.pconf = {}
         self.current_plugin_path = None
         self.loaded = {}
+        # 编译好的事件分发表，event -> ((插件名, handler, 耗时统计), ...)，按优先级排序，只包含已启用插件
+        # 插件启停、重载、调整优先级时重新生成并整体替换，emit_event无需加锁
+        self.dispatch_table = {}
+        self.dispatch_lock = threading.Lock()
+        self.handler_stats = {}  # (插件名, event) -> LatencyStats
 
     def register(self, name: str, desire_priority: int = 0, **kwargs):
         def wrapper(plugincls):
@@ -136,6 +145,26 @@ class PluginManager:
     def refresh_order(self):
         for event in self.listening_plugins.keys():
             self.listening_plugins[event].sort(key=lambda name: self.plugins[name].priority, reverse=True)
+        self.rebuild_dispatch_table()
+
+    def rebuild_dispatch_table(self):
+        with self.dispatch_lock:
+            table = {}
+            for event, names in self.listening_plugins.items():
+                handlers = []
+                for name in names:
+                    if name not in self.plugins or not self.plugins[name].enabled or name not in self.instances:
+                        continue
+                    handler = self.instances[name].handlers.get(event)
+                    if handler is None:
+                        continue
+                    stats = self.handler_stats.get((name, event))
+                    if stats is None:
+                        stats = self.handler_stats[(name, event)] = LatencyStats()
+                    handlers.append((name, handler, stats))
+                if handlers:
+                    table[event] = tuple(handlers)
+            self.dispatch_table = table
 
     def activate_plugins(self):  # 生成新开启的插件实例
         failed_plugins = []
@@ -158,7 +187,8 @@ class PluginManager:
                 for event in instance.handlers:
                     if event not in self.listening_plugins:
                         self.listening_plugins[event] = []
-                    self.listening_plugins[event].append(name)
+                    if name not in self.listening_plugins[event]:  # 重新激活时已在列表中，避免同一插件被触发多次
+                        self.listening_plugins[event].append(name)
         self.refresh_order()
         return failed_plugins
 
@@ -172,6 +202,7 @@ class PluginManager:
             if name in self.instances:
                 self.instances[name].handlers.clear()
             del self.instances[name]
+            self.rebuild_dispatch_table()
             self.activate_plugins()
             return True
         return False
@@ -189,17 +220,33 @@ class PluginManager:
         self.activate_plugins()
 
     def emit_event(self, e_context: EventContext, *args, **kwargs):
-        if e_context.event in self.listening_plugins:
-            for name in self.listening_plugins[e_context.event]:
-                if self.plugins[name].enabled and e_context.action == EventAction.CONTINUE:
-                    logger.debug("Plugin %s triggered by event %s" % (name, e_context.event))
-                    instance = self.instances[name]
-                    instance.handlers[e_context.event](e_context, *args, **kwargs)
-                    if e_context.is_break():
-                        e_context["breaked_by"] = name
-                        logger.debug("Plugin %s breaked event %s" % (name, e_context.event))
+        handlers = self.dispatch_table.get(e_context.event)
+        if not handlers:
+            return e_context
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for name, handler, stats in handlers:
+            if e_context.action != EventAction.CONTINUE:
+                break
+            if debug:
+                logger.debug("Plugin %s triggered by event %s" % (name, e_context.event))
+            start = time.perf_counter()
+            try:
+                handler(e_context, *args, **kwargs)
+            finally:
+                stats.record(time.perf_counter() - start)
+            if e_context.is_break():
+                e_context["breaked_by"] = name
+                if debug:
+                    logger.debug("Plugin %s breaked event %s" % (name, e_context.event))
         return e_context
 
+    def get_handler_stats(self):
+        """各插件处理各事件的耗时统计，按累计耗时从高到低排序，返回[(插件名, event, LatencyStats)]"""
+        with self.dispatch_lock:
+            items = [(name, event, stats) for (name, event), stats in self.handler_stats.items() if stats.count]
+        items.sort(key=lambda item: item[2].total, reverse=True)
+        return items
+
     def set_plugin_priority(self, name: str, priority: int):
         name = name.upper()
         if name not in self.plugins:
@@ -239,6 +286,7 @@ class PluginManager:
             rawname = self.plugins[name].name
             self.pconf["plugins"][rawname]["enabled"] = False
             self.save_config()
+            self.rebuild_dispatch_table()
             return True
         return True
 
@@ -340,6 +388,7 @@ class PluginManager:
             del self.pconf["plugins"][rawname]
             self.loaded[dirname] = None
             self.save_config()
+            self.rebuild_dispatch_table()
             return True, "卸载插件成功"
         except Exception as e:
             logger.error("Failed to uninstall plugin, {}".format(e))
@@ -0,0 +1,42 @@
+import http.server
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import config  # noqa: E402
+
+config.config = config.Config({"session_backend": "memory"})  # 测试不在appdata中写入会话数据库
+
+
+@pytest.fixture
+def set_conf(monkeypatch):
+    """临时修改配置项，测试结束后恢复"""
+
+    def setter(**kwargs):
+        for key, value in kwargs.items():
+            monkeypatch.setitem(config.conf(), key, value)
+
+    return setter
+
+
+@pytest.fixture
+def http_server():
+    """在本地端口启动模拟外部接口的HTTP服务，传入请求处理类，返回服务地址；测试结束后关闭"""
+    servers = []
+
+    def serve(handler_class):
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler_class)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return "http://127.0.0.1:{}".format(server.server_address[1])
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
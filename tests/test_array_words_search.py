@@ -0,0 +1,73 @@
+import importlib.util
+import os
+import random
+
+import pytest
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plugins", "banwords", "lib")
+
+
+def load_lib(name):
+    # banwords插件目录不能作为包导入，按文件路径加载
+    spec = importlib.util.spec_from_file_location("banwords_" + name, os.path.join(LIB_DIR, name + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+ArrayWordsSearch = load_lib("ArrayWordsSearch").ArrayWordsSearch
+WordsSearch = load_lib("WordsSearch").WordsSearch
+
+
+def build(words):
+    legacy = WordsSearch()
+    legacy.SetKeywords(words)
+    return legacy, ArrayWordsSearch.from_keywords(words)
+
+
+def random_texts(chars, count, length):
+    return ["".join(random.choice(chars) for _ in range(random.randint(0, length))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_same_results_as_words_search(seed):
+    random.seed(seed)
+    # 字符集很小，关键词之间大量互为前缀、后缀和子串
+    chars = "abcde"
+    words = list({"".join(random.choice(chars) for _ in range(random.randint(1, 4))) for _ in range(30)})
+    legacy, search = build(words)
+    texts = random_texts(chars + "xyz", 200, 30)
+    for text in texts:
+        assert search.FindAll(text) == legacy.FindAll(text)
+        assert search.ContainsAny(text) == legacy.ContainsAny(text)
+        assert search.Replace(text) == legacy.Replace(text)
+        assert search.Replace(text, "#") == legacy.Replace(text, "#")
+        # 同一位置结束的多个关键词，FindFirst只保证结束位置一致
+        first, legacy_first = search.FindFirst(text), legacy.FindFirst(text)
+        assert (first is None) == (legacy_first is None)
+        assert first is None or first["End"] == legacy_first["End"]
+    assert search.FindAllBatch(texts) == [legacy.FindAll(text) for text in texts]
+
+
+def test_chinese_words_and_overlaps():
+    words = ["傻", "傻瓜", "瓜子", "坏人", "人坏"]
+    legacy, search = build(words)
+    for text in ["你是傻瓜子吗", "坏人坏事", "没有敏感词", "", "傻"]:
+        assert search.FindAll(text) == legacy.FindAll(text)
+        assert search.Replace(text) == legacy.Replace(text)
+    assert search.Replace("你是傻瓜子吗") == "你是***吗"
+    assert search.FindAllBatch(["傻瓜", "a\x00b"]) == [legacy.FindAll("傻瓜"), []]  # 文本包含分隔符时逐个查找
+
+
+def test_cache_reused_only_for_same_keywords(tmp_path):
+    cache_path = str(tmp_path / "banwords.cache")
+    ArrayWordsSearch.from_keywords(["苹果", "香蕉"], cache_path)
+
+    cached = ArrayWordsSearch()
+    assert cached.load(cache_path, ["苹果", "香蕉"])
+    assert cached.Replace("我爱吃香蕉") == "我爱吃**"
+    assert not ArrayWordsSearch().load(cache_path, ["苹果"])
+
+    rebuilt = ArrayWordsSearch.from_keywords(["苹果"], cache_path)
+    assert rebuilt.Replace("我爱吃香蕉和苹果") == "我爱吃香蕉和**"
+    assert ArrayWordsSearch().load(cache_path, ["苹果"])  # 词库变化后重新构建并覆盖缓存
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+from common.async_runtime import AsyncRuntime
+
+
+@pytest.fixture
+def runtime():
+    runtime = AsyncRuntime("test_async_runtime")
+    yield runtime
+    runtime.close()
+
+
+def test_coroutines_share_one_loop_thread(runtime):
+    async def current():
+        await asyncio.sleep(0)
+        return threading.current_thread(), asyncio.get_running_loop()
+
+    results = {runtime.run(current()) for _ in range(5)}
+    assert results == {(runtime.thread, runtime.loop)}
+    assert runtime.stats()["submitted"] == 5 and runtime.stats()["running"] == 0
+
+
+def test_run_timeout_cancels_coroutine(runtime):
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(FutureTimeoutError):
+        runtime.run(slow(), timeout=0.1)
+    assert cancelled.wait(5)
+
+
+def test_failures_counted_and_run_in_loop_thread_rejected(runtime):
+    async def boom():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        runtime.run(boom())
+    assert runtime.stats()["failed"] == 1
+
+    async def nested():
+        coro = asyncio.sleep(0)
+        runtime.run(coro)
+
+    with pytest.raises(RuntimeError):
+        runtime.run(nested())
+
+
+def test_call_later(runtime):
+    called = threading.Event()
+    runtime.call_later(0.05, lambda: called.set() if threading.current_thread() is runtime.thread else None)
+    assert called.wait(5)
+
+
+def test_shared_connector_survives_session_close(runtime):
+    pytest.importorskip("aiohttp")
+    import aiohttp
+
+    async def use_session():
+        connector = runtime.connector()
+        async with aiohttp.ClientSession(connector=connector, connector_owner=False):
+            pass
+        session = runtime.session()
+        return connector.closed, runtime.connector() is connector, runtime.session() is session
+
+    assert runtime.run(use_session()) == (False, True, True)
@@ -0,0 +1,65 @@
+import math
+import shutil
+import struct
+import wave
+
+import pytest
+
+from voice import audio_convert
+from voice.audio_convert import any_to_mp3, decode_to_pcm, encode_pcm, mp3_to_silk, pcm_duration, split_audio
+
+RATE = 24000
+
+
+def sine_pcm(seconds, rate=RATE):
+    return b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * 440 * i / rate))) for i in range(int(rate * seconds)))
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def test_wav_decoded_without_ffmpeg(monkeypatch):
+    pcm = sine_pcm(0.5)
+    monkeypatch.setattr(audio_convert, "FFMPEG", "ffmpeg-not-installed")
+    assert decode_to_pcm(encode_pcm(pcm, RATE, "wav"), RATE) == pcm
+    assert pcm_duration(pcm, RATE) == 500
+
+
+@pytest.mark.skipif(audio_convert.pilk is None and audio_convert.pysilk is None, reason="silk编解码库未安装")
+def test_silk_round_trip(tmp_path):
+    pcm = sine_pcm(1)
+    silk = encode_pcm(pcm, RATE, "silk")
+    assert silk[1:7] == b"#!SILK"  # 腾讯格式
+    decoded = decode_to_pcm(silk, RATE)
+    assert abs(len(decoded) - len(pcm)) <= RATE // 50 * 2  # silk按20ms一帧编码
+    silk_path = write(tmp_path / "voice.silk", silk)
+    assert decode_to_pcm(silk_path, RATE) == decoded
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg未安装")
+def test_mp3_to_silk_and_back(tmp_path):
+    wav_path = write(tmp_path / "tts.wav", encode_pcm(sine_pcm(2, 44100), 44100, "wav"))
+    silk_path = str(tmp_path / "tts.silk")
+    assert abs(mp3_to_silk(wav_path, silk_path) - 2000) <= 20
+    mp3_path = str(tmp_path / "voice.mp3")
+    any_to_mp3(silk_path, mp3_path)
+    with open(mp3_path, "rb") as f:
+        data = f.read()
+    assert data[:3] == b"ID3" or data[0] == 0xFF
+    assert abs(pcm_duration(decode_to_pcm(mp3_path, RATE), RATE) - 2000) <= 100
+
+
+def test_split_audio(tmp_path):
+    wav_path = write(tmp_path / "long.wav", encode_pcm(sine_pcm(2.5, 16000), 16000, "wav"))
+    duration, files = split_audio(wav_path, max_segment_length_ms=1000)
+    assert duration == 2500
+    assert files == [str(tmp_path / "long_{}.wav".format(i)) for i in range(1, 4)]
+    frames = []
+    for path in files:
+        with wave.open(path, "rb") as wav:
+            frames.append(wav.getnframes())
+    assert frames == [16000, 16000, 8000]
+    assert split_audio(wav_path, max_segment_length_ms=5000) == (2500, [wav_path])
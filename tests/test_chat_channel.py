@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from bridge.bridge import Bridge
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from channel.chat_channel import ChatChannel
+from channel.chat_message import ChatMessage
+from common.dequeue import Dequeue
+
+
+class FlakyImageMessage(ChatMessage):
+    """第一次下载失败，再次prepare时下载成功"""
+
+    deferred_download = True
+
+    def __init__(self, path):
+        super().__init__(None)
+        self.ctype = ContextType.IMAGE
+        self.content = path
+        self.attempts = 0
+
+    def prepare(self):
+        self.attempts += 1
+        if self.attempts == 1:
+            raise Exception("download failed")
+        with open(self.content, "wb") as f:
+            f.write(b"image")
+
+
+class ImageBot:
+    def __init__(self):
+        self.seen = []
+
+    def reply(self, query, context=None):
+        self.seen.append((context.content, os.path.exists(context.content)))
+        return Reply(ReplyType.TEXT, "")
+
+
+@pytest.fixture
+def image_bot():
+    bridge = Bridge()
+    old = bridge.bots.get("chat")
+    bridge.bots["chat"] = ImageBot()
+    yield bridge.bots["chat"]
+    bridge.bots["chat"] = old
+
+
+def test_image_is_prepared_before_bot(image_bot, tmp_path):
+    channel = ChatChannel.__new__(ChatChannel)  # 不启动consume线程
+    msg = FlakyImageMessage(str(tmp_path / "image.png"))
+    context = Context(ContextType.IMAGE, msg.content, session_id="image_user", msg=msg)
+
+    reply = channel._generate_reply(context, Reply())
+    assert reply.type == ReplyType.ERROR
+    assert image_bot.seen == []
+
+    channel._generate_reply(context, Reply())
+    assert msg.attempts == 2
+    assert image_bot.seen == [(msg.content, True)]
+
+
+def test_image_without_deferred_download_not_prepared(image_bot, tmp_path):
+    channel = ChatChannel.__new__(ChatChannel)
+    msg = FlakyImageMessage(str(tmp_path / "image.png"))
+    msg.deferred_download = False  # 图片在bot需要时才下载的通道，不在处理前下载
+    context = Context(ContextType.IMAGE, msg.content, session_id="image_user", msg=msg)
+    channel._generate_reply(context, Reply())
+    assert msg.attempts == 0
+    assert image_bot.seen == [(msg.content, False)]
+
+
+@pytest.fixture
+def busy_session():
+    """会话中已有一条消息在处理，并发名额已用完，新消息留在队列中，不会被consume线程取走"""
+    session_ids = []
+
+    def create(session_id):
+        semaphore = threading.BoundedSemaphore(1)
+        semaphore.acquire()
+        with ChatChannel.lock:
+            ChatChannel.sessions[session_id] = [Dequeue(), semaphore]
+        session_ids.append(session_id)
+        return ChatChannel.sessions[session_id][0]
+
+    yield create
+    channel = ChatChannel.__new__(ChatChannel)
+    for session_id in session_ids:
+        channel.cancel_session(session_id)
+        with ChatChannel.lock:
+            ChatChannel.sessions.pop(session_id, None)
+
+
+def test_drop_oldest_keeps_admin_commands(set_conf, busy_session):
+    set_conf(session_queue_max_size=2, session_queue_overflow_policy="drop_oldest")
+    channel = ChatChannel.__new__(ChatChannel)
+    context_queue = busy_session("overflow_user")
+    for content in ["1", "#stats", "2", "3"]:
+        channel.produce(Context(ContextType.TEXT, content, session_id="overflow_user"))
+    assert [context.content for context in context_queue.queue] == ["#stats", "3"]
+
+
+def test_drop_oldest_with_only_admin_commands_drops_newest(set_conf, busy_session):
+    set_conf(session_queue_max_size=1, session_queue_overflow_policy="drop_oldest")
+    channel = ChatChannel.__new__(ChatChannel)
+    context_queue = busy_session("admin_only_user")
+    for content in ["#a", "#b", "hello"]:
+        channel.produce(Context(ContextType.TEXT, content, session_id="admin_only_user"))
+    assert [context.content for context in context_queue.queue] == ["#b", "#a"]
+
+
+def test_global_limit_drop_has_own_reason(set_conf, busy_session, monkeypatch):
+    set_conf(max_inflight_messages=1, session_queue_max_size=0, session_queue_overflow_policy="drop_oldest")
+    monkeypatch.setattr(ChatChannel, "inflight", 1)
+    channel = ChatChannel.__new__(ChatChannel)
+    context_queue = busy_session("global_limit_user")
+    before = ChatChannel.overflow_counter.copy()
+    channel.produce(Context(ContextType.TEXT, "hello", session_id="global_limit_user"))
+    assert context_queue.empty()
+    assert ChatChannel.overflow_counter["global_limit"] - before["global_limit"] == 1
+    assert ChatChannel.overflow_counter["drop_newest"] == before["drop_newest"]
+
+
+class Scheduler:
+    """替换提交线程池的步骤，记录提交顺序，由测试决定任务何时结束"""
+
+    def __init__(self):
+        self.submitted = []  # [(context, future)]
+        self.submit_times = []
+        self.cond = threading.Condition()
+
+    def submit(self, context):
+        future = Future()
+        with self.cond:
+            self.submitted.append((context, future))
+            self.submit_times.append(time.monotonic())
+            self.cond.notify_all()
+        return future
+
+    def wait_for(self, count, timeout=5):
+        with self.cond:
+            assert self.cond.wait_for(lambda: len(self.submitted) >= count, timeout), [c.content for c, _ in self.submitted]
+        time.sleep(0.05)  # 确认没有多提交
+        return [context.content for context, _ in self.submitted]
+
+    def finish(self, index):
+        self.submitted[index][1].set_result(None)
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    # 会话状态在所有通道实例间共享，其他测试留下的consume线程也可能调度，因此在类上替换
+    scheduler = Scheduler()
+    monkeypatch.setattr(ChatChannel, "_submit_handle", scheduler.submit)
+    ChatChannel()  # 启动consume线程
+    return scheduler
+
+
+def test_session_order_and_concurrency_limit(scheduler, set_conf):
+    set_conf(concurrency_in_session=2, session_queue_max_size=0, max_inflight_messages=0)
+    channel = ChatChannel.__new__(ChatChannel)
+    for content in ["1", "2", "3", "4"]:
+        channel.produce(Context(ContextType.TEXT, content, session_id="order_user"))
+    assert scheduler.wait_for(2) == ["1", "2"]  # 同一会话最多同时处理2条
+
+    finished_at = time.monotonic()
+    scheduler.finish(0)
+    assert scheduler.wait_for(3) == ["1", "2", "3"]
+    assert scheduler.submit_times[2] - finished_at < 0.05  # 任务结束即唤醒，不再等待0.2秒的轮询
+
+    scheduler.finish(1)
+    assert scheduler.wait_for(4) == ["1", "2", "3", "4"]
+    scheduler.finish(2)
+    scheduler.finish(3)
+    for _ in range(100):
+        if "order_user" not in ChatChannel.sessions:
+            break
+        time.sleep(0.01)
+    assert "order_user" not in ChatChannel.sessions  # 处理完毕后删除会话
+
+
+def test_admin_command_jumps_queue(scheduler, set_conf):
+    set_conf(concurrency_in_session=1, session_queue_max_size=0, max_inflight_messages=0)
+    channel = ChatChannel.__new__(ChatChannel)
+    channel.produce(Context(ContextType.TEXT, "a", session_id="admin_user"))
+    assert scheduler.wait_for(1) == ["a"]
+    for content in ["b", "c", "#stats"]:
+        channel.produce(Context(ContextType.TEXT, content, session_id="admin_user"))
+    scheduler.finish(0)
+    assert scheduler.wait_for(2) == ["a", "#stats"]
+    scheduler.finish(1)
+    assert scheduler.wait_for(3) == ["a", "#stats", "b"]
+    scheduler.finish(2)
+    assert scheduler.wait_for(4) == ["a", "#stats", "b", "c"]
+    scheduler.finish(3)
+
+
+def test_sessions_do_not_block_each_other(scheduler, set_conf):
+    set_conf(concurrency_in_session=1, session_queue_max_size=0, max_inflight_messages=0)
+    channel = ChatChannel.__new__(ChatChannel)
+    channel.produce(Context(ContextType.TEXT, "slow", session_id="busy_user"))
+    channel.produce(Context(ContextType.TEXT, "queued", session_id="busy_user"))
+    channel.produce(Context(ContextType.TEXT, "other", session_id="other_user"))
+    assert sorted(scheduler.wait_for(2)) == ["other", "slow"]
+    scheduler.finish(0)
+    scheduler.finish(1)
+    assert scheduler.wait_for(3)[2] == "queued"
+    scheduler.finish(2)
+
+
+def test_stream_reply_flushes_while_stream_stalls(set_conf, monkeypatch):
+    set_conf(stream_min_chunk_size=100, stream_flush_interval=0.1)
+    channel = ChatChannel.__new__(ChatChannel)
+    sent = []
+    monkeypatch.setattr(channel, "_decorate_reply", lambda context, reply: reply, raising=False)
+    monkeypatch.setattr(channel, "_send_reply", lambda context, reply: sent.append((reply.content, time.monotonic())), raising=False)
+    start = time.monotonic()
+
+    def text_stream():
+        yield "第一句。第二"
+        time.sleep(0.5)  # 模型停顿，期间不会有新的片段
+        yield "句"
+
+    context = Context(ContextType.TEXT, "hi", session_id="stream_user")
+    assert channel.send_stream_reply(context, text_stream()) == "第一句。第二句"
+    assert [content for content, _ in sent] == ["第一句。", "第二句"]
+    assert sent[0][1] - start < 0.4
@@ -0,0 +1,35 @@
+import copy
+
+from bot.chatgpt.chat_gpt_session import ChatGPTSession, num_tokens_from_messages
+
+MODEL = "wenxin"  # 按字符计数，不需要下载tiktoken的编码文件
+
+
+def legacy_discard_exceeding(session, max_tokens):
+    cur_tokens = num_tokens_from_messages(session.messages, session.model)
+    while cur_tokens > max_tokens and len(session.messages) > 2:
+        session.messages.pop(1)
+        cur_tokens = num_tokens_from_messages(session.messages, session.model)
+    return cur_tokens
+
+
+def test_incremental_discard_matches_full_recount():
+    session = ChatGPTSession("tokens", system_prompt="You are a helpful assistant.", model=MODEL)
+    for i in range(50):
+        session.add_query("question {} ".format(i) * (i % 7 + 1))
+        session.add_reply("answer {} ".format(i) * (i % 5 + 1))
+        for max_tokens in [2000, 500, 120]:
+            legacy = copy.deepcopy(session)
+            legacy.model = session.model  # model不随会话复制和保存，由SessionManager设置
+            expected = legacy_discard_exceeding(legacy, max_tokens)
+            assert session.discard_exceeding(max_tokens) == expected
+            assert session.messages == legacy.messages
+            assert session.calc_tokens() == num_tokens_from_messages(session.messages, MODEL)
+
+
+def test_reset_keeps_system_prompt():
+    session = ChatGPTSession("reset", system_prompt="system", model=MODEL)
+    session.add_query("hello")
+    session.reset()
+    assert session.messages == [{"role": "system", "content": "system"}]
+    assert session.calc_tokens() == len("system")
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from common.credential_cache import CredentialCache
+
+
+class Fetcher:
+    """记录调用次数，可阻塞直到测试放行，按顺序返回预设结果"""
+
+    def __init__(self, *results, block=False):
+        self.results = list(results)
+        self.calls = 0
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def __call__(self):
+        self.calls += 1
+        self.release.wait(5)
+        result = self.results.pop(0) if len(self.results) > 1 else self.results[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def get_concurrently(cache, count=8):
+    results = [None] * count
+
+    def worker(i):
+        try:
+            results[i] = cache.get()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def test_concurrent_get_fetches_once():
+    fetcher = Fetcher(("token-1", 7200), block=True)
+    cache = CredentialCache("test", fetcher)
+    threads, results = get_concurrently(cache)
+    time.sleep(0.1)  # 其余线程都在等待第一个线程的请求
+    fetcher.release.set()
+    for t in threads:
+        t.join(5)
+    assert results == ["token-1"] * len(threads)
+    assert fetcher.calls == 1
+    assert cache.stats()["refreshes"] == 1
+
+
+def test_fetch_error_reaches_all_waiters():
+    fetcher = Fetcher(Exception("appsecret invalid"), ("token-1", 7200), block=True)
+    cache = CredentialCache("test", fetcher)
+    threads, results = get_concurrently(cache)
+    time.sleep(0.1)
+    fetcher.release.set()
+    for t in threads:
+        t.join(5)
+    assert all(isinstance(r, Exception) and "appsecret invalid" in str(r) for r in results)
+    assert fetcher.calls == 1
+    assert cache.stats()["failures"] == 1
+    assert cache.get() == "token-1"  # 之后的调用重新请求
+
+
+def test_empty_credential_is_an_error():
+    cache = CredentialCache("test", Fetcher(("", 7200)))
+    with pytest.raises(Exception, match="empty credential"):
+        cache.get()
+
+
+def test_refresh_if_needed_refreshes_before_expiry():
+    fetcher = Fetcher(("token-1", 200), ("token-2", 7200))
+    cache = CredentialCache("test", fetcher, refresh_ahead=300, expire_margin=60)
+    cache.refresh_if_needed()  # 还没有凭证时不请求
+    assert fetcher.calls == 0
+    assert cache.get() == "token-1"
+    cache.refresh_if_needed()  # 距过期不足300秒，提前刷新
+    assert fetcher.calls == 2
+    assert cache.get() == "token-2"
+    cache.refresh_if_needed()
+    assert fetcher.calls == 2
+
+
+def test_invalidate_forces_refetch():
+    fetcher = Fetcher(("token-1", 7200), ("token-2", 7200))
+    cache = CredentialCache("test", fetcher)
+    assert cache.get() == "token-1"
+    assert cache.get() == "token-1"
+    cache.invalidate()
+    assert cache.get() == "token-2"
+    assert fetcher.calls == 2
+    assert cache.stats()["hits"] == 1
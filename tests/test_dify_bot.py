@@ -0,0 +1,62 @@
+import http.server
+import json
+
+import pytest
+
+from bot.dify.dify_bot import DifyBot
+from bridge.context import Context, ContextType
+from bridge.reply import ReplyType
+from channel.chat_channel import ChatChannel
+from channel.chat_message import ChatMessage
+from common import memory
+
+
+class StubDifyHandler(http.server.BaseHTTPRequestHandler):
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path.endswith("/files/upload"):
+            self.requests.append(("upload", None))
+            self._reply("application/json", json.dumps({"id": "file-1"}).encode())
+            return
+        payload = json.loads(body)
+        self.requests.append((payload["response_mode"], payload["files"]))
+        if payload["response_mode"] == "streaming":
+            # 流式请求在发出任何内容前出错，bot应回退为非流式请求
+            self._reply("text/event-stream", b'data: {"event": "error", "message": "boom"}\n\n')
+        else:
+            self._reply("application/json", json.dumps({"answer": "看到图片了", "conversation_id": "c1", "metadata": {}}).encode())
+
+    def _reply(self, content_type, body):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def dify_api(http_server):
+    StubDifyHandler.requests = []
+    return http_server(StubDifyHandler) + "/v1"
+
+
+def test_stream_fallback_keeps_uploaded_image(dify_api, set_conf, tmp_path):
+    set_conf(channel_type="web", dify_api_base=dify_api, dify_api_key="test", image_recognition=True, stream_reply=True)
+    image = tmp_path / "image.png"
+    image.write_bytes(b"image")
+    msg = ChatMessage(None)
+    msg.other_user_id = "dify_user"
+    memory.USER_IMAGE_CACHE["dify_user"] = {"msg": msg, "path": str(image)}
+    channel = ChatChannel.__new__(ChatChannel)  # 不启动consume线程
+    context = Context(ContextType.TEXT, "这是什么", session_id="dify_user", msg=msg, channel=channel)
+
+    reply = DifyBot().reply("这是什么", context)
+
+    assert reply.type == ReplyType.TEXT and reply.content == "看到图片了"
+    file_ref = [{"type": "image", "transfer_method": "local_file", "upload_file_id": "file-1"}]
+    assert StubDifyHandler.requests == [("upload", None), ("streaming", file_ref), ("blocking", file_ref)]
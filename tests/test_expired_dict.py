@@ -0,0 +1,44 @@
+import time
+
+import pytest
+
+from common.expired_dict import ExpiredDict
+
+
+def test_expiry_and_refresh_on_read():
+    d = ExpiredDict(0.2)
+    d["a"] = 1
+    d["b"] = 2
+    time.sleep(0.12)
+    assert d["a"] == 1  # 读取刷新过期时间
+    time.sleep(0.12)
+    assert "a" in d
+    assert "b" not in d
+    with pytest.raises(KeyError):
+        d["b"]
+    assert d.keys() == ["a"]
+    assert len(d) == 1
+
+
+def test_lru_eviction_and_callback():
+    evicted = []
+    d = ExpiredDict(60, max_size=2, on_evict=lambda key, value, reason: evicted.append((key, reason)))
+    d["a"] = 1
+    d["b"] = 2
+    d.get("a")
+    d["c"] = 3
+    assert sorted(d.keys()) == ["a", "c"]
+    assert evicted == [("b", "size")]
+    assert d.pop("a") == 1
+    assert d.items() == [("c", 3)]
+
+
+def test_set_with_custom_ttl():
+    d = ExpiredDict(60)
+    d.set("short", 1, expires_in_seconds=0.05)
+    d["long"] = 2
+    time.sleep(0.08)
+    assert "short" not in d
+    assert d.get("long") == 2
+    d.purge()
+    assert d.stats()["size"] == 1
@@ -0,0 +1,71 @@
+import http.server
+import json
+
+import pytest
+
+from channel.fastgpt import fastgpt_client
+from channel.fastgpt.fastgpt_client import FastGPTClient
+
+
+def answer(content):
+    return "event: answer\ndata: {}\n\n".format(json.dumps({"choices": [{"delta": {"content": content}}]}, ensure_ascii=False))
+
+
+class StubFastGPTHandler(http.server.BaseHTTPRequestHandler):
+    events = []
+    requests = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append((self.path, payload.get("stream")))
+        if self.path != "/api/v1/chat/completions":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for event in self.events:
+            self.wfile.write(event.encode("utf-8"))
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fastgpt_api(http_server, set_conf):
+    StubFastGPTHandler.requests = []
+    base = http_server(StubFastGPTHandler)
+    set_conf(fastgpt_api_base=base, fastgpt_api_key="test")
+    yield base
+    fastgpt_client._endpoint_cache.pop(base, None)
+
+
+def test_chat_completion_stream_yields_answer_deltas(fastgpt_api):
+    StubFastGPTHandler.events = [
+        answer("你好，"),
+        'event: flowNodeStatus\ndata: {"status": "running"}\n\n',
+        answer("我是助手。"),
+        "data: not-json\n\n",
+        "data: [DONE]\n\n",
+        answer("不应出现"),
+    ]
+    chunks = list(FastGPTClient().chat_completion_stream([{"role": "user", "content": "hi"}], chat_id="c1"))
+    assert chunks == ["你好，", "我是助手。"]
+    # 依次探测URL，成功后缓存，下次直接请求
+    assert [path for path, _ in StubFastGPTHandler.requests] == ["/chat/completions", "/v1/chat/completions", "/api/v1/chat/completions"]
+    assert all(stream for _, stream in StubFastGPTHandler.requests)
+
+    list(FastGPTClient().chat_completion_stream([{"role": "user", "content": "hi"}]))
+    assert StubFastGPTHandler.requests[-1][0] == "/api/v1/chat/completions"
+    assert len(StubFastGPTHandler.requests) == 4
+
+
+def test_chat_completion_stream_raises_error_event(fastgpt_api):
+    StubFastGPTHandler.events = [answer("部分"), 'event: error\ndata: {"message": "boom"}\n\n']
+    stream = FastGPTClient().chat_completion_stream([{"role": "user", "content": "hi"}])
+    assert next(stream) == "部分"
+    with pytest.raises(Exception, match="boom"):
+        next(stream)
@@ -0,0 +1,73 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+from channel.gewechat.gewechat_async_server import CallbackServer  # noqa: E402
+
+
+def run_with_client(server: CallbackServer, scenario):
+    async def main():
+        async with TestClient(TestServer(server.build_app())) as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+def test_callback_acked_then_handled_in_background():
+    received = []
+    done = threading.Event()
+
+    def handler(data):
+        received.append(data)
+        done.set()
+
+    server = CallbackServer(handler, "/callback", workers=1)
+
+    async def scenario(client):
+        resp = await client.post("/callback", data=json.dumps({"TypeName": "AddMsg"}))
+        return resp.status, await resp.text()
+
+    assert run_with_client(server, scenario) == (200, "success")
+    assert done.wait(5)
+    assert received == [{"TypeName": "AddMsg"}]
+    assert server.stats()["accepted"] == 1
+
+
+def test_full_queue_returns_503_for_retry():
+    block = threading.Event()
+    server = CallbackServer(lambda data: block.wait(5), "/callback", workers=1, queue_size=1)
+
+    async def scenario(client):
+        statuses = []
+        for _ in range(4):
+            resp = await client.post("/callback", data="{}")
+            statuses.append(resp.status)
+        return statuses
+
+    statuses = run_with_client(server, scenario)
+    block.set()
+    assert statuses[0] == 200
+    assert statuses[-1] == 503  # 处理线程被阻塞，队列满后拒绝，由gewechat重试
+    assert server.stats()["rejected"] == statuses.count(503)
+
+
+def test_file_download_limited_to_tmp_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "tmp").mkdir()
+    (tmp_path / "tmp" / "voice.silk").write_bytes(b"silk")
+    (tmp_path / "secret.txt").write_text("secret")
+    server = CallbackServer(lambda data: None, "/callback", workers=1)
+
+    async def scenario(client):
+        results = []
+        for file in ["tmp/voice.silk", "tmp/../secret.txt", "tmp/missing.silk"]:
+            resp = await client.get("/callback", params={"file": file})
+            results.append((resp.status, await resp.read() if resp.status == 200 else None))
+        return results
+
+    assert run_with_client(server, scenario) == [(200, b"silk"), (403, None), (404, None)]
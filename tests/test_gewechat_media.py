@@ -0,0 +1,76 @@
+import http.server
+import os
+
+import pytest
+
+from channel.gewechat.gewechat_media import MediaDownloader
+
+
+class FileHandler(http.server.BaseHTTPRequestHandler):
+    served = []
+
+    def do_GET(self):
+        self.served.append(self.path)
+        if self.path.startswith("/missing"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path.startswith("/truncated"):  # 声明的长度大于实际发送的内容，下载中途断开
+            self.send_response(200)
+            self.send_header("Content-Length", "100000")
+            self.end_headers()
+            self.wfile.write(b"x" * 1000)
+            self.close_connection = True
+            return
+        body = self.path.encode() * 1000
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def file_server(http_server):
+    FileHandler.served = []
+    return http_server(FileHandler)
+
+
+def test_same_msg_downloaded_once(file_server, tmp_path):
+    downloader = MediaDownloader(max_workers=2)
+    path = str(tmp_path / "1.png")
+    futures = [downloader.submit("msg_1", downloader.download_to_file, file_server + "/1.png", path) for _ in range(5)]
+    assert len({id(future) for future in futures}) == 1
+    assert futures[0].result(timeout=5) == len(b"/1.png") * 1000
+    assert open(path, "rb").read() == b"/1.png" * 1000
+    assert not os.path.exists(path + ".part")
+    assert FileHandler.served == ["/1.png"]
+    assert downloader.stats()["deduplicated"] == 4
+
+
+def test_failed_download_retried(file_server, tmp_path):
+    downloader = MediaDownloader(max_workers=2)
+    path = str(tmp_path / "2.png")
+    future = downloader.submit("msg_2", downloader.download_to_file, file_server + "/missing.png", path)
+    with pytest.raises(Exception):
+        future.result(timeout=5)
+    assert not os.path.exists(path)
+
+    retry = downloader.submit("msg_2", downloader.download_to_file, file_server + "/2.png", path)
+    assert retry is not future
+    retry.result(timeout=5)
+    assert os.path.exists(path)
+    assert downloader.stats()["failed"] == 1
+
+
+def test_interrupted_download_leaves_no_partial_file(file_server, tmp_path):
+    downloader = MediaDownloader(max_workers=1)
+    path = str(tmp_path / "3.png")
+    future = downloader.submit("msg_3", downloader.download_to_file, file_server + "/truncated.png", path)
+    with pytest.raises(Exception):
+        future.result(timeout=5)
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + ".part")
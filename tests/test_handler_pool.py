@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from common.handler_pool import HandlerPool
+
+
+def test_stats_count_queued_active_and_completed():
+    pool = HandlerPool("test", 1)
+    started, release = threading.Event(), threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    first = pool.submit(block)
+    assert started.wait(5)
+    second = pool.submit(lambda: None)
+    stats = pool.stats()
+    assert stats == {"workers": 1, "active": 1, "queued": 1, "utilization": "100%", "completed": 0}
+
+    release.set()
+    first.result(5)
+    second.result(5)
+    stats = pool.stats()
+    assert (stats["active"], stats["queued"], stats["completed"]) == (0, 0, 2)
+    assert stats["utilization"] == "0%"
+
+
+def test_cancelled_task_leaves_queue():
+    pool = HandlerPool("test", 1)
+    release = threading.Event()
+    pool.submit(release.wait, 5)
+    queued = pool.submit(lambda: None)
+    assert queued.cancel()
+    assert pool.stats()["queued"] == 0
+    release.set()
+
+
+def test_resize_keeps_running_tasks():
+    pool = HandlerPool("test", 1)
+    started, release = threading.Event(), threading.Event()
+    running = pool.submit(lambda: (started.set(), release.wait(5))[1])
+    assert started.wait(5)
+
+    pool.resize(3)
+    assert pool.stats()["workers"] == 3
+    # 旧池的唯一线程仍被占用，新提交的任务在新池中立即执行
+    assert pool.submit(lambda: "done").result(5) == "done"
+    release.set()
+    assert running.result(5) is True
+    assert pool.stats()["completed"] == 2
+
+    with pytest.raises(ValueError):
+        pool.resize(0)
+
+
+def test_reopen_after_shutdown():
+    pool = HandlerPool("test", 1)
+    assert not pool.is_shutdown
+    pool.executor.shutdown()
+    assert pool.is_shutdown
+    pool.reopen()
+    assert not pool.is_shutdown
+    assert pool.submit(lambda: 1).result(5) == 1
@@ -0,0 +1,98 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+
+from common import http_client
+from common.http_client import request_with_retry
+
+URL = "http://fastgpt.test/api/v1/chat/completions"
+
+
+class FakeSession:
+    """按顺序返回预设的响应或抛出预设的异常"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def response(status_code):
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp._content = b"{}"
+    return resp
+
+
+def refused():
+    return requests.exceptions.ConnectionError(MaxRetryError(None, URL, reason=NewConnectionError(None, "Connection refused")))
+
+
+def reset():
+    return requests.exceptions.ConnectionError(ProtocolError("Connection aborted.", ConnectionResetError()))
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    delays = []
+    monkeypatch.setattr(http_client, "time", SimpleNamespace(monotonic=time.monotonic, sleep=delays.append))
+    monkeypatch.setattr(http_client, "random", SimpleNamespace(uniform=lambda a, b: 1.0))
+    return delays
+
+
+def test_connect_error_retried_for_post_with_backoff(delays):
+    session = FakeSession(refused(), requests.exceptions.ConnectTimeout(), response(200))
+    resp, phases = request_with_retry(session, "POST", URL, max_retries=2, backoff=0.5)
+    assert resp.status_code == 200
+    assert session.calls == 3
+    assert delays == [0.5, 1.0]
+    assert set(phases) == {"connect", "ttfb", "total"}
+
+
+def test_post_not_retried_after_request_sent(delays):
+    session = FakeSession(reset(), response(200))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        request_with_retry(session, "POST", URL)
+    assert session.calls == 1
+
+    session = FakeSession(response(502), response(200))
+    resp, _ = request_with_retry(session, "POST", URL)
+    assert resp.status_code == 502
+    assert session.calls == 1
+    assert delays == []
+
+
+def test_idempotent_method_retries_server_error_and_reset(delays):
+    session = FakeSession(response(503), reset(), response(200))
+    resp, _ = request_with_retry(session, "get", URL, max_retries=2, backoff=0.1)
+    assert resp.status_code == 200
+    assert session.calls == 3
+    assert delays == pytest.approx([0.1, 0.2])
+
+
+def test_gives_up_after_max_retries(delays):
+    session = FakeSession(response(500), response(500), response(500))
+    resp, _ = request_with_retry(session, "GET", URL, max_retries=2)
+    assert resp.status_code == 500
+    assert session.calls == 3
+
+    session = FakeSession(refused(), refused())
+    with pytest.raises(requests.exceptions.ConnectionError):
+        request_with_retry(session, "POST", URL, max_retries=1)
+    assert session.calls == 2
+
+
+def test_read_timeout_not_retried(delays):
+    session = FakeSession(requests.exceptions.ReadTimeout(), response(200))
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        request_with_retry(session, "GET", URL)
+    assert session.calls == 1
@@ -0,0 +1,95 @@
+import http.server
+import importlib.util
+import json
+import os
+import threading
+import time
+
+import pytest
+
+# linkai插件目录不能作为包导入，按文件路径加载
+_spec = importlib.util.spec_from_file_location(
+    "mj_tracker", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plugins", "linkai", "mj_tracker.py")
+)
+mj_tracker = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(mj_tracker)
+
+
+class TaskHandler(http.server.BaseHTTPRequestHandler):
+    polls = {}  # task_id -> 查询次数
+    finish_after = {}  # task_id -> 第几次查询时完成，None表示返回500
+
+    def do_GET(self):
+        task_id = self.path.rsplit("/", 1)[-1]
+        self.polls[task_id] = self.polls.get(task_id, 0) + 1
+        finish_after = self.finish_after[task_id]
+        if finish_after is None:
+            self.send_response(500)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        status = "FINISHED" if self.polls[task_id] >= finish_after else "PENDING"
+        body = json.dumps({"code": 200, "data": {"status": status, "img_id": task_id}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def task_api(http_server):
+    TaskHandler.polls, TaskHandler.finish_after = {}, {}
+    return http_server(TaskHandler) + "/tasks/"
+
+
+def test_tasks_polled_until_finished(task_api):
+    tracker = mj_tracker.MJTaskTracker(schedule=((None, 0.02),))
+    finished = {}
+    done = threading.Event()
+
+    def on_finished(data):
+        finished[data["img_id"]] = threading.current_thread().name
+        if len(finished) == 3:
+            done.set()
+
+    for i, finish_after in enumerate([1, 3, 5]):
+        TaskHandler.finish_after["t{}".format(i)] = finish_after
+        tracker.track("t{}".format(i), task_api + "t{}".format(i), {}, on_finished)
+    assert done.wait(5)
+    assert TaskHandler.polls == {"t0": 1, "t1": 3, "t2": 5}
+    stats = tracker.stats()
+    assert (stats["pending"], stats["polls"], stats["finished"]) == (0, 9, 3)
+
+
+def test_task_expires_after_consecutive_errors(task_api):
+    tracker = mj_tracker.MJTaskTracker(schedule=((None, 0.02),), max_errors=3)
+    expired = threading.Event()
+    TaskHandler.finish_after["bad"] = None
+    tracker.track("bad", task_api + "bad", {}, lambda data: None, expired.set)
+    assert expired.wait(5)
+    assert TaskHandler.polls["bad"] == 3
+    assert tracker.stats()["expired"] == 1
+
+
+def test_task_expires_after_max_duration(task_api):
+    tracker = mj_tracker.MJTaskTracker(schedule=((None, 0.05),), max_duration=0.2)
+    expired = threading.Event()
+    TaskHandler.finish_after["slow"] = 1000
+    start = time.monotonic()
+    tracker.track("slow", task_api + "slow", {}, lambda data: None, expired.set)
+    assert expired.wait(5)
+    assert time.monotonic() - start >= 0.2
+    assert not tracker.tasks
+
+
+def test_interval_follows_schedule():
+    tracker = mj_tracker.MJTaskTracker()
+    task = mj_tracker.TrackedTask("t", "", {}, None, None)
+    intervals = []
+    for age in [0, 60, 200, 1000]:
+        task.start_time = time.monotonic() - age
+        intervals.append(tracker._interval(task))
+    assert intervals == [10, 5, 10, 15]
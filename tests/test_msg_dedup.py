@@ -0,0 +1,36 @@
+import time
+
+from common.msg_dedup import MessageDeduplicator
+
+
+def test_duplicates_detected_across_restart(tmp_path):
+    path = str(tmp_path / "msg_ids.txt")
+    dedup = MessageDeduplicator(persist_path=path)
+    assert not dedup.is_duplicate(1)
+    assert dedup.is_duplicate(1)
+    assert not dedup.is_duplicate(None)
+
+    dedup = MessageDeduplicator(persist_path=path)
+    assert dedup.is_duplicate("1")
+    assert dedup.stats()["duplicates"] == 1
+
+
+def test_loaded_ids_keep_remaining_ttl(tmp_path):
+    path = tmp_path / "msg_ids.txt"
+    now = int(time.time())
+    path.write_text("{} old\n{} expired\n".format(now + 2, now - 1))
+    dedup = MessageDeduplicator(expires_in_seconds=3600, persist_path=str(path))
+    assert dedup.stats()["size"] == 1
+    time.sleep(2.1)
+    assert not dedup.is_duplicate("old")  # 重启前只剩不到2秒，不能重新按1小时计时
+    assert not dedup.is_duplicate("expired")
+
+
+def test_forgotten_ids_can_be_processed_again(tmp_path):
+    path = str(tmp_path / "msg_ids.txt")
+    dedup = MessageDeduplicator(persist_path=path)
+    assert not dedup.is_duplicate("failed")
+    dedup.forget("failed")
+    assert not MessageDeduplicator(persist_path=path).is_duplicate("failed")
+    assert not dedup.is_duplicate("failed")
+    assert dedup.is_duplicate("failed")
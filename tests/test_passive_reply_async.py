@@ -0,0 +1,47 @@
+import asyncio
+import threading
+import time
+
+from channel.wechatmp.wechatmp_channel import ReplyWaiter
+
+
+def test_async_wait_woken_by_notify_from_thread():
+    ready = set()
+    waiter = ReplyWaiter(lambda from_user: from_user in ready)
+
+    def reply_later():
+        time.sleep(0.1)
+        ready.add("u1")
+        waiter.notify("u1")
+
+    async def main():
+        threading.Thread(target=reply_later).start()
+        start = time.monotonic()
+        result = await waiter.wait_async("u1", 5)
+        return result, time.monotonic() - start
+
+    result, elapsed = asyncio.run(main())
+    assert result is True
+    assert elapsed < 1  # 被notify唤醒，而不是等到超时
+    assert not waiter.listeners
+
+
+def test_async_wait_times_out_and_notify_other_user_does_not_wake():
+    ready = set()
+    waiter = ReplyWaiter(lambda from_user: from_user in ready)
+
+    async def main():
+        task = asyncio.ensure_future(waiter.wait_async("u1", 0.3))
+        await asyncio.sleep(0.05)
+        ready.add("u2")
+        waiter.notify("u2")
+        return await task
+
+    assert asyncio.run(main()) is False
+    assert not waiter.listeners
+
+
+def test_ready_before_wait_returns_immediately():
+    waiter = ReplyWaiter(lambda from_user: True)
+    assert asyncio.run(waiter.wait_async("u1", 5)) is True
+    assert waiter.wait("u1", 5) is True
@@ -0,0 +1,82 @@
+from collections import namedtuple
+
+import pytest
+
+from common.sorted_dict import SortedDict
+from plugins import PluginManager
+from plugins.event import Event, EventAction, EventContext
+
+PluginInfo = namedtuple("PluginInfo", ["priority", "enabled"])
+
+
+class RecordingPlugin:
+    def __init__(self, name, calls, action=None):
+        self.name = name
+        self.calls = calls
+        self.action = action
+        self.handlers = {Event.ON_HANDLE_CONTEXT: self.on_handle_context}
+
+    def on_handle_context(self, e_context, *args, **kwargs):
+        self.calls.append(self.name)
+        if self.action:
+            e_context.action = self.action
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    # PluginManager是单例，替换为空的插件表，测试结束后恢复
+    manager = PluginManager()
+    monkeypatch.setattr(manager, "plugins", SortedDict(lambda k, v: v.priority, reverse=True))
+    monkeypatch.setattr(manager, "instances", {})
+    monkeypatch.setattr(manager, "listening_plugins", {})
+    monkeypatch.setattr(manager, "dispatch_table", {})
+    monkeypatch.setattr(manager, "handler_stats", {})
+    return manager
+
+
+def add_plugin(manager, name, priority, calls, enabled=True, action=None):
+    manager.plugins[name] = PluginInfo(priority, enabled)
+    manager.instances[name] = RecordingPlugin(name, calls, action)
+    manager.listening_plugins.setdefault(Event.ON_HANDLE_CONTEXT, []).append(name)
+
+
+def emit(manager):
+    return manager.emit_event(EventContext(Event.ON_HANDLE_CONTEXT, {"channel": None, "context": None}))
+
+
+def test_dispatch_by_priority_skips_disabled(manager):
+    calls = []
+    add_plugin(manager, "LOW", 1, calls)
+    add_plugin(manager, "OFF", 5, calls, enabled=False)
+    add_plugin(manager, "HIGH", 10, calls)
+    manager.refresh_order()
+
+    emit(manager)
+    assert calls == ["HIGH", "LOW"]
+    assert {name: stats.count for name, _, stats in manager.get_handler_stats()} == {"HIGH": 1, "LOW": 1}
+    # 没有插件监听的事件直接返回
+    assert manager.emit_event(EventContext(Event.ON_SEND_REPLY, {})).action == EventAction.CONTINUE
+
+
+def test_break_stops_chain(manager):
+    calls = []
+    add_plugin(manager, "FIRST", 10, calls, action=EventAction.BREAK)
+    add_plugin(manager, "SECOND", 1, calls)
+    manager.refresh_order()
+
+    e_context = emit(manager)
+    assert calls == ["FIRST"]
+    assert e_context["breaked_by"] == "FIRST"
+
+
+def test_table_rebuilt_when_priority_changes(manager):
+    calls = []
+    add_plugin(manager, "A", 1, calls)
+    add_plugin(manager, "B", 2, calls)
+    manager.refresh_order()
+    emit(manager)
+
+    manager.plugins["A"] = PluginInfo(3, True)
+    manager.refresh_order()
+    emit(manager)
+    assert calls == ["B", "A", "A", "B"]
@@ -0,0 +1,131 @@
+import time
+
+from bot.chatgpt.chat_gpt_session import ChatGPTSession
+from bot.session_manager import SessionManager
+from common.session_store import PersistentSessionDict, SQLiteSessionStore, session_namespace
+
+
+class DemoSession:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.messages = []
+
+
+def open_sessions(tmp_path, **kwargs):
+    return PersistentSessionDict(SQLiteSessionStore(str(tmp_path / "sessions.db")), "demo", **kwargs)
+
+
+def test_in_place_changes_written_after_settle_and_survive_restart(tmp_path):
+    sessions = open_sessions(tmp_path, settle=0.2)
+    sessions["u1"] = DemoSession("u1")
+    sessions["u1"].messages.append("hello")
+    sessions.flush()
+    assert sessions.store.count("demo") == 0  # 会话刚被访问，可能仍在修改中
+    time.sleep(0.3)
+    sessions.flush()
+    assert sessions.store.count("demo") == 1
+
+    sessions["u1"].messages.append("world")
+    sessions.flush(force=True)
+    restarted = open_sessions(tmp_path)
+    assert len(restarted) == 0  # 懒加载，访问时才从磁盘读取
+    assert "u1" in restarted
+    assert restarted["u1"].messages == ["hello", "world"]
+    assert "u2" not in restarted
+
+
+def test_evicted_sessions_written_back_and_reloaded(tmp_path):
+    sessions = open_sessions(tmp_path, max_resident=2)
+    for i in range(5):
+        sessions["u{}".format(i)] = DemoSession("u{}".format(i))
+        sessions["u{}".format(i)].messages.append(i)
+    assert len(sessions) == 2
+    # 移出内存但尚未写入磁盘的会话从pending中读取
+    assert sessions["u0"].messages == [0]
+    sessions.flush(force=True)
+    assert sessions.store.count("demo") == 5
+    assert [open_sessions(tmp_path)["u{}".format(i)].messages for i in range(5)] == [[i] for i in range(5)]
+
+
+def test_delete_and_clear(tmp_path):
+    sessions = open_sessions(tmp_path)
+    sessions["u1"] = DemoSession("u1")
+    sessions["u2"] = DemoSession("u2")
+    sessions.flush(force=True)
+    del sessions["u1"]
+    assert "u1" not in sessions
+    sessions.flush(force=True)
+    assert "u1" not in open_sessions(tmp_path)
+    assert "u2" in open_sessions(tmp_path)
+    sessions.clear()
+    assert "u2" not in open_sessions(tmp_path)
+
+
+def test_expired_sessions_not_loaded(tmp_path):
+    sessions = open_sessions(tmp_path, expires_in_seconds=3600)
+    sessions["u1"] = DemoSession("u1")
+    sessions.flush(force=True)
+    sessions.store._conn().execute("UPDATE sessions SET updated_at = ?", (time.time() - 7200,))
+    assert "u1" not in open_sessions(tmp_path, expires_in_seconds=3600)
+    sessions.store.purge_expired("demo", 3600)
+    assert sessions.store.count("demo") == 0
+
+
+def test_namespaces_are_isolated(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    chatgpt = PersistentSessionDict(store, session_namespace(ChatGPTBotStub(), ChatGPTSession, "gpt-4o"))
+    gemini = PersistentSessionDict(store, session_namespace(GeminiBotStub(), ChatGPTSession, "gpt-4o"))
+    assert chatgpt.namespace == "ChatGPTBotStub/ChatGPTSession/gpt-4o"
+    assert chatgpt.namespace != gemini.namespace
+    assert session_namespace(None, ChatGPTSession, "gpt-4o-mini") == "ChatGPTSession/gpt-4o-mini"
+    chatgpt["u1"] = DemoSession("u1")
+    gemini["u1"] = DemoSession("u1")
+    chatgpt.flush(force=True)
+    gemini.flush(force=True)
+    chatgpt.clear()  # 只清空自己的会话
+    assert "u1" not in PersistentSessionDict(store, chatgpt.namespace)
+    assert "u1" in PersistentSessionDict(store, gemini.namespace)
+
+
+class ChatGPTBotStub:
+    pass
+
+
+class GeminiBotStub:
+    pass
+
+
+def test_session_args_not_persisted(tmp_path, set_conf):
+    set_conf(character_desc="old prompt")
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    manager = SessionManager(ChatGPTSession, model="wenxin")
+    manager.sessions = PersistentSessionDict(store, "demo")
+    manager.build_session("default")
+    manager.build_session("role", system_prompt="custom prompt")
+    manager.sessions.flush(force=True)
+
+    set_conf(character_desc="new prompt")
+    manager = SessionManager(ChatGPTSession, model="wenxin-4")
+    manager.sessions = PersistentSessionDict(store, "demo")
+    default = manager.build_session("default")
+    assert default.model == "wenxin-4"
+    assert default.system_prompt == "new prompt"
+    assert manager.build_session("role").system_prompt == "custom prompt"
+
+
+class Unpicklable(DemoSession):
+    def __init__(self, session_id):
+        super().__init__(session_id)
+        self.callback = lambda: None
+
+
+def test_unpicklable_session_kept_dirty(tmp_path):
+    sessions = open_sessions(tmp_path)
+    sessions["bad"] = Unpicklable("bad")
+    sessions["good"] = DemoSession("good")
+    sessions.flush(force=True)
+    assert sessions.store.count("demo") == 1
+    assert sessions.stats()["dirty"] == 1  # 序列化失败的会话下次重试
+    del sessions.resident["bad"].callback
+    sessions.flush(force=True)
+    assert sessions.store.count("demo") == 2
@@ -0,0 +1,81 @@
+import http.server
+import time
+
+import requests
+
+from common.sse import SentenceChunker, iter_sse_events
+
+# 每项为一次写入的内容，写入之间有间隔，模拟事件被拆到多个TCP包中
+SSE_WRITES = [
+    b": keep-alive\n\n",
+    b"event: message\ndata: {\"answer\": \"\xe4\xbd\xa0\xe5",  # "你好"的utf-8编码在两次写入之间被截断
+    b"\xa5\xbd\"}\n\n",
+    b"data: line1\r\ndata: line2\r\n\r\n",
+    b"event: message_end\ndata:no-space\n\n",
+    b"data: tail-without-blank-line",
+]
+
+
+class SSEHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for chunk in SSE_WRITES:
+            self.wfile.write(chunk)
+            self.wfile.flush()
+            time.sleep(0.02)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_iter_sse_events_from_server(http_server):
+    with requests.get(http_server(SSEHandler) + "/stream", stream=True, timeout=5) as response:
+        events = list(iter_sse_events(response))
+    assert events == [
+        ("message", '{"answer": "你好"}'),
+        (None, "line1\nline2"),
+        ("message_end", "no-space"),
+        (None, "tail-without-blank-line"),
+    ]
+
+
+def test_sentence_chunker_waits_for_sentence_end():
+    chunker = SentenceChunker(min_chunk_size=10, flush_interval=60)
+    assert chunker.feed("你好，") == []
+    assert chunker.feed("今天天气很好。明天") == ["你好，今天天气很好。"]
+    assert chunker.feed("也不错") == []
+    assert chunker.flush() == "明天也不错"
+
+
+def test_sentence_chunker_keeps_decimals_and_short_sentences():
+    chunker = SentenceChunker(min_chunk_size=40, flush_interval=60)
+    assert chunker.feed("Pi is 3.14 and ") == []
+    assert chunker.feed("e is 2.71. Next") == []  # 完整句子不足min_chunk_size
+    assert chunker.feed(" sentence is long enough. ") == ["Pi is 3.14 and e is 2.71. Next sentence is long enough."]
+
+
+def test_sentence_chunker_flushes_after_interval():
+    chunker = SentenceChunker(min_chunk_size=100, flush_interval=0.05)
+    assert chunker.feed("短句。") == []
+    time.sleep(0.06)
+    assert chunker.feed("再来") == ["短句。"]
+
+
+def test_sentence_chunker_keeps_markdown_images_and_urls():
+    chunker = SentenceChunker(min_chunk_size=1, flush_interval=60)
+    assert chunker.feed("看图!") == []  # 末尾的!可能是图片的开头
+    assert chunker.feed("[图片](https://img.test/a.png?size=large!") == []
+    assert chunker.feed(") 链接见 https://a.test/s?q=1&v=2;x=!") == []
+    assert chunker.feed(" 请查收。然后") == ["看图![图片](https://img.test/a.png?size=large!) 链接见 https://a.test/s?q=1&v=2;x=! 请查收。"]
+    assert chunker.flush() == "然后"
+
+
+def test_sentence_chunker_poll_flushes_without_new_text():
+    chunker = SentenceChunker(min_chunk_size=100, flush_interval=0.05)
+    assert chunker.feed("短句。未完") == []
+    assert chunker.poll() == []
+    time.sleep(0.06)
+    assert chunker.poll() == ["短句。"]
+    assert chunker.poll() == []
@@ -0,0 +1,43 @@
+import threading
+import time
+
+import pytest
+
+from common.summary_cache import SummaryCache, normalize_url
+
+
+def test_wechat_share_params_are_stripped():
+    a = "https://mp.weixin.qq.com/s?__biz=MzA1&mid=26501&idx=1&sn=abc&amp;chksm=123&amp;scene=21&amp;key=k#rd"
+    b = "HTTPS://MP.weixin.qq.com/s?sn=abc&idx=1&mid=26501&__biz=MzA1&scene=126&uin=9"
+    assert normalize_url(a) == normalize_url(b) == "https://mp.weixin.qq.com/s?__biz=MzA1&idx=1&mid=26501&sn=abc"
+
+
+def test_generic_params_kept_on_other_hosts():
+    url = "https://example.com/article?id=1&lang=en&version=2&key=abc&from=home&utm_source=wx&spm=a.b"
+    assert normalize_url(url) == "https://example.com/article?from=home&id=1&key=abc&lang=en&version=2"
+
+
+def test_single_flight_and_failures_not_cached():
+    cache = SummaryCache(max_concurrency=2)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return "summary"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("ns", "https://example.com/a", compute))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["summary"] * 5
+    assert len(calls) == 1
+    assert cache.get("ns", "https://example.com/a#top") == "summary"
+    assert cache.get("other", "https://example.com/a") is None
+
+    assert cache.get_or_compute("ns", "https://example.com/b", lambda: None) is None
+    with pytest.raises(ValueError):
+        cache.get_or_compute("ns", "https://example.com/b", lambda: (_ for _ in ()).throw(ValueError("boom")))
+    assert cache.get("ns", "https://example.com/b") is None
@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+from channel.chat_channel import check_contain, check_prefix
+from common.trigger_matcher import KeywordMatcher, PrefixMatcher, get_trigger_index
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_matchers_same_as_linear_checks(seed):
+    random.seed(seed)
+    chars = "abc"
+
+    def random_str(max_length):
+        return "".join(random.choice(chars) for _ in range(random.randint(0, max_length)))
+
+    for _ in range(50):
+        # 短字符集下前缀、关键词大量重叠，也包含空字符串和重复项
+        words = [random_str(3) for _ in range(random.randint(0, 6))]
+        prefix, keyword = PrefixMatcher(words), KeywordMatcher(words)
+        for content in [random_str(8) for _ in range(30)]:
+            assert prefix.match(content) == check_prefix(content, words)
+            assert keyword.match(content) == check_contain(content, words)
+
+
+def test_prefix_matcher_returns_first_in_list_order():
+    assert PrefixMatcher(["bot", "b", "@bot"]).match("bot你好") == "bot"
+    assert PrefixMatcher(["b", "bot"]).match("bot你好") == "b"
+    assert PrefixMatcher(None).match("bot") is None
+    assert PrefixMatcher(["x", ""]).match("bot") == ""
+
+
+def test_index_rebuilt_when_config_changes(set_conf):
+    set_conf(group_name_white_list=["群A"], group_name_keyword_white_list=["测试"])
+    index = get_trigger_index()
+    assert get_trigger_index() is index
+    assert index.group_decision("群A")[0]
+    assert index.group_decision("一个测试群")[0]
+    assert not index.group_decision("群B")[0]
+
+    set_conf(group_name_white_list=["群B"])
+    index = get_trigger_index()
+    assert not index.group_decision("群A")[0]
+    assert index.group_decision("群B")[0]
+
+
+def test_at_pattern_strips_longest_name_first():
+    index = get_trigger_index()
+    pattern = index.at_pattern(["bot", "bot助手"])
+    assert pattern.sub("", "@bot助手 @bot 你好") == "你好"
+    assert index.at_pattern(["bot", "bot助手"]) is pattern
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from bridge.reply import Reply, ReplyType
+from common.tmp_dir import TmpDir
+from voice.tts_cache import TtsCache
+
+
+class FakeVoice:
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.calls = 0
+
+    def tts_cache_voice(self):
+        return "fake"
+
+    def textToVoice(self, text):
+        self.calls += 1
+        path = os.path.join(self.out_dir, "reply-{}.mp3".format(self.calls))
+        with open(path, "wb") as f:
+            f.write(text.encode("utf-8") * 100)
+        return Reply(ReplyType.VOICE, path)
+
+
+@pytest.fixture
+def out_dir(tmp_path, monkeypatch):
+    # 命中缓存时文件链接到tmp目录，测试中放到临时目录下
+    path = tmp_path / "out"
+    path.mkdir()
+    monkeypatch.setattr(TmpDir, "path", lambda self: str(path) + os.sep)
+    return str(path)
+
+
+def test_repeated_text_served_from_cache(tmp_path, out_dir):
+    cache = TtsCache(str(tmp_path / "cache"), 1024 * 1024)
+    bot = FakeVoice(out_dir)
+    first = cache.text_to_voice("fake", bot, "感谢您的关注！")
+    os.remove(first.content)  # 渠道发送后删除文件，不影响缓存
+    second = cache.text_to_voice("fake", bot, "感谢您的关注！")
+    assert bot.calls == 1
+    assert second.type == ReplyType.VOICE and second.content != first.content
+    with open(second.content, "rb") as f:
+        assert f.read() == "感谢您的关注！".encode("utf-8") * 100
+    cache.text_to_voice("fake", bot, "另一句话")
+    assert bot.calls == 2
+
+
+def test_artifact_built_once_per_voice(tmp_path, out_dir):
+    cache = TtsCache(str(tmp_path / "cache"), 1024 * 1024)
+    bot = FakeVoice(out_dir)
+    builds = []
+
+    def to_silk(voice_path):
+        def build():
+            builds.append(voice_path)
+            with open(voice_path + ".silk", "wb") as f:
+                f.write(b"silk")
+            return [voice_path + ".silk"], {"duration": 1000}
+
+        return cache.artifact(voice_path, "silk", build)
+
+    paths, meta = to_silk(cache.text_to_voice("fake", bot, "你好").content)
+    cached_paths, cached_meta = to_silk(cache.text_to_voice("fake", bot, "你好").content)
+    assert len(builds) == 1
+    assert cached_meta == meta == {"duration": 1000}
+    assert cached_paths != paths and open(cached_paths[0], "rb").read() == b"silk"
+    # 不是经过缓存合成的语音文件，每次都转码
+    to_silk(bot.textToVoice("未缓存").content)
+    assert len(builds) == 2
+
+
+def test_lru_eviction_and_reload(tmp_path, out_dir):
+    cache_dir = str(tmp_path / "cache")
+    cache = TtsCache(cache_dir, 3000)
+    bot = FakeVoice(out_dir)
+    for text in ["一", "二", "三", "四"]:  # 每条约300字节加json
+        cache.text_to_voice("fake", bot, text * 3)
+    cache.text_to_voice("fake", bot, "一" * 3)  # 访问后移到最近使用
+    for text in ["五", "六", "七", "八", "九", "十"]:
+        cache.text_to_voice("fake", bot, text * 3)
+    assert cache.total_bytes <= 3000 and cache.evictions > 0
+    assert len(os.listdir(cache_dir)) == len(cache.entries)
+
+    reloaded = TtsCache(cache_dir, 3000)
+    assert set(reloaded.entries) == set(cache.entries)
+    assert reloaded.total_bytes == cache.total_bytes
+    calls = bot.calls
+    reloaded.text_to_voice("fake", bot, "十" * 3)
+    assert bot.calls == calls
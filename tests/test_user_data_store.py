@@ -0,0 +1,83 @@
+import pickle
+
+import pytest
+
+import config
+from common.user_data_store import PickleUserDataStore, UserData, create_user_data_store
+
+
+@pytest.fixture(params=["sqlite", "pickle"])
+def store(request, tmp_path):
+    store = create_user_data_store(request.param, str(tmp_path))
+    yield store
+    store.close()
+
+
+def reload(store, user):
+    store.save()
+    return UserData(store, user, store.load(user))
+
+
+def test_every_mutation_is_persisted(store):
+    data = UserData(store, "u1", store.load("u1"))
+    data["a"] = 1
+    data.update({"b": 2}, c=3)
+    data |= {"d": 4}
+    data.setdefault("e", 5)
+    assert reload(store, "u1") == {"a": 1, "b": 2, "c": 3, "d": 4, "e": 5}
+
+    del data["a"]
+    assert data.pop("b") == 2
+    assert data.pop("missing", None) is None
+    key, value = data.popitem()
+    assert key not in reload(store, "u1")
+    assert reload(store, "u1") == dict(data)
+
+    data.clear()
+    assert reload(store, "u1") == {}
+
+
+def test_sqlite_migrates_pickle_once(tmp_path):
+    with open(tmp_path / "user_datas.pkl", "wb") as f:
+        pickle.dump({"u1": {"gpt_model": "gpt-4o"}, "u2": {"openai_api_key": "sk-1"}}, f)
+    store = create_user_data_store("sqlite", str(tmp_path))
+    assert store.load("u1") == {"gpt_model": "gpt-4o"}
+    assert store.count_users() == 2
+    assert not (tmp_path / "user_datas.pkl").exists()
+    store.close()
+
+    store = create_user_data_store("sqlite", str(tmp_path))
+    assert store.load("u2") == {"openai_api_key": "sk-1"}
+    store.close()
+
+
+def test_drag_sensitive_masks_config_with_store():
+    conf = config.Config({"open_ai_api_key": "sk-1234567890abcdef"})
+    conf.user_data_store = PickleUserDataStore()
+    masked = config.drag_sensitive(conf)
+    assert masked["open_ai_api_key"] == "sk-*****def"
+
+
+def test_get_user_data_returns_same_object(store):
+    conf = config.Config()
+    conf.user_data_store = store
+    data = conf.get_user_data("u1")
+    data["plugins"] = {}
+    conf.get_user_data("u1")["plugins"]["godcmd"] = True  # 嵌套修改
+    assert conf.get_user_data("u1") is data
+    assert data["plugins"] == {"godcmd": True}
+
+    conf.user_data_store = PickleUserDataStore()  # 更换存储后不再返回旧存储的数据
+    assert conf.get_user_data("u1") == {}
+
+
+def test_load_failure_logged_as_error(monkeypatch, caplog):
+    def broken(backend, appdata_dir):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(config, "create_user_data_store", broken)
+    conf = config.Config()
+    with caplog.at_level("ERROR", logger=config.logger.name):
+        conf.load_user_datas()
+    assert "disk full" in caplog.text
+    assert isinstance(conf.user_data_store, PickleUserDataStore)
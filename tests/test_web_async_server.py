@@ -0,0 +1,83 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+pytest.importorskip("aiohttp")
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+from channel.web.web_async_server import build_app  # noqa: E402
+from channel.web.web_channel import UserMailbox  # noqa: E402
+
+
+class MailboxChannel:
+    """只提供SSE服务器用到的邮箱接口"""
+
+    def __init__(self):
+        self.mailboxes = {}
+        self.lock = threading.Lock()
+
+    def acquire_mailbox(self, user_id):
+        with self.lock:
+            mailbox = self.mailboxes.setdefault(user_id, UserMailbox())
+            mailbox.connections += 1
+            return mailbox
+
+    def release_mailbox(self, user_id):
+        with self.lock:
+            self.mailboxes[user_id].connections -= 1
+
+    def put(self, user_id, content):
+        with self.lock:
+            mailbox = self.mailboxes.setdefault(user_id, UserMailbox())
+        return mailbox.put({"content": content})
+
+
+async def read_events(resp, count):
+    events = []
+    event_id = None
+    async for line in resp.content:
+        line = line.decode().rstrip("\n")
+        if line.startswith("id: "):
+            event_id = int(line[4:])
+        elif line.startswith("data: "):
+            events.append((event_id, json.loads(line[6:])["content"]))
+            if len(events) >= count:
+                break
+    return events
+
+
+def test_sse_pushes_queued_and_new_messages_and_resumes():
+    channel = MailboxChannel()
+    channel.put("u1", "before connect")
+
+    async def main():
+        async with TestClient(TestServer(build_app(channel))) as client:
+            async with client.get("/sse/u1") as resp:
+                first = await read_events(resp, 1)
+                # 在其他线程中发送，SSE连接应被唤醒
+                threading.Thread(target=lambda: [channel.put("u1", "a"), channel.put("u1", "b")]).start()
+                second = await read_events(resp, 2)
+            channel.put("u1", "while offline")
+            async with client.get("/sse/u1", headers={"Last-Event-ID": "2"}) as resp:
+                resumed = await read_events(resp, 2)
+            return first, second, resumed
+
+    first, second, resumed = asyncio.run(asyncio.wait_for(main(), 10))
+    assert first == [(1, "before connect")]
+    assert second == [(2, "a"), (3, "b")]
+    assert resumed == [(3, "b"), (4, "while offline")]
+
+
+def test_mailbox_keeps_undelivered_messages_for_new_connection():
+    mailbox = UserMailbox(max_size=2)
+    for content in ["1", "2", "3"]:
+        mailbox.put(content)
+    cursor = mailbox.start_cursor()
+    assert [message for _, message in mailbox.get_since(cursor)] == ["2", "3"]  # 缓冲区只保留最近2条
+    mailbox.ack(2)
+    assert mailbox.has_undelivered()
+    assert mailbox.start_cursor() == 2
+    assert mailbox.start_cursor("not-a-number") == 2
+    assert mailbox.wait(3, 0.01) == []
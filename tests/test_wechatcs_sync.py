@@ -0,0 +1,149 @@
+import json
+import random
+import threading
+import time
+
+from channel.wechatcs.wechatcomservice_sync import KfMessageSyncer
+
+
+class StubSyncApi:
+    """模拟sync_msg接口，每个客服账号的cursor为已返回的消息数"""
+
+    def __init__(self):
+        self.messages = {}
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def add_message(self, open_kfid, send_time=None):
+        with self.lock:
+            messages = self.messages.setdefault(open_kfid, [])
+            msg = {"msgid": "{}_{}".format(open_kfid, len(messages)), "open_kfid": open_kfid, "send_time": send_time or int(time.time())}
+            messages.append(msg)
+
+    def fetch_page(self, token, open_kfid, cursor, limit=100):
+        time.sleep(0.005)
+        with self.lock:
+            self.calls += 1
+            messages = self.messages.get(open_kfid, [])
+            start = int(cursor or 0)
+            page = messages[start : start + limit]
+            return {"errcode": 0, "next_cursor": str(start + len(page)), "has_more": int(start + len(page) < len(messages)), "msg_list": page}
+
+
+def wait_idle(syncer, timeout=10):
+    deadline = time.monotonic() + timeout
+    while syncer.running and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not syncer.running
+
+
+def test_burst_of_callbacks_dispatches_every_message_once_in_order(tmp_path):
+    api = StubSyncApi()
+    received = []
+    received_lock = threading.Lock()
+
+    def dispatch(msg):
+        with received_lock:
+            received.append(msg["msgid"])
+
+    cursor_path = str(tmp_path / "cursors.json")
+    syncer = KfMessageSyncer(api.fetch_page, dispatch, cursor_path)
+    kfids = ["kf{}".format(i) for i in range(4)]
+
+    def customer(open_kfid):
+        for _ in range(100):
+            api.add_message(open_kfid)
+            syncer.request_sync("token", open_kfid)
+            time.sleep(random.uniform(0, 0.001))
+
+    threads = [threading.Thread(target=customer, args=(kfid,)) for kfid in kfids for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wait_idle(syncer)
+
+    for kfid in kfids:
+        expected = [msg["msgid"] for msg in api.messages[kfid]]
+        assert [msgid for msgid in received if msgid.startswith(kfid + "_")] == expected
+    assert api.calls < len(received)  # 同步期间到达的回调被合并
+    with open(cursor_path, encoding="utf-8") as f:
+        assert json.load(f) == {kfid: str(len(api.messages[kfid])) for kfid in kfids}
+
+    # 重启后从保存的cursor继续，只同步新消息
+    received.clear()
+    syncer = KfMessageSyncer(api.fetch_page, dispatch, cursor_path)
+    api.add_message("kf0")
+    syncer.request_sync("token", "kf0")
+    wait_idle(syncer)
+    assert received == ["kf0_{}".format(len(api.messages["kf0"]) - 1)]
+
+
+def test_history_messages_are_skipped():
+    api = StubSyncApi()
+    received = []
+    syncer = KfMessageSyncer(api.fetch_page, lambda msg: received.append(msg["msgid"]), max_age=300)
+    api.add_message("kf", send_time=int(time.time()) - 3600)
+    api.add_message("kf")
+    syncer.request_sync("token", "kf")
+    wait_idle(syncer)
+    assert received == ["kf_1"]
+
+
+class FlakyDispatch:
+    """指定的消息前几次分发失败"""
+
+    def __init__(self, failures):
+        self.failures = dict(failures)  # msgid -> 剩余失败次数
+        self.received = []
+
+    def __call__(self, msg):
+        msgid = msg["msgid"]
+        if self.failures.get(msgid, 0) > 0:
+            self.failures[msgid] -= 1
+            raise Exception("queue full")
+        self.received.append(msgid)
+
+
+def test_failed_dispatch_is_retried_before_cursor_advances():
+    api = StubSyncApi()
+    dispatch = FlakyDispatch({"kf_1": 2})
+    syncer = KfMessageSyncer(api.fetch_page, dispatch, dispatch_retries=2, retry_interval=0.01)
+    for _ in range(3):
+        api.add_message("kf")
+    syncer.request_sync("token", "kf")
+    wait_idle(syncer)
+    assert dispatch.received == ["kf_0", "kf_1", "kf_2"]
+    assert syncer.cursors["kf"] == "3"
+
+
+def test_cursor_kept_when_dispatch_keeps_failing():
+    api = StubSyncApi()
+    dispatch = FlakyDispatch({"kf_1": 2})
+    syncer = KfMessageSyncer(api.fetch_page, dispatch, dispatch_retries=0, retry_interval=0.01, max_failed_syncs=5)
+    for _ in range(3):
+        api.add_message("kf")
+    syncer.request_sync("token", "kf")
+    wait_idle(syncer)
+    assert dispatch.received == ["kf_0"]
+    assert "kf" not in syncer.cursors  # 没有推进cursor
+
+    for _ in range(2):  # 之后的回调从同一页重新同步，已分发的消息不重复分发
+        syncer.request_sync("token", "kf")
+        wait_idle(syncer)
+    assert dispatch.received == ["kf_0", "kf_1", "kf_2"]
+    assert syncer.cursors["kf"] == "3"
+
+
+def test_message_given_up_after_max_failed_syncs():
+    api = StubSyncApi()
+    dispatch = FlakyDispatch({"kf_0": 100})
+    syncer = KfMessageSyncer(api.fetch_page, dispatch, dispatch_retries=0, max_failed_syncs=2)
+    api.add_message("kf")
+    api.add_message("kf")
+    for _ in range(2):
+        syncer.request_sync("token", "kf")
+        wait_idle(syncer)
+    assert dispatch.received == ["kf_1"]
+    assert syncer.stats()["dropped"] == 1
+    assert syncer.cursors["kf"] == "2"
@@ -0,0 +1,136 @@
+import pickle
+import queue
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from bridge.bridge import Bridge
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from channel.chat_channel import ChatChannel
+from channel.worker_pool import HashRing, WorkerPool, _handle_in_worker, _relay_to_ingress
+
+
+class EchoBot:
+    def reply(self, query, context=None):
+        return Reply(ReplyType.TEXT, "echo:" + query)
+
+
+class RecordingChannel(ChatChannel):
+    reply_in_ingress = True
+
+    def __init__(self, consume=False):
+        if consume:  # 会话队列在所有通道实例间共享，只让需要调度消息的实例启动consume线程
+            super().__init__()
+        self.sent = []
+
+    def send(self, reply, context):
+        self.sent.append((reply, context))
+
+
+@pytest.fixture
+def echo_bot():
+    bridge = Bridge()
+    old = bridge.bots.get("chat")
+    bridge.bots["chat"] = EchoBot()
+    yield
+    bridge.bots["chat"] = old
+
+
+def make_context(session_id, content):
+    return Context(ContextType.TEXT, content, session_id=session_id, receiver=session_id, isgroup=False)
+
+
+def test_reply_relayed_through_generate_reply(echo_bot):
+    worker_channel = RecordingChannel()
+    out_queue = queue.Queue()
+    _relay_to_ingress(worker_channel, out_queue)
+
+    main_channel = RecordingChannel()
+    pool = WorkerPool(main_channel, "web", 2)
+    context = make_context("relay_user", "hello")
+    future = Future()
+    pool.pending[1] = (0, future, context)
+
+    worker_context = pickle.loads(pickle.dumps(context))
+    _handle_in_worker(worker_channel, 1, worker_context, out_queue)
+    for _ in range(2):
+        pool._handle_relay(pickle.loads(out_queue.get(timeout=5)))
+
+    assert worker_context["channel"] is worker_channel  # _generate_reply放入了无法序列化的channel
+    assert future.result(timeout=0) is None
+    assert [(reply.content, ctx) for reply, ctx in main_channel.sent] == [("echo:hello", context)]
+    assert not pool.pending
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_backpressure_applies_before_dispatch(set_conf, monkeypatch):
+    set_conf(concurrency_in_session=1, session_queue_max_size=1, session_queue_overflow_policy="drop_newest")
+    channel = RecordingChannel(consume=True)
+    pool = WorkerPool(channel, "web", 2)
+    pool.started = True
+    pool.in_queues = [queue.Queue(), queue.Queue()]
+    # 其他测试启动的consume线程也会调度该会话，因此在类上替换，测试结束后恢复
+    monkeypatch.setattr(ChatChannel, "_submit_handle", lambda self, context: pool.dispatch(context))
+    session_id = "backpressure_user"
+    in_queue = pool.in_queues[pool.ring.get_node(session_id)]
+    dropped_before = ChatChannel.overflow_counter["drop_newest"]
+
+    channel.produce(make_context(session_id, "1"))
+    ticket, context = pickle.loads(in_queue.get(timeout=5))
+    assert context.content == "1"
+    for content in ["2", "3", "4"]:
+        channel.produce(make_context(session_id, content))
+
+    assert ChatChannel.overflow_counter["drop_newest"] - dropped_before == 2
+    assert in_queue.empty()  # 会话并发已满，第2条在主进程中排队
+    pool._handle_relay(("done", ticket, None))
+    _, context = pickle.loads(in_queue.get(timeout=5))
+    assert context.content == "2"
+    assert wait_for(lambda: len(pool.pending) == 1)
+
+
+def test_worker_exit_fails_pending_contexts():
+    pool = WorkerPool(RecordingChannel(), "web", 2)
+    future = Future()
+    pool.pending[7] = (1, future, make_context("exit_user", "hi"))
+
+    class DeadProcess:
+        exitcode = 1
+
+        def is_alive(self):
+            return False
+
+    pool.processes = [None, DeadProcess()]
+    pool._start_worker = lambda index: None
+    pool._check_workers()
+    assert isinstance(future.exception(timeout=0), Exception)
+    assert not pool.pending
+
+
+def test_hash_ring_is_stable_and_moves_few_sessions():
+    sessions = ["session_{}".format(i) for i in range(10000)]
+    ring = HashRing(range(4))
+    before = [ring.get_node(s) for s in sessions]
+    other = HashRing(range(4))
+    assert before == [other.get_node(s) for s in sessions]  # 不依赖进程内随机化的hash()
+    assert min(before.count(i) for i in range(4)) > len(sessions) / 4 * 0.7
+
+    ring.add_node(4)
+    after = [ring.get_node(s) for s in sessions]
+    moved = [(b, a) for b, a in zip(before, after) if b != a]
+    assert all(a == 4 for _, a in moved)  # 只有迁移到新节点的session改变归属
+    assert len(moved) < len(sessions) * 0.3
+
+    ring.remove_node(4)
+    assert [ring.get_node(s) for s in sessions] == before
+    assert HashRing([]).get_node("x") is None
@@ -1,12 +1,18 @@
+import io
 import os
 import shutil
+import subprocess
+import tempfile
 import wave
 
+from common.handler_pool import HandlerPool
 from common.log import logger
+from common.metrics import register_stats
 
 try:
     import pysilk
 except ImportError:
+    pysilk = None
     logger.debug("import pysilk failed, wechaty voice message will not be supported.")
 
 try:
@@ -17,10 +23,20 @@ except ImportError:
 try:
     import pilk
 except ImportError:
+    pilk = None
     logger.warning("import pilk failed, silk voice conversion will not be supported. Try: pip install pilk")
 
 sil_supports = [8000, 12000, 16000, 24000, 32000, 44100, 48000]  # slk转wav时，支持的采样率
 
+# 内存转码：音频解码为单声道s16le PCM后在内存中传给编码器，不写中间文件
+# - 非silk格式由一个ffmpeg子进程通过管道解码/编码，不再经过pydub的临时文件，也不需要ffprobe
+# - silk使用pysilk在内存中编解码，只安装了pilk时中间文件放在内存文件系统(/dev/shm)中
+# - 编码占用CPU，在大小为CPU核数的线程池中执行，避免大量并发语音回复时同时启动过多ffmpeg进程
+FFMPEG = "ffmpeg"
+SILK_EXTENSIONS = (".sil", ".silk", ".slk")
+_transcode_pool = HandlerPool("audio_convert", os.cpu_count() or 1)
+register_stats("audio_convert", _transcode_pool.stats)
+
 
 def find_closest_sil_supports(sample_rate):
     """
@@ -49,10 +65,124 @@ def get_pcm_from_wav(wav_path):
     return wav.readframes(wav.getnframes())
 
 
+def _is_silk(data: bytes) -> bool:
+    # 腾讯系的silk文件在标准头"#!SILK"前多一个字节
+    return data.startswith(b"#!SILK") or data[1:7] == b"#!SILK"
+
+
+def _run_ffmpeg(args, data=None) -> bytes:
+    proc = subprocess.run([FFMPEG, "-loglevel", "error", *args], input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError("ffmpeg failed: {}".format(proc.stderr.decode("utf-8", "ignore").strip()))
+    return proc.stdout
+
+
+def _shm_dir():
+    return "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def _silk_decode(silk_data: bytes, rate: int) -> bytes:
+    if pysilk is not None and hasattr(pysilk, "decode") and not hasattr(pysilk, "decode_file"):
+        output = io.BytesIO()
+        pysilk.decode(io.BytesIO(silk_data), output, rate)
+        return output.getvalue()
+    # pilk只支持文件路径
+    with tempfile.TemporaryDirectory(dir=_shm_dir()) as tmp_dir:
+        silk_path, pcm_path = os.path.join(tmp_dir, "in.silk"), os.path.join(tmp_dir, "out.pcm")
+        with open(silk_path, "wb") as f:
+            f.write(silk_data)
+        pilk.decode(silk_path, pcm_path, pcm_rate=rate)
+        with open(pcm_path, "rb") as f:
+            return f.read()
+
+
+def _silk_encode(pcm: bytes, rate: int) -> bytes:
+    if pysilk is not None and hasattr(pysilk, "encode") and not hasattr(pysilk, "decode_file"):
+        output = io.BytesIO()
+        pysilk.encode(io.BytesIO(pcm), output, rate, rate, tencent=True)
+        return output.getvalue()
+    with tempfile.TemporaryDirectory(dir=_shm_dir()) as tmp_dir:
+        pcm_path, silk_path = os.path.join(tmp_dir, "in.pcm"), os.path.join(tmp_dir, "out.silk")
+        with open(pcm_path, "wb") as f:
+            f.write(pcm)
+        pilk.encode(pcm_path, silk_path, pcm_rate=rate, tencent=True)
+        with open(silk_path, "rb") as f:
+            return f.read()
+
+
+def decode_to_pcm(source, rate: int = 24000) -> bytes:
+    """
+    把音频解码为单声道、16位、指定采样率的PCM
+    :param source: 文件路径或音频数据
+    """
+    data = None
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    elif source.endswith(SILK_EXTENSIONS):
+        with open(source, "rb") as f:
+            data = f.read()
+    if data is not None and _is_silk(data):
+        return _silk_decode(data, rate)
+    if data is not None and data.startswith(b"RIFF"):
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            if wav.getnchannels() == 1 and wav.getsampwidth() == 2 and wav.getframerate() == rate:
+                return wav.readframes(wav.getnframes())
+    if data is None:
+        return _run_ffmpeg(["-i", source, "-f", "s16le", "-ac", "1", "-ar", str(rate), "pipe:1"])
+    return _run_ffmpeg(["-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(rate), "pipe:1"], data)
+
+
+def encode_pcm(pcm: bytes, rate: int, format: str) -> bytes:
+    """
+    把单声道16位PCM编码为指定格式
+    :param format: silk、wav、pcm，或ffmpeg支持的格式如mp3、amr
+    """
+    if format in ["silk", "sil", "slk"]:
+        return _silk_encode(pcm, rate)
+    if format == "pcm":
+        return pcm
+    if format == "wav":
+        output = io.BytesIO()
+        with wave.open(output, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(rate)
+            wav.writeframes(pcm)
+        return output.getvalue()
+    args = ["-f", "s16le", "-ac", "1", "-ar", str(rate), "-i", "pipe:0"]
+    if format == "amr":
+        args += ["-ar", "8000"]  # amr只支持8000采样率
+    return _run_ffmpeg(args + ["-f", format, "pipe:1"], pcm)
+
+
+def pcm_duration(pcm: bytes, rate: int) -> int:
+    """PCM的时长(毫秒)"""
+    return len(pcm) // 2 * 1000 // rate
+
+
+def _transcode(source, format, rate):
+    pcm = decode_to_pcm(source, rate)
+    return encode_pcm(pcm, rate, format), pcm_duration(pcm, rate)
+
+
+def transcode(source, format: str, rate: int = 24000):
+    """
+    在转码线程池中把音频转为指定格式，中间数据不落盘
+    :param source: 文件路径或音频数据
+    :return: (音频数据, 时长毫秒)
+    """
+    return _transcode_pool.submit(_transcode, source, format, rate).result()
+
+
+def _write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
 def any_to_mp3(any_path, mp3_path):
     """
     把任意格式转成mp3文件
-    
+
     Args:
         any_path: 输入文件路径
         mp3_path: 输出的mp3文件路径
@@ -62,29 +192,10 @@ def any_to_mp3(any_path, mp3_path):
         if any_path.endswith(".mp3"):
             shutil.copy2(any_path, mp3_path)
             return
-        
-        # 如果是silk格式，使用pilk转换
-        if any_path.endswith((".sil", ".silk", ".slk")):
-            # 先转成PCM
-            pcm_path = any_path + '.pcm'
-            pilk.decode(any_path, pcm_path)
-            
-            # 再用pydub把PCM转成MP3
-            # TODO: 下面的参数可能需要调整
-            audio = AudioSegment.from_raw(pcm_path, format="raw", 
-                                        frame_rate=24000,
-                                        channels=1,
-                                        sample_width=2)  # 16-bit PCM = 2 bytes
-            audio.export(mp3_path, format="mp3")
-            
-            # 清理临时PCM文件
-            import os
-            os.remove(pcm_path)
-            return
-        
-        # 其他格式使用pydub转换
-        audio = AudioSegment.from_file(any_path)
-        audio.export(mp3_path, format="mp3")
+
+        # silk格式24000采样率解码，其他格式由ffmpeg直接读取文件
+        data, _ = transcode(any_path, "mp3")
+        _write_file(mp3_path, data)
 
     except Exception as e:
         logger.error(f"转换文件到mp3失败: {str(e)}")
@@ -100,10 +211,8 @@ def any_to_wav(any_path, wav_path):
         return
     if any_path.endswith(".sil") or any_path.endswith(".silk") or any_path.endswith(".slk"):
         return sil_to_wav(any_path, wav_path)
-    audio = AudioSegment.from_file(any_path)
-    audio.set_frame_rate(8000)    # 百度语音转写支持8000采样率, pcm_s16le, 单通道语音识别
-    audio.set_channels(1)
-    audio.export(wav_path, format="wav", codec='pcm_s16le')
+    data, _ = transcode(any_path, "wav", 16000)  # 单声道pcm_s16le，语音识别接口普遍支持16000采样率
+    _write_file(wav_path, data)
 
 
 def any_to_sil(any_path, sil_path):
@@ -113,16 +222,9 @@ def any_to_sil(any_path, sil_path):
     if any_path.endswith(".sil") or any_path.endswith(".silk") or any_path.endswith(".slk"):
         shutil.copy2(any_path, sil_path)
         return 10000
-    audio = AudioSegment.from_file(any_path)
-    rate = find_closest_sil_supports(audio.frame_rate)
-    # Convert to PCM_s16
-    pcm_s16 = audio.set_sample_width(2)
-    pcm_s16 = pcm_s16.set_frame_rate(rate)
-    wav_data = pcm_s16.raw_data
-    silk_data = pysilk.encode(wav_data, data_rate=rate, sample_rate=rate)
-    with open(sil_path, "wb") as f:
-        f.write(silk_data)
-    return audio.duration_seconds * 1000
+    data, duration = transcode(any_path, "silk")
+    _write_file(sil_path, data)
+    return duration
 
 def mp3_to_silk(mp3_path: str, silk_path: str) -> int:
     """Convert MP3 file to SILK format
@@ -132,26 +234,9 @@ def mp3_to_silk(mp3_path: str, silk_path: str) -> int:
     Returns:
         Duration of the SILK file in milliseconds
     """
-    # First load the MP3 file
-    audio = AudioSegment.from_file(mp3_path)
-    
-    # Convert to mono and set sample rate to 24000Hz
-    # TODO: 下面的参数可能需要调整
-    audio = audio.set_channels(1)
-    audio = audio.set_frame_rate(24000)
-    
-    # Export to PCM
-    pcm_path = os.path.splitext(mp3_path)[0] + '.pcm'
-    audio.export(pcm_path, format='s16le')
-    
-    # Convert PCM to SILK
-    pilk.encode(pcm_path, silk_path, pcm_rate=24000, tencent=True)
-    
-    # Clean up temporary PCM file
-    os.remove(pcm_path)
-    
-    # Get duration of the SILK file
-    duration = pilk.get_duration(silk_path)
+    # 单声道、24000Hz的PCM在内存中传给silk编码器，只写一次输出文件
+    data, duration = transcode(mp3_path, "silk", 24000)
+    _write_file(silk_path, data)
     return duration
 
 def any_to_amr(any_path, amr_path):
@@ -168,34 +253,30 @@ def any_to_amr(any_path, amr_path):
     audio.export(amr_path, format="amr")
     return audio.duration_seconds * 1000
 
-# TODO: 删除pysilk，改用pilk
 def sil_to_wav(silk_path, wav_path, rate: int = 24000):
     """
     silk 文件转 wav
     """
-    wav_data = pysilk.decode_file(silk_path, to_wav=True, sample_rate=rate)
-    with open(wav_path, "wb") as f:
-        f.write(wav_data)
+    data, _ = transcode(silk_path, "wav", rate)
+    _write_file(wav_path, data)
 
 
-def split_audio(file_path, max_segment_length_ms=60000):
+def split_audio(file_path, max_segment_length_ms=60000, rate: int = 16000):
     """
     分割音频文件
+    只解码一次，各段从内存中的PCM编码，每段只写一次输出文件
     """
-    audio = AudioSegment.from_file(file_path)
-    audio_length_ms = len(audio)
+    pcm = _transcode_pool.submit(decode_to_pcm, file_path, rate).result()
+    audio_length_ms = pcm_duration(pcm, rate)
     if audio_length_ms <= max_segment_length_ms:
         return audio_length_ms, [file_path]
-    segments = []
-    for start_ms in range(0, audio_length_ms, max_segment_length_ms):
-        end_ms = min(audio_length_ms, start_ms + max_segment_length_ms)
-        segment = audio[start_ms:end_ms]
-        segments.append(segment)
     file_prefix = file_path[: file_path.rindex(".")]
     format = file_path[file_path.rindex(".") + 1 :]
+    segment_bytes = max_segment_length_ms * rate // 1000 * 2
     files = []
-    for i, segment in enumerate(segments):
+    for i, start in enumerate(range(0, len(pcm), segment_bytes)):
         path = f"{file_prefix}_{i+1}" + f".{format}"
-        segment.export(path, format=format)
+        data = _transcode_pool.submit(encode_pcm, pcm[start : start + segment_bytes], rate, format).result()
+        _write_file(path, data)
         files.append(path)
     return audio_length_ms, files
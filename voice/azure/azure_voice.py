@@ -56,6 +56,10 @@ class AzureVoice(Voice):
         except Exception as e:
             logger.warn("AzureVoice init failed: %s, ignore " % e)
 
+    def tts_cache_voice(self):
+        # 开启auto_detect时按语言选择音色，整个配置都会影响合成结果
+        return json.dumps(getattr(self, "config", {}), sort_keys=True)
+
     def voiceToText(self, voice_file):
         audio_config = speechsdk.AudioConfig(filename=voice_file)
         speech_recognizer = speechsdk.SpeechRecognizer(speech_config=self.speech_config, audio_config=audio_config)
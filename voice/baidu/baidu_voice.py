@@ -58,6 +58,9 @@ class BaiduVoice(Voice):
         except Exception as e:
             logger.warn("BaiduVoice init failed: %s, ignore " % e)
 
+    def tts_cache_voice(self):
+        return "{}:{}:{}:{}:{}".format(getattr(self, "lang", ""), getattr(self, "per", ""), getattr(self, "spd", ""), getattr(self, "pit", ""), getattr(self, "vol", ""))
+
     def voiceToText(self, voice_file):
         # 识别本地文件
         logger.debug("[Baidu] voice file name={}".format(voice_file))
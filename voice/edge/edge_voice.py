@@ -1,9 +1,9 @@
 import time
 
 import edge_tts
-import asyncio
 
 from bridge.reply import Reply, ReplyType
+from common.async_runtime import get_async_runtime
 from common.log import logger
 from common.tmp_dir import TmpDir
 from voice.voice import Voice
@@ -34,17 +34,21 @@ class EdgeVoice(Voice):
         '''
         self.voice = "zh-CN-YunjianNeural"
 
+    def tts_cache_voice(self):
+        return self.voice
+
     def voiceToText(self, voice_file):
         pass
 
     async def gen_voice(self, text, fileName):
-        communicate = edge_tts.Communicate(text, self.voice)
+        # 共享连接器保留DNS缓存和连接池，不随每次合成新建和关闭
+        communicate = edge_tts.Communicate(text, self.voice, connector=get_async_runtime().connector())
         await communicate.save(fileName)
 
     def textToVoice(self, text):
         fileName = TmpDir().path() + "reply-" + str(int(time.time())) + "-" + str(hash(text) & 0x7FFFFFFF) + ".mp3"
 
-        asyncio.run(self.gen_voice(text, fileName))
+        get_async_runtime().run(self.gen_voice(text, fileName))
 
         logger.info("[EdgeTTS] textToVoice text={} voice file name={}".format(text, fileName))
         return Reply(ReplyType.VOICE, fileName)
@@ -0,0 +1,261 @@
+"""
+语音合成结果缓存
+- 按(合成引擎, 音色, 文本)的哈希寻址，关注回复、错误提示、关键词回复等重复文本不再重复调用合成接口
+- 除合成的原始文件外，还缓存各渠道最终发送的文件：silk及其时长、按60秒分段的amr/mp3，命中时跳过转码
+- 缓存放在appdata/tts_cache下，每个key一个目录，总大小超过上限时按LRU删除最久未使用的key，重启后按目录修改时间恢复顺序
+- 交给渠道的文件是缓存文件的硬链接(跨文件系统时复制)，渠道发送后删除文件不影响缓存
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+from bridge.reply import Reply, ReplyType
+from common.expired_dict import ExpiredDict
+from common.log import logger
+from common.metrics import register_stats
+from common.tmp_dir import TmpDir, get_appdata_dir
+from config import conf
+
+VOICE = "voice"  # 合成引擎返回的原始文件
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class TtsCache:
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> {"size": 字节数, "artifacts": {名称: {"files": [文件名], "meta": {}}}}，按使用顺序排列
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.voice_keys = ExpiredDict(3600, max_size=10000)  # 交给渠道的语音文件路径 -> key，用于查找对应的转码结果
+        self.hits = {}  # 产物名称 -> 命中次数
+        self.misses = {}
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, key)
+            if not os.path.isdir(entry_dir):
+                continue
+            artifacts = {}
+            size = 0
+            for name in os.listdir(entry_dir):
+                path = os.path.join(entry_dir, name)
+                if name.endswith(".part"):
+                    os.remove(path)  # 写了一半的文件
+                    continue
+                size += os.path.getsize(path)
+                if name.endswith(".json"):
+                    try:
+                        with open(path, "r", encoding="utf-8") as f:
+                            artifacts[name[: -len(".json")]] = json.load(f)
+                    except Exception as e:
+                        logger.warning("[tts_cache] load {} failed: {}".format(path, e))
+            entries.append((os.path.getmtime(entry_dir), key, {"size": size, "artifacts": artifacts}))
+        for _, key, entry in sorted(entries):
+            self.entries[key] = entry
+            self.total_bytes += entry["size"]
+        self._evict()
+        logger.debug("[tts_cache] loaded {} entries, {} bytes".format(len(self.entries), self.total_bytes))
+
+    @staticmethod
+    def make_key(backend, voice, text):
+        return hashlib.sha256("{}\n{}\n{}".format(backend, voice, text).encode("utf-8")).hexdigest()
+
+    def get(self, key, artifact):
+        """
+        :return: (缓存中的文件路径列表, meta)，未命中返回None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            record = entry["artifacts"].get(artifact) if entry else None
+            if record is None:
+                self.misses[artifact] = self.misses.get(artifact, 0) + 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits[artifact] = self.hits.get(artifact, 0) + 1
+        entry_dir = os.path.join(self.cache_dir, key)
+        try:
+            os.utime(entry_dir)
+        except OSError:
+            pass
+        return [os.path.join(entry_dir, name) for name in record["files"]], record["meta"]
+
+    def put(self, key, artifact, paths, meta=None):
+        """把文件存入缓存，原文件保持不变"""
+        entry_dir = os.path.join(self.cache_dir, key)
+        os.makedirs(entry_dir, exist_ok=True)
+        record = {"files": [], "meta": meta or {}}
+        size = 0
+        for i, path in enumerate(paths):
+            name = "{}.{}{}".format(artifact, i, os.path.splitext(path)[1])
+            target = os.path.join(entry_dir, name)
+            _link_or_copy(path, target + ".part")
+            os.replace(target + ".part", target)
+            record["files"].append(name)
+            size += os.path.getsize(target)
+        # json最后写入，存在json说明产物完整
+        json_path = os.path.join(entry_dir, artifact + ".json")
+        with open(json_path + ".part", "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(json_path + ".part", json_path)
+        size += os.path.getsize(json_path)
+        with self.lock:
+            entry = self.entries.setdefault(key, {"size": 0, "artifacts": {}})
+            entry["artifacts"][artifact] = record
+            entry["size"] += size
+            self.total_bytes += size
+            self.entries.move_to_end(key)
+        self._evict(keep=key)
+
+    def _evict(self, keep=None):
+        removed = []
+        with self.lock:
+            while self.total_bytes > self.max_bytes and self.entries:
+                key, entry = next(iter(self.entries.items()))
+                if key == keep:
+                    break
+                del self.entries[key]
+                self.total_bytes -= entry["size"]
+                self.evictions += 1
+                removed.append(key)
+        for key in removed:
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+
+    def materialize(self, paths, prefix):
+        """把缓存文件链接到tmp目录下的新文件，渠道可以随意删除"""
+        tmp_dir = TmpDir().path()
+        name = "{}-{}".format(prefix, uuid.uuid4().hex[:8])
+        result = []
+        for i, path in enumerate(paths):
+            target = "{}{}-{}{}".format(tmp_dir, name, i, os.path.splitext(path)[1])
+            _link_or_copy(path, target)
+            result.append(target)
+        return result
+
+    def text_to_voice(self, backend, voice_bot, text) -> Reply:
+        key = self.make_key(backend, voice_bot.tts_cache_voice(), text)
+        cached = self.get(key, VOICE)
+        if cached:
+            path = self.materialize(cached[0], "reply-tts")[0]
+            logger.debug("[tts_cache] hit, text={}, file={}".format(text, path))
+            self.voice_keys[path] = key
+            return Reply(ReplyType.VOICE, path)
+        reply = voice_bot.textToVoice(text)
+        if reply and reply.type == ReplyType.VOICE and isinstance(reply.content, str) and os.path.isfile(reply.content):
+            try:
+                if os.path.getsize(reply.content) > 0:
+                    self.put(key, VOICE, [reply.content])
+                    self.voice_keys[reply.content] = key
+            except Exception as e:
+                logger.warning("[tts_cache] save {} failed: {}".format(reply.content, e))
+        return reply
+
+    def artifact(self, voice_path, artifact, build):
+        """
+        查找语音文件对应的转码结果，未缓存时调用build()生成并存入缓存
+        :param build: 无参函数，返回(文件路径列表, meta)
+        :return: (文件路径列表, meta)，命中时文件是tmp目录下的新文件
+        """
+        key = self.voice_keys.get(voice_path)
+        if key is None:
+            return build()
+        cached = self.get(key, artifact)
+        if cached:
+            return self.materialize(cached[0], "reply-" + artifact), cached[1]
+        paths, meta = build()
+        try:
+            self.put(key, artifact, paths, meta)
+        except Exception as e:
+            logger.warning("[tts_cache] save {} of {} failed: {}".format(artifact, voice_path, e))
+        return paths, meta
+
+    def stats(self) -> dict:
+        with self.lock:
+            hits = sum(self.hits.values())
+            total = hits + sum(self.misses.values())
+            stats = {
+                "entries": len(self.entries),
+                "size": "{:.1f}/{:.0f}MB".format(self.total_bytes / 1024 / 1024, self.max_bytes / 1024 / 1024),
+                "evictions": self.evictions,
+                "hit_rate": "{:.1%}".format(hits / total) if total else "-",
+            }
+            for artifact in sorted(set(self.hits) | set(self.misses)):
+                stats[artifact] = "hits={}, misses={}".format(self.hits.get(artifact, 0), self.misses.get(artifact, 0))
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tts_cache():
+    """tts_cache_max_mb为0时不缓存，返回None"""
+    global _cache
+    if _cache is None:
+        max_mb = conf().get("tts_cache_max_mb", 200)
+        if not max_mb:
+            return None
+        with _cache_lock:
+            if _cache is None:
+                _cache = TtsCache(os.path.join(get_appdata_dir(), "tts_cache"), max_mb * 1024 * 1024)
+                register_stats("tts_cache", _cache.stats)
+    return _cache
+
+
+def cached_voice_artifact(voice_path, artifact, build):
+    """渠道转码入口，voice_path不是缓存的合成结果或未开启缓存时直接调用build()"""
+    cache = get_tts_cache()
+    if cache is None:
+        return build()
+    return cache.artifact(voice_path, artifact, build)
+
+
+def cached_to_silk(voice_path, silk_path):
+    """
+    转为silk，返回(silk文件路径, 时长毫秒)，命中缓存时silk文件路径与silk_path不同
+    """
+    from voice.audio_convert import mp3_to_silk
+
+    paths, meta = cached_voice_artifact(voice_path, "silk", lambda: ([silk_path], {"duration": mp3_to_silk(voice_path, silk_path)}))
+    return paths[0], meta["duration"]
+
+
+def cached_to_amr_segments(voice_path, amr_path, max_segment_length_ms=60000):
+    """
+    转为amr并按时长分段，返回(时长毫秒, 分段文件列表)
+    """
+    from voice.audio_convert import any_to_amr, split_audio
+
+    def build():
+        any_to_amr(voice_path, amr_path)
+        duration, files = split_audio(amr_path, max_segment_length_ms)
+        return files, {"duration": duration}
+
+    files, meta = cached_voice_artifact(voice_path, "amr_{}".format(max_segment_length_ms), build)
+    return meta["duration"], files
+
+
+def cached_split_audio(voice_path, max_segment_length_ms=60000):
+    """split_audio的缓存版本，返回(时长毫秒, 分段文件列表)"""
+    from voice.audio_convert import split_audio
+
+    def build():
+        duration, files = split_audio(voice_path, max_segment_length_ms)
+        return files, {"duration": duration}
+
+    files, meta = cached_voice_artifact(voice_path, "split_{}".format(max_segment_length_ms), build)
+    return meta["duration"], files
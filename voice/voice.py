@@ -1,6 +1,7 @@
 """
 Voice service abstract class
 """
+from config import conf
 
 
 class Voice(object):
@@ -15,3 +16,9 @@ class Voice(object):
         Send text to voice service and get voice
         """
         raise NotImplementedError
+
+    def tts_cache_voice(self):
+        """
+        合成结果缓存key中的音色部分，影响合成结果的配置变化后不会命中旧的缓存
+        """
+        return "{}:{}:{}".format(conf().get("text_to_voice_model"), conf().get("tts_voice_id"), conf().get("xi_voice_id"))